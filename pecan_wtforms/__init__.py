@@ -5,8 +5,12 @@ from wtforms.widgets import *
 from wtforms import ValidationError  # noqa
 
 from .form import SecureForm, Form
-from .decorator import with_form, redirect_to_handler
+from .decorator import with_form, with_forms, redirect_to_handler
+from .stream import with_form_stream
 from .filters import default
+from .validation import deferred
+from .cache import memoize
 
 __all__ = ['SecureForm', 'Form', 'ValidationError', 'fields', 'validators',
-'widgets', 'with_form', 'redirect_to_handler', 'default']
+'widgets', 'with_form', 'with_forms', 'redirect_to_handler',
+'with_form_stream', 'default', 'deferred', 'memoize']
@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import OrderedDict
+
+from wtforms.validators import StopValidation
+
+from .validation import deferred
+
+__all__ = ['LRUCache', 'BoundedCache', 'memoize']
+
+_missing = object()
+
+#: The clock expiry times are measured with
+clock = time.time
+
+
+class CacheStats(object):
+    """
+    Hit and miss counting for caches which keep their entries in ``_data``.
+    """
+
+    hits = misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Return a dictionary of ``size``, ``hits``, ``misses`` and
+        ``hit_rate``.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
+
+
+class LRUCache(CacheStats):
+    """
+    A thread-safe, size-bounded mapping which evicts the least recently used
+    entry when full, and (optionally) expires entries ``ttl`` seconds after
+    they're stored.  Hits and misses are counted.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _missing)
+            if entry is not _missing:
+                value, expires = entry
+                if expires is None or expires > clock():
+                    # Re-insert, marking the entry most recently used
+                    self._data[key] = entry
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=_missing):
+        if ttl is _missing:
+            ttl = self.ttl
+        expires = None if ttl is None else clock() + ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+class BoundedCache(CacheStats):
+    """
+    A size-bounded mapping for values that are cheap to recompute, where an
+    ``LRUCache``'s locking and bookkeeping would cost more than a miss.
+
+    There's no lock (a lookup is a single dictionary lookup), and rather
+    than tracking which entry to evict, the cache is emptied once it's full.
+    Hits and misses are counted, but not atomically, so the counts are
+    approximate under concurrency.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = {}
+
+    def get(self, key, default=None):
+        value = self._data.get(key, _missing)
+        if value is _missing:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        data = self._data
+        if len(data) >= self.maxsize and key not in data:
+            data.clear()
+        data[key] = value
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = 0
+
+
+class memoize(object):
+    """
+    Wraps an expensive validator so that its result for a given (normalized)
+    field value is remembered, e.g.::
+
+        class SignupForm(pecan_wtforms.SecureForm):
+            username = TextField('Username', [
+                Required(),
+                memoize(username_available, ttl=30,
+                        normalize=lambda v: v.strip().lower())
+            ])
+
+    Both passing results and failures (``ValidationError`` and
+    ``StopValidation``, along with their messages) are cached, so
+    re-validating unchanged values skips the expensive work.  Only memoize
+    validators whose outcome depends on nothing but the field's value.
+
+    :param validator: the validator to wrap.
+    :param maxsize: the maximum number of values remembered; the least
+                    recently used are evicted first.
+    :param ttl: the number of seconds a result is remembered for, or
+                ``None`` to keep results until they're evicted.
+    :param negative_ttl: the number of seconds failures are remembered for.
+                         Defaults to ``ttl``; ``0`` disables caching failures.
+    :param normalize: a callable applied to ``field.data`` to build the cache
+                      key.  Values which aren't hashable are never cached.
+
+    To run a memoized validator on the validation thread pool, wrap it with
+    ``deferred`` (not the other way around): ``deferred(memoize(check))``.
+    """
+
+    def __init__(self, validator, maxsize=1024, ttl=300, negative_ttl=_missing,
+                 normalize=None):
+        if isinstance(validator, deferred):
+            raise TypeError(
+                'Deferred validators can not be memoized; use '
+                'deferred(memoize(validator)) instead.'
+            )
+        self.validator = validator
+        self.field_flags = getattr(validator, 'field_flags', ())
+        self.negative_ttl = ttl if negative_ttl is _missing else negative_ttl
+        self.normalize = normalize
+        self.cache = LRUCache(maxsize, ttl)
+
+    def __call__(self, form, field):
+        key = field.data
+        if self.normalize is not None:
+            key = self.normalize(key)
+        try:
+            hash(key)
+        except TypeError:
+            return self.validator(form, field)
+
+        failure = self.cache.get(key, _missing)
+        if failure is None:
+            return
+        if failure is not _missing:
+            exc_class, args = failure
+            raise exc_class(*args)
+
+        try:
+            self.validator(form, field)
+        except (ValueError, StopValidation) as e:
+            if self.negative_ttl != 0:
+                self.cache.set(key, (e.__class__, e.args), self.negative_ttl)
+            raise
+        self.cache.set(key, None)
+
+    @property
+    def hits(self):
+        return self.cache.hits
+
+    @property
+    def misses(self):
+        return self.cache.misses
@@ -0,0 +1,234 @@
+"""
+Compact bound fields, for forms with hundreds (or thousands) of fields.
+
+A bound WTForms field keeps its configuration and state in an instance
+``__dict__``, along with its own ``Label``, ``Flags`` and list of
+validators.  Setting ``COMPACT_FIELDS`` on a form class binds its fields as
+``__slots__``-based subclasses instead::
+
+    class SurveyForm(pecan_wtforms.Form):
+        COMPACT_FIELDS = True
+        ...
+
+Compact fields behave like the fields they're derived from, except that:
+
+* their labels (:class:`CompactLabel`) and flags (:class:`CompactFlags`) are
+  immutable, and shared between every form bound from the same class
+  (assign ``field.label`` a new ``Label`` to change it for one form),
+* their ``validators`` are a tuple, and
+* ``errors`` and ``process_errors`` are an empty tuple until there are
+  errors, or the field is validated.
+
+``FieldList`` entries are bound as compact fields, too.  Attributes which
+aren't known to WTForms are still stored in the instance ``__dict__``.
+"""
+from wtforms.fields.core import (Field, UnboundField, Label, Flags,
+                                 SelectFieldBase, SelectField, DecimalField,
+                                 BooleanField, DateTimeField, FieldList)
+
+__all__ = ['compact', 'compact_unbound', 'CompactLabel', 'CompactFlags']
+
+#: The attributes of every field stored in slots
+SLOTS = (
+    'name', 'short_name', 'id', 'type', 'label', 'flags', 'default',
+    'description', 'filters', 'validators', 'widget', '_translations',
+    'data', 'raw_data', 'object_data', 'errors', 'process_errors'
+)
+
+#: The slots specific to (subclasses of) WTForms' field classes
+EXTRA_SLOTS = (
+    (SelectFieldBase, ('option_widget',)),
+    (SelectField, ('choices', 'coerce')),
+    (DecimalField, ('places', 'rounding')),
+    (BooleanField, ('false_values',)),
+    (DateTimeField, ('format',))
+)
+
+_missing = object()
+
+_compact_classes = {}
+_shared_flags = {}
+
+
+class CompactLabel(Label):
+    """
+    An immutable ``Label``, which can be shared between fields.
+    """
+
+    __slots__ = ('field_id', 'text')
+
+    def __init__(self, field_id, text):
+        object.__setattr__(self, 'field_id', field_id)
+        object.__setattr__(self, 'text', text)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            'Compact labels are shared between forms; assign the field a '
+            'new Label instead.'
+        )
+
+    __delattr__ = __setattr__
+
+
+class CompactFlags(Flags):
+    """
+    An immutable ``Flags``, which can be shared between fields.
+    """
+
+    def __init__(self, flags=()):
+        self.__dict__.update(flags)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            'Compact flags are shared between forms; assign the field new '
+            'Flags instead.'
+        )
+
+    def __delattr__(self, name):
+        self.__setattr__(name, None)
+
+
+def compact_flags(flags):
+    """
+    Return the shared :class:`CompactFlags` equal to ``flags``.
+    """
+    items = tuple(sorted(flags.__dict__.items()))
+    try:
+        return _shared_flags[items]
+    except KeyError:
+        return _shared_flags.setdefault(items, CompactFlags(items))
+    except TypeError:
+        # unhashable flag values
+        return CompactFlags(items)
+
+
+def compact(field_class):
+    """
+    Return the compact (``__slots__``-based) subclass of ``field_class``.
+    """
+    if is_compact(field_class):
+        return field_class
+    try:
+        return _compact_classes[field_class]
+    except KeyError:
+        pass
+
+    names = list(SLOTS)
+    for base, extra in EXTRA_SLOTS:
+        if issubclass(field_class, base):
+            names.extend(n for n in extra if n not in names)
+
+    # Descriptors (e.g., ``FieldList.data``) can't be shadowed by slots, and
+    # class-level defaults (e.g., ``Field.errors``) are copied onto each
+    # instance before it's constructed.
+    slots = []
+    defaults = []
+    for name in names:
+        default = getattr(field_class, name, _missing)
+        if hasattr(default, '__get__'):
+            continue
+        slots.append(name)
+        if default is not _missing:
+            defaults.append((name, default))
+
+    def __init__(self, *args, **kwargs):
+        for name, default in defaults:
+            setattr(self, name, default)
+        field_class.__init__(self, *args, **kwargs)
+        self.type = field_class.__name__
+
+        label = self.label
+        if type(label) is Label:
+            self.label = CompactLabel(label.field_id, label.text)
+        if type(self.flags) is Flags:
+            self.flags = compact_flags(self.flags)
+        self.validators = tuple(self.validators)
+
+        if isinstance(self, FieldList):
+            self.unbound_field = compact_unbound(self.unbound_field)
+
+    def process(self, *args, **kwargs):
+        field_class.process(self, *args, **kwargs)
+        if not self.process_errors:
+            self.process_errors = ()
+
+    cls = type('Compact%s' % field_class.__name__, (field_class,), {
+        '__slots__': tuple(slots),
+        '__module__': __name__,
+        '__init__': __init__,
+        'process': process,
+        '_compact_slots': tuple(slots)
+    })
+    return _compact_classes.setdefault(field_class, cls)
+
+
+def is_compact(field_class):
+    return any('_compact_slots' in vars(c) for c in field_class.__mro__)
+
+
+def compact_unbound(unbound_field):
+    """
+    Return an ``UnboundField`` which binds a compact version of
+    ``unbound_field``'s field class.
+    """
+    if type(unbound_field) is not UnboundField or \
+            not issubclass(unbound_field.field_class, Field):
+        return unbound_field
+
+    compacted = unbound_field.__dict__.get('_compact')
+    if compacted is None:
+        compacted = UnboundField(
+            compact(unbound_field.field_class),
+            *unbound_field.args,
+            **unbound_field.kwargs
+        )
+        compacted.creation_counter = unbound_field.creation_counter
+        unbound_field._compact = compacted
+    return compacted
+
+
+def field_state(field):
+    """
+    Return a dictionary of a field's attributes, including those stored in
+    slots.
+    """
+    state = dict(field.__dict__)
+    for name in getattr(type(field), '_compact_slots', ()):
+        value = getattr(field, name, _missing)
+        if value is not _missing:
+            state[name] = value
+    return state
+
+
+def restore_state(field, state):
+    """
+    Replace a field's attributes (including slots) with ``state``.
+    """
+    field.__dict__.clear()
+    for name in getattr(type(field), '_compact_slots', ()):
+        if name not in state:
+            try:
+                delattr(field, name)
+            except AttributeError:
+                pass
+    for name, value in state.items():
+        setattr(field, name, value)
+
+
+class CompactPrototype(object):
+    """
+    A compact field, captured once per form class and prefix (like
+    ``pecan_wtforms.plan.FieldPrototype``), whose label, flags and
+    validators are shared by every field bound from it.
+    """
+
+    def __init__(self, unbound_field, name, prefix):
+        field = unbound_field.bind(form=None, name=name, prefix=prefix)
+        self.field_class = unbound_field.field_class
+        self.state = tuple(field_state(field).items())
+
+    def bind(self, form):
+        field = object.__new__(self.field_class)
+        for name, value in self.state:
+            setattr(field, name, value)
+        return field
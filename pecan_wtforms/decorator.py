@@ -1,9 +1,30 @@
-from pecan import request, response, redirect
+from inspect import ismethod
+from itertools import chain
 
-__all__ = ['with_form', 'redirect_to_handler']
+from pecan import abort, request, response, redirect, override_template
+from pecan.core import state
 
+from . import formdata as _formdata, instrument
+from .lazy import LazyForm, is_built, resolve
+from .multipart import ENVIRON_KEY as STREAMED_FORMDATA
+from .pool import default_pool, track
 
-def with_form(formcls, key='form', validate_safe=False, error_cfg={}, **kw):
+__all__ = ['with_form', 'with_forms', 'redirect_to_handler']
+
+SOURCES = ('params', 'post', 'get', 'both', 'json')
+
+#: The ``environ`` key of the form data source used by ``with_form``
+SOURCE_KEY = 'pecan_wtforms.source'
+
+#: The ``environ`` key caching indexed form data, by source
+INDEXED_FORMDATA = 'pecan_wtforms.indexed_formdata'
+
+REASON_MALFORMED_JSON = 'Malformed JSON request body.'
+
+
+def with_form(formcls, key='form', validate_safe=False, error_cfg={},
+              lazy=False, parallel_validation=False, csrf_cookie=True,
+              source='params', error_status=400, pool=False, **kw):
     """
     Used to decorate a Pecan controller with form creation for GET | HEAD and
     form validation for anything else (e.g., POST | PUT | DELETE ).
@@ -18,22 +39,75 @@ def with_form(formcls, key='form', validate_safe=False, error_cfg={}, **kw):
     accessible at ``request.pecan['form'].errors``.
 
     Optionally, validation errors can be made to trigger an internal HTTP
-    redirect by specifying a ``handler`` in the ``error_cfg`` argument.
+    redirect by specifying a ``handler`` in the ``error_cfg`` argument.  If
+    the ``handler`` is itself an exposed controller method (rather than a URI
+    path), it's called directly instead (see :class:`DirectHandler`).
 
     :param formcls: A subclass of ``wtforms.form.Form``
     :param key: The key used to inject the form in the template namespace
     :param validate_safe: When True, validation is performed against GET data
+    :param lazy: When True, GET and HEAD requests (that aren't validated)
+                 receive a proxy which only constructs the form the first time
+                 it's used by the controller or template.  Controllers that
+                 never touch the form skip construction (and CSRF cookie
+                 generation) entirely.
+    :param parallel_validation: When True, fields are validated in parallel
+                                on a shared thread pool (after the CSRF
+                                token).  See ``Form.validate``.
+    :param source: Where form data comes from: ``'params'`` (the default,
+                   ``request.params``), ``'post'`` (only the request body),
+                   ``'get'`` (only the query string), ``'both'`` (like
+                   ``'params'``) or ``'json'``.  The ``'post'``, ``'get'``
+                   and ``'both'`` sources are flattened once per request
+                   into an indexed dictionary (see
+                   ``pecan_wtforms.formdata.IndexedFormData``), which is
+                   faster for large forms and lets ``FieldList`` fields
+                   find their entries without scanning every name.
+                   ``'params'`` passes ``request.params`` through as it is
+                   (as earlier versions did), since flattening it costs an
+                   extra pass over the request's data, which small forms
+                   don't win back.
+                   For ``'json'``, the request body is decoded as a JSON
+                   object (see ``pecan_wtforms.formdata.DictFormData``).
+                   In JSON mode, ``error_cfg`` is ignored entirely (no
+                   error markup is set up, and there's no ``handler``);
+                   when validation fails, the controller isn't called and
+                   the response is a JSON object,
+                   ``{"errors": form.errors}``.
+    :param error_status: The HTTP status code of JSON validation error
+                         responses.  Defaults to 400.
+    :param pool: When True, forms are checked out of a per-thread pool
+                 (see ``pecan_wtforms.pool``) rather than constructed on
+                 every request; they're returned to it by
+                 ``pecan_wtforms.pool.FormPoolHook``, which must be
+                 installed.  Can also be a ``FormPool`` to use.
+    :param csrf_cookie: When False, ``SecureForm`` never sets its CSRF cookie
+                        (so, for instance, GET responses which render the
+                        form can be cached).  See ``SecureForm``.
     :param error_cfg: a dictionary containing configuration for
                          displaying validatior errors:
 
                          ``handler`` - a URI path to redirect to when form
                                        validation fails.  Can also be a
-                                       callable that returns a URI path.
+                                       callable that returns a URI path, or
+                                       an exposed controller method on the
+                                       same controller, which is called
+                                       directly.
+
+                         ``hooks`` - when True, and ``handler`` is an exposed
+                                     controller method, the handler's
+                                     ``before`` hooks are run before it's
+                                     called.  Defaults to False.
 
                          ``auto_insert_errors`` - when True, markup for
                                                   validation errors will
                                                   automatically be added
-                                                  adjacent to erronuous fields.
+                                                  adjacent to erronuous fields
+                                                  (including errors the
+                                                  controller adds).  See
+                                                  ``Form.insert_error_markup``
+                                                  for forms built without
+                                                  this decorator.
 
                          ``prepend_errors`` - when True, error markup will be
                                               added before the input control.
@@ -48,28 +122,77 @@ def with_form(formcls, key='form', validate_safe=False, error_cfg={}, **kw):
                           ``class_`` - the class added to input fields when
                                        there is an error for that field.
                                        Defaults to 'error`.
+
+    Any other keyword arguments are passed to the form's constructor (e.g.,
+    as default field data).  Fields named like one of the arguments above
+    can't be given a default this way.
     """
+    if source not in SOURCES:
+        raise ValueError('Unknown form data source: %r' % (source,))
+    from_json = source == 'json'
+
+    # Resolve the error configuration once, rather than on every request
+    error_cfg = {} if from_json else dict(error_cfg)
+    error_handler = error_cfg.pop('handler', None)
+    if getattr(error_handler, 'exposed', False):
+        error_handler = DirectHandler(
+            error_handler,
+            run_hooks=error_cfg.pop('hooks', False)
+        )
+
+    form_pool = None
+    if pool is True:
+        form_pool = default_pool
+    elif pool:
+        form_pool = pool
+
     def deco(f):
 
         def wrapped(*args, **kwargs):
-            copy_error_cfg = error_cfg.copy()
-            error_handler = copy_error_cfg.pop('handler', None)
-
-            form = request.environ.pop('pecan.validation_form', None) or \
-                   formcls(
-                       request.params,
-                       csrf_context={
-                           'request': request,
-                           'response': response
-                       },
-                       error_cfg=copy_error_cfg, **kw
-                   )
+            if from_json:
+                return handle_json(args, kwargs)
+
+            def build():
+                csrf_context = {
+                    'request': request,
+                    'response': response,
+                    'set_cookie': csrf_cookie
+                }
+                request.environ[SOURCE_KEY] = source
+                if form_pool is None:
+                    return formcls(
+                        request_formdata(),
+                        csrf_context=csrf_context,
+                        error_cfg=error_cfg, **kw
+                    )
+                form = form_pool.acquire(
+                    formcls,
+                    request_formdata(),
+                    csrf_context=csrf_context,
+                    error_cfg=error_cfg, **kw
+                )
+                track(request.environ, form)
+                return form
+
+            validate = request.method not in ('GET', 'HEAD') or validate_safe
+
+            form = request.environ.pop('pecan.validation_form', None)
+            if form is not None:
+                # This is an error handler for an already-validated form
+                validate = False
+            elif lazy and not validate:
+                form = LazyForm(formcls, build)
+            else:
+                form = build()
 
             if key not in request.pecan:
                 request.pecan[key] = form
 
-            if (request.method not in ('GET', 'HEAD') or validate_safe):
-                if not form.validate() and error_handler is not None:
+            if validate:
+                valid = validate_form(form, parallel_validation)
+                if not valid and isinstance(error_handler, DirectHandler):
+                    return error_handler(form, args)
+                if not valid and error_handler is not None:
                     redirect_to_handler(form, error_handler)
 
                 # Remove the CSRF token (so it's not passed to the controller)
@@ -79,15 +202,264 @@ def with_form(formcls, key='form', validate_safe=False, error_cfg={}, **kw):
                 kwargs.update(form.data)
 
             ns = f(*args, **kwargs)
+
+            # Errors may have been added by the controller itself
+            if is_built(form):
+                insert_error_markup(form)
+
             if isinstance(ns, dict) and key not in ns:
                 ns[key] = form
             return ns
 
+        def handle_json(args, kwargs):
+            data = None
+            if request.body:
+                try:
+                    data = _formdata.loads(request.body)
+                except ValueError:
+                    data = None
+                if not isinstance(data, dict):
+                    return json_response(
+                        {'errors': {'': [REASON_MALFORMED_JSON]}}, 400
+                    )
+
+            form = formcls(
+                _formdata.DictFormData(data) if data else None,
+                csrf_context={
+                    'request': request,
+                    'response': response,
+                    'set_cookie': csrf_cookie
+                },
+                **kw
+            )
+            if key not in request.pecan:
+                request.pecan[key] = form
+
+            if request.method not in ('GET', 'HEAD') or validate_safe:
+                if not validate_form(form, parallel_validation):
+                    return json_response({'errors': form.errors},
+                                         error_status)
+                kwargs.pop('csrf_token', None)
+                kwargs.update(form.data)
+
+            # The form isn't added to the namespace, which is likely to be
+            # rendered as JSON.
+            return f(*args, **kwargs)
+
+        # e.g., for the routes reported by ``pecan_wtforms.instrument``
+        wrapped.__name__ = f.__name__
         return wrapped
 
     return deco
 
 
+def with_forms(forms, validate_safe=False, error_cfg={},
+               parallel_validation=False, csrf_cookie=True, source='both',
+               **kw):
+    """
+    Used to decorate a Pecan controller with several forms, e.g., for a
+    page with a search box, a newsletter signup form and its main form::
+
+        @expose('index.html')
+        @with_forms({
+            'search': SearchForm,
+            'signup': (SignupForm, 'newsletter')
+        }, error_cfg={'auto_insert_errors': True})
+        def index(self, **kw):
+            if 'signup' in request.pecan['submitted_forms']:
+                ...
+
+    Each form is constructed with a prefix (by default, its key, so the
+    search form's ``q`` field is named ``search-q``), and injected into the
+    request object and template namespace at its key, as with
+    :func:`with_form`.  The forms share one (indexed) form data source, and
+    ``SecureForm`` instances share one CSRF cookie and token.
+
+    Only the forms with a field present in the request are given form
+    data (the others render with their defaults) and, for unsafe requests
+    (or with ``validate_safe``), validated.  Their keys are listed at
+    ``request.pecan['submitted_forms']``.  An unsafe request which submits
+    none of the forms (and so has no CSRF token to check) is rejected with
+    a 400 response.  Unlike :func:`with_form`, form data isn't passed to
+    the controller as keyword arguments.
+
+    :param forms: A dictionary mapping keys to form classes, or to
+                  ``(formcls, prefix)`` pairs.
+    :param error_cfg: as for :func:`with_form`, except that the ``handler``
+                      must be a URI path (or a callable that returns one)
+                      whose controller is decorated with the same
+                      ``with_forms``, and which receives the same forms.
+    :param source: Where form data comes from (see :func:`with_form`;
+                   ``'json'`` isn't supported).  Defaults to ``'both'``.
+
+    The other arguments are as for :func:`with_form`.
+    """
+    if source not in SOURCES or source == 'json':
+        raise ValueError('Unsupported form data source: %r' % (source,))
+
+    specs = []
+    for key in sorted(forms):
+        spec = forms[key]
+        formcls, prefix = spec if isinstance(spec, tuple) else (spec, key)
+        if prefix and prefix[-1] not in '-_;:/.':
+            prefix += '-'
+        specs.append((key, formcls, prefix))
+
+    error_cfg = dict(error_cfg)
+    error_handler = error_cfg.pop('handler', None)
+
+    def deco(f):
+
+        def wrapped(*args, **kwargs):
+            built = request.environ.pop('pecan.validation_forms', None)
+            if built is not None:
+                # This is an error handler for already-validated forms
+                forms, submitted = built
+                validate = False
+            else:
+                forms, submitted = build()
+                unsafe = request.method not in ('GET', 'HEAD')
+                if unsafe and not submitted:
+                    abort(400)
+                validate = unsafe or validate_safe
+
+            for key, form in forms:
+                if key not in request.pecan:
+                    request.pecan[key] = form
+            request.pecan['submitted_forms'] = [
+                key for key, _ in submitted
+            ]
+
+            if validate:
+                valid = True
+                for _, form in submitted:
+                    if not validate_form(form, parallel_validation):
+                        valid = False
+                if not valid and error_handler is not None:
+                    redirect_forms_to_handler(
+                        forms, submitted, error_handler
+                    )
+
+            ns = f(*args, **kwargs)
+
+            for _, form in forms:
+                insert_error_markup(form)
+            if isinstance(ns, dict):
+                for key, form in forms:
+                    ns.setdefault(key, form)
+            return ns
+
+        def build():
+            request.environ[SOURCE_KEY] = source
+            formdata = request_formdata(source)
+            csrf_context = {
+                'request': request,
+                'response': response,
+                'set_cookie': csrf_cookie,
+                'tokens': {}
+            }
+
+            forms = []
+            submitted = []
+            for key, formcls, prefix in specs:
+                present = bool(formdata) and has_prefix(formdata, prefix)
+                form = formcls(
+                    formdata if present else None,
+                    prefix=prefix,
+                    csrf_context=csrf_context,
+                    error_cfg=error_cfg,
+                    **kw
+                )
+                forms.append((key, form))
+                if present:
+                    submitted.append((key, form))
+            return forms, submitted
+
+        wrapped.__name__ = f.__name__
+        return wrapped
+
+    return deco
+
+
+def has_prefix(formdata, prefix):
+    """
+    Return True if any name in ``formdata`` starts with ``prefix``.
+    """
+    if not prefix:
+        return True
+    separator = getattr(formdata, 'separator', None)
+    if separator and prefix.endswith(separator):
+        return bool(formdata.prefixed(prefix[:-len(separator)]))
+    return any(name.startswith(prefix) for name in formdata)
+
+
+def validate_form(form, parallel=False):
+    """
+    Validate ``form``, in parallel if ``parallel`` is set (see
+    ``Form.validate``).  Otherwise ``form.validate()`` is called without
+    arguments, as plain ``wtforms.form.Form`` subclasses expect.
+    """
+    if parallel:
+        return form.validate(parallel=True)
+    return form.validate()
+
+
+def insert_error_markup(form):
+    """
+    Call ``form.insert_error_markup()``, if it has one (plain
+    ``wtforms.form.Form`` subclasses don't).
+    """
+    insert = getattr(form, 'insert_error_markup', None)
+    if insert is not None:
+        insert()
+
+
+def json_response(body, status):
+    """
+    Fill out (and return) the current response with a JSON body.
+    """
+    response.status = status
+    response.content_type = 'application/json'
+    response.body = _formdata.dumps(body)
+    return response
+
+
+def request_formdata(source=None):
+    """
+    Return the form data for the current request from ``source`` (see
+    ``with_form``; by default, the source most recently used by
+    ``with_form`` during the request, or ``'params'``).
+
+    The request body is read from the form data parsed by
+    ``pecan_wtforms.multipart.StreamingFormDataMiddleware`` (if it's
+    installed and the request was ``multipart/form-data``), or otherwise
+    ``request.POST``.
+    """
+    environ = request.environ
+    if source is None:
+        source = environ.get(SOURCE_KEY, 'params')
+    streamed = environ.get(STREAMED_FORMDATA)
+    if source == 'params':
+        if streamed is None:
+            return request.params
+        # Like ``request.params``, the query string followed by the body
+        source = 'both'
+
+    cache = environ.setdefault(INDEXED_FORMDATA, {})
+    formdata = cache.get(source)
+    if formdata is None:
+        items = []
+        if source in ('get', 'both'):
+            items.append(request.GET.items())
+        if source in ('post', 'both'):
+            if streamed is None:
+                items.append(request.POST.items())
+            else:
+                items.append(streamed.items())
+        formdata = cache[source] = _formdata.IndexedFormData(chain(*items))
+    return formdata
+
+
 def redirect_to_handler(form, location):
     """
     Cause a form with error to internally redirect to a URI path.
@@ -106,10 +478,95 @@ def redirect_to_handler(form, location):
                 form.some_field.errors.append('Validation failure!')
                 redirect_to_handler(form, '/some/handler')
     """
-    setattr(form, '_validation_original_data', request.params)
+    form = resolve(form)
+    started = instrument.start()
+    insert_error_markup(form)
+    setattr(form, '_validation_original_data', request_formdata())
     if callable(location):
         location = location()
     request.environ['REQUEST_METHOD'] = 'GET'
     request.environ['pecan.validation_redirected'] = True
     request.environ['pecan.validation_form'] = form
+    instrument.record(started, 'redirect', form)
     redirect(location, internal=True)
+
+
+def redirect_forms_to_handler(forms, submitted, location):
+    """
+    Cause the forms of a :func:`with_forms` controller to internally
+    redirect to a URI path (see :func:`redirect_to_handler`).
+    """
+    formdata = request_formdata()
+    for _, form in submitted:
+        started = instrument.start()
+        insert_error_markup(form)
+        form._validation_original_data = formdata
+        instrument.record(started, 'redirect', form)
+    if callable(location):
+        location = location()
+    request.environ['REQUEST_METHOD'] = 'GET'
+    request.environ['pecan.validation_redirected'] = True
+    request.environ['pecan.validation_forms'] = (forms, submitted)
+    redirect(location, internal=True)
+
+
+class DirectHandler(object):
+    """
+    An error ``handler`` which is an exposed controller method, resolved once
+    (when ``with_form`` is applied) and called in-process when validation
+    fails.
+
+    Unlike :func:`redirect_to_handler`, this doesn't raise an internal
+    redirect, so Pecan doesn't re-route the request or re-run its hooks.
+    The handler receives the already-validated form (at ``request.pecan``
+    and in its template namespace, as usual), and its template is used to
+    render the response, e.g.::
+
+        class RootController(object):
+
+            @expose('signup.html')
+            @with_form(SignupForm)
+            def index(self):
+                return dict()
+
+            @expose()
+            @with_form(SignupForm, error_cfg={
+                'auto_insert_errors': True, 'handler': index
+            })
+            def save(self, **kw):
+                ...
+
+    The handler must be a method of the same controller (or a bound method),
+    and is called without arguments.
+    """
+
+    def __init__(self, controller, run_hooks=False):
+        self.controller = controller
+        self.run_hooks = run_hooks
+        cfg = controller._pecan
+        self.content_type = cfg.get('content_type')
+        self.content_types = cfg.get('content_types', {})
+
+    def __call__(self, form, args):
+        started = instrument.start()
+        insert_error_markup(form)
+        form._validation_original_data = request_formdata()
+        request.environ['pecan.validation_redirected'] = True
+        request.environ['pecan.validation_form'] = form
+
+        template = self.content_types.get(
+            request.pecan.get('content_type'),
+            self.content_types.get(self.content_type)
+        )
+        override_template(template, self.content_type)
+
+        instrument.record(started, 'redirect', form)
+
+        if self.run_hooks:
+            state.controller = self.controller
+            state.hooks = state.app.determine_hooks(self.controller)
+            state.app.handle_hooks('before', state)
+
+        if ismethod(self.controller) and self.controller.im_self is not None:
+            return self.controller()
+        return self.controller(args[0])
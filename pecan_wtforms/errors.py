@@ -1,6 +1,18 @@
 from cgi import escape
 
-__all__ = ['ErrorMarkupWidget']
+from . import instrument
+from .cache import BoundedCache
+
+__all__ = ['ErrorMarkupWidget', 'error_widget', 'widget_options',
+           'format_error', 'markup_cache']
+
+#: The maximum number of shared error widgets kept by :func:`error_widget`
+MAX_SHARED_WIDGETS = 1024
+
+#: The maximum number of formatted error messages kept by :func:`format_error`
+MAX_CACHED_MARKUP = 1024
+
+_shared_widgets = {}
 
 
 def default_formatter(v):
@@ -11,12 +23,64 @@ def default_formatter(v):
     return '<span class="error-message">%s</span>\n' % escape(v, True)
 
 
+default_formatter.cacheable = True
+
+
+class MarkupCache(BoundedCache):
+    """
+    A bounded cache of formatted error markup, keyed by formatter and
+    message.
+
+    Only formatters with a true ``cacheable`` attribute (like
+    ``default_formatter``) are cached; custom formatters opt in with
+    ``formatter.cacheable = True``.  Formatters whose output depends on
+    anything but the message (the current locale, say) shouldn't.
+
+    The shared cache's hit rate is reported by
+    ``pecan_wtforms.instrument.cache_stats()``.
+    """
+
+    def __init__(self, maxsize=MAX_CACHED_MARKUP):
+        super(MarkupCache, self).__init__(maxsize)
+
+    def format(self, formatter, message):
+        if not getattr(formatter, 'cacheable', False):
+            return formatter(message)
+        key = (formatter, message)
+        try:
+            markup = self._data.get(key)
+        except TypeError:
+            # unhashable message
+            return formatter(message)
+        if markup is None:
+            self.misses += 1
+            markup = formatter(message)
+            self.set(key, markup)
+        else:
+            self.hits += 1
+        return markup
+
+
+markup_cache = MarkupCache()
+instrument.register_cache('error_markup', markup_cache)
+
+
+def format_error(formatter, message):
+    """
+    Format an error message with ``formatter``, from the shared
+    :class:`MarkupCache` where possible.
+    """
+    return markup_cache.format(formatter, message)
+
+
 class ErrorMarkupWidget(object):
     """"
     A custom widget that appends (or prepends) error markup to an existing
     widget's HTML output.
     """
 
+    __slots__ = ('widget', 'prepend_errors', 'class_', 'formatter')
+
     def __init__(self, widget, prepend_errors=True, class_='error',
                     formatter=default_formatter):
         self.widget = widget
@@ -37,7 +101,71 @@ class ErrorMarkupWidget(object):
                 value += error_markup
         return value
 
+    def iter_render(self, field, **kwargs):
+        """
+        Yield the same HTML as calling the widget, in chunks (the wrapped
+        widget's markup and each formatted error), without joining them.
+        """
+        errors = field.errors
+        if errors:
+            c = kwargs.pop('class', '') or kwargs.pop('class_', '')
+            kwargs['class'] = u'%s %s' % (self.class_, c) if c else self.class_
+            if self.prepend_errors:
+                for e in errors:
+                    yield format_error(self.formatter, e)
+        for chunk in iter_widget(self.widget, field, **kwargs):
+            yield chunk
+        if errors and not self.prepend_errors:
+            for e in errors:
+                yield format_error(self.formatter, e)
+
     def format_errors(self, errors):
+        formatter = self.formatter
         return ''.join([
-            self.formatter(e) for e in errors
+            format_error(formatter, e) for e in errors
         ])
+
+
+def iter_widget(widget, field, **kwargs):
+    """
+    Yield the HTML for ``field`` rendered by ``widget``, in chunks.
+    """
+    if isinstance(widget, ErrorMarkupWidget):
+        for chunk in widget.iter_render(field, **kwargs):
+            yield chunk
+    else:
+        yield widget(field, **kwargs)
+
+
+def widget_options(config):
+    """
+    Resolve an ``error_cfg`` dictionary (see ``pecan_wtforms.with_form``)
+    into a hashable tuple of ``ErrorMarkupWidget`` arguments.  Keys which
+    don't configure error markup (like ``handler``) are ignored.
+    """
+    return (
+        config.get('prepend_errors', True),
+        config.get('class_', 'error'),
+        config.get('formatter', default_formatter)
+    )
+
+
+def error_widget(widget, options):
+    """
+    Return an ``ErrorMarkupWidget`` wrapping ``widget`` with the given
+    (resolved) ``options``.
+
+    ``ErrorMarkupWidget`` holds no per-request state, so wrappers are shared
+    between every field and form using the same widget and configuration.
+    """
+    key = (widget, options)
+    try:
+        return _shared_widgets[key]
+    except KeyError:
+        wrapped = ErrorMarkupWidget(widget, *options)
+        if len(_shared_widgets) < MAX_SHARED_WIDGETS:
+            _shared_widgets[key] = wrapped
+        return wrapped
+    except TypeError:
+        # unhashable widget
+        return ErrorMarkupWidget(widget, *options)
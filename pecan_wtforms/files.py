@@ -0,0 +1,233 @@
+"""
+Zero-copy access to uploaded files.
+
+:class:`MappedFileField` exposes an upload as a :class:`MappedFile`, whose
+contents (for uploads spooled to disk) are memory-mapped rather than read
+into a string, so validators can sniff headers and hash content without
+copying it, e.g.::
+
+    class AvatarForm(pecan_wtforms.SecureForm):
+        avatar = MappedFileField('Avatar', [
+            FileSize(max_size=2 * 1024 * 1024),
+            FileSignature('\\x89PNG\\r\\n\\x1a\\n', '\\xff\\xd8\\xff')
+        ])
+
+    ...
+    form.avatar.data.move_to('/srv/avatars/%s.png' % user.id)
+"""
+import hashlib
+import mmap
+import os
+import shutil
+
+from wtforms.fields import FileField
+from wtforms.validators import ValidationError
+
+__all__ = ['MappedFile', 'MappedFileField', 'FileSize', 'FileSignature']
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def _view(obj, offset=0, size=None):
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        # Python 2's ``mmap`` only supports the old buffer interface
+        if size is None:
+            return buffer(obj, offset)  # noqa
+        return buffer(obj, offset, size)  # noqa
+    end = None if size is None else offset + size
+    return view[offset:end]
+
+
+class MappedFile(object):
+    """
+    A read-only, memory-mapped view of an uploaded file.
+
+    Wraps a :class:`pecan_wtforms.multipart.UploadedFile` or a
+    ``cgi.FieldStorage`` (as found in ``request.POST``).  Files which only
+    exist in memory (small uploads that were never spooled to disk) are
+    exposed through the same API, but aren't zero-copy: their contents are
+    copied into a string once, when :attr:`buffer` is first read.
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.file = getattr(upload, 'file', upload)
+        self.filename = getattr(upload, 'filename', None)
+        self.content_type = getattr(upload, 'type', None)
+        self.path = getattr(upload, 'path', None)
+        self._map = None
+
+    def fileno(self):
+        return self.file.fileno()
+
+    @property
+    def size(self):
+        size = getattr(self.upload, 'size', None)
+        if size is None:
+            try:
+                size = os.fstat(self.fileno()).st_size
+            except (AttributeError, IOError, OSError, ValueError):
+                position = self.file.tell()
+                self.file.seek(0, os.SEEK_END)
+                size = self.file.tell()
+                self.file.seek(position)
+        return size
+
+    @property
+    def buffer(self):
+        """
+        The file's contents, memory-mapped (for files on disk), or a copy
+        of them as a string (for files in memory).
+        """
+        if self._map is None:
+            try:
+                fileno = self.fileno()
+            except (AttributeError, IOError, OSError, ValueError):
+                fileno = None
+            if self.size == 0:
+                # Empty files can't be mapped
+                self._map = b''
+            elif fileno is None:
+                # An in-memory file
+                self._map = self.file.getvalue()
+            else:
+                self.file.flush()
+                self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def view(self, offset=0, size=None):
+        """
+        Return a zero-copy view (a ``memoryview``, or a ``buffer`` on
+        Python 2) of ``size`` bytes starting at ``offset``.
+        """
+        return _view(self.buffer, offset, size)
+
+    def head(self, size):
+        """
+        Return the first ``size`` bytes of the file.
+        """
+        return self.buffer[:size]
+
+    def startswith(self, *signatures):
+        buf = self.buffer
+        for signature in signatures:
+            if buf[:len(signature)] == signature:
+                return True
+        return False
+
+    def digest(self, algorithm='sha256'):
+        """
+        Return the hex digest of the file's contents, hashed straight from
+        the memory map.
+        """
+        h = hashlib.new(algorithm)
+        h.update(self.buffer)
+        return h.hexdigest()
+
+    def sendfile(self, out):
+        """
+        Copy the file's contents to the file object ``out``, using
+        ``os.sendfile`` where it's available.
+        """
+        sendfile = getattr(os, 'sendfile', None)
+        if sendfile is not None and self.path is not None:
+            try:
+                out_fd = out.fileno()
+            except (AttributeError, IOError, OSError, ValueError):
+                pass
+            else:
+                out.flush()
+                offset, size = 0, self.size
+                while offset < size:
+                    offset += sendfile(out_fd, self.fileno(), offset,
+                                       size - offset)
+                return
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, out, COPY_CHUNK_SIZE)
+
+    def move_to(self, destination):
+        """
+        Move the file to ``destination``.  Spooled uploads are renamed into
+        place where possible, so their contents are never read; otherwise
+        the contents are copied with :meth:`sendfile`.
+        """
+        if self.path is not None:
+            try:
+                os.rename(self.path, destination)
+            except OSError:
+                pass
+            else:
+                self.path = self.upload.path = None
+                return destination
+
+        with open(destination, 'wb') as out:
+            self.sendfile(out)
+        return destination
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = None
+
+    def __repr__(self):
+        return '<MappedFile %r>' % self.filename
+
+
+class MappedFileField(FileField):
+    """
+    A ``FileField`` whose ``data`` is a :class:`MappedFile` when a file was
+    uploaded (and ``None`` otherwise).
+    """
+
+    def process_formdata(self, valuelist):
+        self.data = None
+        if valuelist and hasattr(valuelist[0], 'filename') and \
+                valuelist[0].filename:
+            self.data = MappedFile(valuelist[0])
+
+    def _value(self):
+        return ''
+
+
+class FileSize(object):
+    """
+    Validates the size (in bytes) of an uploaded file without reading it.
+    """
+
+    def __init__(self, max_size=None, min_size=0, message=None):
+        self.max_size = max_size
+        self.min_size = min_size
+        self.message = message
+
+    def __call__(self, form, field):
+        if field.data is None:
+            return
+        size = field.data.size
+        if size < self.min_size or \
+                (self.max_size is not None and size > self.max_size):
+            message = self.message
+            if message is None:
+                message = field.gettext('Invalid file size.')
+            raise ValidationError(message)
+
+
+class FileSignature(object):
+    """
+    Validates that an uploaded file starts with one of the given "magic"
+    byte signatures (e.g., ``'%PDF-'``), inspecting only the file's header.
+    """
+
+    def __init__(self, *signatures, **kwargs):
+        self.signatures = signatures
+        self.message = kwargs.get('message')
+
+    def __call__(self, form, field):
+        if field.data is None:
+            return
+        if not field.data.startswith(*self.signatures):
+            message = self.message
+            if message is None:
+                message = field.gettext('Invalid file type.')
+            raise ValidationError(message)
@@ -1,13 +1,24 @@
-import random
-import urlparse
-import warnings
-from hashlib import md5
-
-from pecan import abort
+import hmac
+import os
+import threading
+import time
+from binascii import hexlify
+from hashlib import sha256
+
+from pecan import abort, response
+from wtforms.fields.core import Label, Flags, FormField, FieldList
+from wtforms.form import BaseForm
 from wtforms.ext.csrf.form import SecureForm as WTFSecureForm
 from wtforms.ext.csrf.fields import CSRFTokenField as WTFCSRFTokenField
+from wtforms.widgets import HTMLString
 from . import ValidationError
-from .errors import ErrorMarkupWidget
+from .compact import (CompactLabel, CompactFlags, field_state,
+                      restore_state)
+from .errors import ErrorMarkupWidget, error_widget, widget_options
+from .formdata import DictFormData
+from .origins import get_origin_matcher, parse_origin
+from .plan import get_plan
+from . import instrument, profiler, validation
 
 __all__ = ['SecureForm', 'Form']
 
@@ -15,10 +26,47 @@ REASON_NO_REFERER = "Referer checking failed - no Referer."
 REASON_BAD_REFERER = "Referer checking failed - %s does not match %s."
 REASON_BAD_TOKEN = "CSRF token incorrect."
 REASON_MISSING_TOKEN = "CSRF token missing."
+REASON_EXPIRED_TOKEN = "CSRF token expired."
+
+try:
+    _compare_digest = hmac.compare_digest
+except AttributeError:  # pragma: nocover
+    _compare_digest = None
+
+
+class RandomPool(object):
+    """
+    Serves random bytes from a buffer that's refilled with a single, large
+    ``os.urandom`` read, rather than making a system call per token.
+
+    The buffer is discarded after a ``fork()``, so that pre-forked workers
+    never hand out the same bytes.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._buffer = b''
+        self._offset = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def read(self, n):
+        with self._lock:
+            pid = os.getpid()
+            if pid != self._pid or self._offset + n > len(self._buffer):
+                self._buffer = os.urandom(max(self.size, n))
+                self._offset = 0
+                self._pid = pid
+            data = self._buffer[self._offset:self._offset + n]
+            self._offset += n
+        return data
+
+
+_random = RandomPool()
 
 
 def _get_new_csrf_value():
-    return md5(str(random.getrandbits(128))).hexdigest()
+    return hexlify(_random.read(16))
 
 
 def constant_time_compare(val1, val2):
@@ -30,6 +78,12 @@ def constant_time_compare(val1, val2):
     Theoretically, this is useful in avoiding timing attacks related to
     simple string equality checks.
     """
+    if _compare_digest is not None:
+        if isinstance(val1, unicode):
+            val1 = val1.encode('utf-8')
+        if isinstance(val2, unicode):
+            val2 = val2.encode('utf-8')
+        return _compare_digest(val1, val2)
     if len(val1) != len(val2):
         return False
     result = 0
@@ -38,6 +92,82 @@ def constant_time_compare(val1, val2):
     return result == 0
 
 
+def _copy_state(state):
+    """
+    Copy a field's state, along with anything mutable in it.
+    """
+    state = dict(state)
+    for key, value in state.items():
+        if isinstance(value, list):
+            state[key] = list(value)
+        elif isinstance(value, dict):
+            state[key] = dict(value)
+        elif isinstance(value, (CompactLabel, CompactFlags)):
+            # immutable
+            continue
+        elif isinstance(value, Label):
+            state[key] = Label(value.field_id, value.text)
+        elif isinstance(value, Flags):
+            flags = state[key] = Flags()
+            flags.__dict__.update(value.__dict__)
+    return state
+
+
+def has_field_data(form, formdata):
+    """
+    Return True if ``formdata`` has data for any of ``form``'s fields (other
+    than its CSRF token), rather than, say, only unrelated query string
+    arguments.
+    """
+    if not formdata:
+        return False
+    compound = []
+    for field in form:
+        if field.short_name == 'csrf_token':
+            continue
+        if field.name in formdata:
+            return True
+        if isinstance(field, (FormField, FieldList)):
+            # Sub-fields are named e.g. ``address-city`` or ``tags-0``
+            compound.append(field.name + getattr(field, 'separator', '-'))
+    if compound:
+        compound = tuple(compound)
+        return any(name.startswith(compound) for name in formdata)
+    return False
+
+
+def iter_render(form, fields=None):
+    """
+    Yield the HTML for a form's fields (or only those named in ``fields``)
+    in chunks: each field's label and widget (or only the widget, for hidden
+    fields), one field per line.
+    """
+    if fields is not None:
+        fields = [form[name] for name in fields]
+    first = True
+    for field in (form if fields is None else fields):
+        if first:
+            first = False
+        else:
+            yield u'\n'
+        widget = field.widget
+        inner = widget.widget if isinstance(widget, ErrorMarkupWidget) \
+            else widget
+        if getattr(inner, 'input_type', None) != 'hidden':
+            yield field.label()
+            yield u' '
+        if isinstance(widget, ErrorMarkupWidget):
+            for chunk in widget.iter_render(field):
+                yield chunk
+        else:
+            yield field()
+
+
+#: Form attributes set by ``Form.__init__`` which ``Form.reset()`` keeps
+#: for forms that weren't pooled
+_KEPT_ON_RESET = ('csrf_context', '_error_options', '_csrf_nonce')
+
+
 class CSRFTokenField(WTFCSRFTokenField):
     """
     Behaves similarly to CSRFTokenField field, but throws an HTTP 403 exception
@@ -62,6 +192,21 @@ class Form(WTFSecureForm):
 
     SECRET_KEY = '_pecan_wtform_auth_token'
 
+    #: The maximum number of seconds ``validate()`` waits for deferred
+    #: validators (see ``pecan_wtforms.deferred``); ``None`` waits forever.
+    VALIDATION_TIMEOUT = None
+
+    #: When True, ``validate()`` validates fields in parallel on a shared
+    #: thread pool (useful when validators block on I/O).
+    PARALLEL_VALIDATION = False
+
+    #: When True, fields are bound as compact, ``__slots__``-based objects
+    #: with shared labels and flags (see ``pecan_wtforms.compact``).
+    COMPACT_FIELDS = False
+
+    _pending_validation = None
+    _formdata = None
+
     def __init__(self, formdata=None, obj=None, prefix='', csrf_context={},
                     error_cfg={}, **kwargs):
         """
@@ -72,21 +217,75 @@ class Form(WTFSecureForm):
             errors.  See ``pecan_wtforms.with_form``.
         """
 
-        # Warn the user if they don't choose a unique secret CSRF key
-        if self.SECRET_KEY == Form.SECRET_KEY:
-            warnings.warn(
-                ('Using the default `SECRET_KEY` is a security risk.  To '
-                 'prevent CSRF attacks, set a unique attribute value for '
-                 '%s.SECRET_KEY') % self.__class__.__name__,
-                RuntimeWarning
-            )
+        started = instrument.start()
+        get_plan(self.__class__).bind(self, prefix)
+        self._setup(formdata, obj, csrf_context, error_cfg, **kwargs)
+        instrument.record(started, 'construction', self)
 
+    def _setup(self, formdata, obj, csrf_context, error_cfg, **kwargs):
+        # Everything ``__init__`` does once the fields are bound (and that
+        # a pooled form does each time it's reused)
         self.csrf_context = csrf_context
-        super(Form, self).__init__(formdata, obj, prefix,
-                                    csrf_context=self.csrf_context, **kwargs)
+        self.process(formdata, obj, **kwargs)
+        self.csrf_token.current_token = self.generate_csrf_token(
+            self.csrf_context
+        )
+
+        self._error_options = None
+        if error_cfg.get('auto_insert_errors', False) is True:
+            self._error_options = widget_options(error_cfg)
 
-        if error_cfg.pop('auto_insert_errors', False) is True:
-            self.setup_errors(error_cfg)
+    def reset(self):
+        """
+        Restore the form to the state it was in just after its fields were
+        bound: data, errors, error markup, ``_validation_original_data``,
+        CSRF state and any other attributes set on the form (or its fields)
+        since are discarded.
+
+        Call ``process()`` (or see ``pecan_wtforms.pool``) to reuse the
+        form.  A form that wasn't checked out of a pool keeps what its
+        constructor set up for the request (its ``csrf_context``, CSRF token
+        and error markup configuration), so it can be validated again.
+        """
+        snapshot = self.__dict__.get('_reset_state')
+        if snapshot is None:
+            # Not captured (e.g., the form wasn't pooled), so rebind
+            prefix = self._prefix
+            kept = dict(
+                (name, self.__dict__[name]) for name in _KEPT_ON_RESET
+                if name in self.__dict__
+            )
+            csrf_token = self._fields.get('csrf_token')
+            token = getattr(csrf_token, 'current_token', None)
+            self.__dict__.clear()
+            get_plan(self.__class__).bind(self, prefix)
+            self.__dict__.update(kept)
+            if csrf_token is not None:
+                self._fields['csrf_token'].current_token = token
+            self._snapshot()
+            return
+
+        form_state, field_states = snapshot
+        self.__dict__.clear()
+        self.__dict__.update(form_state)
+        self._fields = dict(form_state['_fields'])
+        self._reset_state = snapshot
+        for field, state in field_states:
+            restore_state(field, _copy_state(state))
+
+    def _snapshot(self):
+        """
+        Capture the form's (freshly bound) state for :meth:`reset`.
+        """
+        form_state = dict(self.__dict__)
+        form_state.pop('_reset_state', None)
+        self._reset_state = (
+            form_state,
+            [
+                (field, _copy_state(field_state(field)))
+                for field in self._fields.values()
+            ]
+        )
 
     def generate_csrf_token(self, _):
         return
@@ -94,54 +293,508 @@ class Form(WTFSecureForm):
     def validate_csrf_token(self, field):
         return
 
+    def validate(self, parallel=None):
+        """
+        Validates the form by calling `validate` on each field, passing any
+        extra `Form.validate_<fieldname>` validators to the field validator.
+
+        Deferred validators are started as their fields are validated and then
+        awaited together, for at most ``VALIDATION_TIMEOUT`` seconds.
+
+        :param parallel: When True, the CSRF token is validated first and
+                         the remaining fields are then validated in parallel
+                         on a shared thread pool.  Defaults to
+                         ``PARALLEL_VALIDATION``.
+        """
+        if parallel is None:
+            parallel = self.PARALLEL_VALIDATION
+
+        plan = get_plan(self.__class__)
+        extra = plan.inline_validators
+        restore = None
+        sampler = profiler.current()
+        if sampler is not None:
+            extra, restore = sampler.wrap_validators(self, extra)
+
+        self._pending_validation = pending = []
+        try:
+            if parallel:
+                success = self._validate_parallel(plan, extra)
+            elif instrument.enabled:
+                success = self._validate_timed(extra)
+            else:
+                success = BaseForm.validate(self, extra)
+        finally:
+            self._pending_validation = None
+            if restore is not None:
+                restore()
+
+        if pending:
+            # Merge errors in field order, regardless of completion order
+            pending.sort(key=lambda p: plan.order.get(p[0].short_name))
+            if not validation.wait(pending, self.VALIDATION_TIMEOUT):
+                success = False
+            self._errors = None
+
+        if not success:
+            self.insert_error_markup()
+        return success
+
+    @classmethod
+    def validate_many(cls, rows, prefix=''):
+        """
+        Validate a sequence of records (e.g., the rows of a CSV import)
+        against this form class, returning a list with one entry per row:
+        ``None`` for valid rows, or a dictionary mapping the names of
+        invalid fields to their errors.
+
+        See :meth:`iter_validate`.
+        """
+        return [errors for _, errors in cls.iter_validate(rows, prefix)]
+
+    @classmethod
+    def iter_validate(cls, rows, prefix=''):
+        """
+        Validate records one at a time, yielding ``(data, errors)`` for each,
+        where ``data`` is a dictionary of the fields' (processed) data and
+        ``errors`` is ``None`` or a dictionary of the invalid fields' errors.
+
+        Each row may be a dictionary (see
+        ``pecan_wtforms.formdata.DictFormData``) or a multidict.
+
+        A single form instance is bound (without calling ``__init__``) and
+        re-processed for every row, so fields are only constructed once.
+        The CSRF token isn't validated; check it once for the request as a
+        whole.
+        """
+        validate = cls._bulk_validator(prefix)
+        for row in rows:
+            yield validate(row)
+
+    @classmethod
+    def _bulk_validator(cls, prefix=''):
+        """
+        Bind a single form instance, returning a function which validates a
+        row with it and returns ``(data, errors)``.
+        """
+        plan = get_plan(cls)
+        form = cls.__new__(cls)
+        form.csrf_context = {}
+        form._error_options = None
+        plan.bind(form, prefix)
+
+        extra = plan.inline_validators
+        fields = [
+            (name, form._fields[name]) for name, _ in plan.fields
+            if name != 'csrf_token'
+        ]
+
+        sampler = profiler.current()
+        if sampler is not None:
+            # The form is private to this validator, so its validators stay
+            # timed for every row
+            extra, _ = sampler.wrap_validators(form, extra)
+
+        def validate(row):
+            if isinstance(row, dict):
+                row = DictFormData(row)
+            for _, field in fields:
+                # ``Field.process`` leaves the previous row's raw data in
+                # place when this row is empty
+                field.raw_data = []
+                field.process_errors = []
+            form.process(row)
+
+            form._pending_validation = pending = []
+            try:
+                for name, field in fields:
+                    field.validate(form, extra.get(name, ()))
+            finally:
+                form._pending_validation = None
+            if pending:
+                validation.wait(pending, cls.VALIDATION_TIMEOUT)
+
+            errors = None
+            for name, field in fields:
+                if field.errors:
+                    if errors is None:
+                        errors = {}
+                    errors[name] = field.errors
+            return dict((name, field.data) for name, field in fields), errors
+
+        return validate
+
+    def _validate_parallel(self, plan, extra):
+        self._errors = None
+        fields = [
+            self._fields[name] for name, _ in plan.fields
+            if name in self._fields
+        ]
+
+        if instrument.enabled:
+            # Worker threads can't see the current request
+            ctx = instrument.context()
+
+            def validate_field(field):
+                return self._validate_field(field, extra, ctx)
+        else:
+            def validate_field(field):
+                return field.validate(self, extra.get(field.short_name, ()))
+
+        # The CSRF check runs first; on failure it aborts the request before
+        # any other validator has run.
+        csrf_token = self._fields.get('csrf_token')
+        success = True
+        if csrf_token is not None:
+            fields.remove(csrf_token)
+            success = validate_field(csrf_token)
+
+        results = validation.map_concurrently(validate_field, fields)
+        return success and all(results)
+
+    def _validate_timed(self, extra):
+        # ``BaseForm.validate``, timing each field
+        self._errors = None
+        ctx = instrument.context()
+        success = True
+        for field in self._fields.values():
+            if not self._validate_field(field, extra, ctx):
+                success = False
+        return success
+
+    def _validate_field(self, field, extra, ctx):
+        name = field.short_name
+        started = instrument.start()
+        try:
+            return field.validate(self, extra.get(name, ()))
+        finally:
+            instrument.record(
+                started,
+                'csrf' if name == 'csrf_token' else 'validation',
+                self,
+                name,
+                ctx
+            )
+
     def setup_errors(self, config):
+        """
+        Wrap every field's widget so that its validation errors (if any) are
+        rendered alongside it.
+
+        :param config: error markup configuration, as accepted by the
+                       ``error_cfg`` argument to ``pecan_wtforms.with_form``.
+        """
+        started = instrument.start()
+        options = widget_options(config)
+        for f in self._fields.itervalues():
+            f.widget = error_widget(f.widget, options)
+        instrument.record(started, 'errors', self)
+
+    def insert_error_markup(self):
+        """
+        When this form was created with ``auto_insert_errors``, wrap the
+        widgets of fields which currently have errors.  Forms without errors
+        are left untouched.
+
+        It's called when ``validate()`` fails and, for forms built by
+        ``with_form`` or ``with_forms``, after the controller returns and
+        before an internal redirect to the error handler.  Call it after
+        adding errors to a form by hand at any other time.
+        """
+        options = self._error_options
+        if options is None:
+            return
+        started = instrument.start()
         for f in self._fields.itervalues():
-            f.widget = ErrorMarkupWidget(f.widget, **config)
+            if f.errors and not isinstance(f.widget, ErrorMarkupWidget):
+                f.widget = error_widget(f.widget, options)
+        instrument.record(started, 'errors', self)
+
+    def iter_render(self, fields=None):
+        """
+        Yield the form's HTML (see :meth:`render`) in unicode chunks, as
+        they're rendered.  See :meth:`stream` to send them as a response
+        body.
+        """
+        if instrument.enabled:
+            # The chunks may be rendered after the request has been handled
+            # (see :meth:`stream`), so its route is looked up now
+            return self._iter_render_timed(fields, instrument.context())
+        return iter_render(self, fields)
+
+    def stream(self, fields=None):
+        """
+        Stream the form's HTML (see :meth:`iter_render`), encoded in the
+        response's charset, as the body of the current Pecan response, and
+        return the response (for the controller to return), e.g.::
+
+            @expose()
+            @with_form(SignupForm)
+            def signup(self):
+                return request.pecan['form'].stream()
+
+        The HTML is rendered as the response is sent, after the controller
+        and Pecan's hooks have returned, so each chunk is rendered with the
+        request's (saved) state, and the form mustn't be changed (or reused)
+        until the response has been closed.
+        """
+        charset = response.charset or 'utf-8'
+        chunks = validation.iter_with_state(
+            validation.capture_state(), self.iter_render(fields)
+        )
+        response.app_iter = (chunk.encode(charset) for chunk in chunks)
+        return response
+
+    def _iter_render_timed(self, fields, ctx):
+        # Only the time spent rendering (not waiting for the consumer)
+        chunks = iter_render(self, fields)
+        seconds = 0.0
+        while True:
+            started = instrument.timer()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            finally:
+                seconds += instrument.timer() - started
+            yield chunk
+        instrument.add(seconds, 'render', self, ctx=ctx)
+
+    def render(self, fields=None):
+        """
+        Render the whole form (or only the fields named in ``fields``),
+        including any error markup, into a single string: each field's
+        label and widget (or only the widget, for hidden fields), one field
+        per line.
+
+        The output is identical to rendering each field individually, but
+        error markup isn't concatenated onto every field's HTML first.
+        """
+        started = instrument.start()
+        html = HTMLString(u''.join(iter_render(self, fields)))
+        instrument.record(started, 'render', self)
+        return html
 
     def process(self, formdata=None, obj=None, **kw):
         if formdata is None:
             if hasattr(self, '_validation_original_data'):
                 formdata = self._validation_original_data
-        super(Form, self).process(formdata, obj, **kw)
+        # Kept for ``has_field_data()`` (e.g. in the fragment cache), which
+        # is only worth scanning the fields for when it's asked
+        self._formdata = formdata
+        started = instrument.start()
+        sampler = profiler.current()
+        if sampler is None:
+            super(Form, self).process(formdata, obj, **kw)
+        else:
+            restore = sampler.wrap_filters(self)
+            try:
+                super(Form, self).process(formdata, obj, **kw)
+            finally:
+                restore()
+        instrument.record(started, 'process', self)
 
 
 class SecureForm(Form):
     """
     A form that includes validation for a cookie-based CSRF token.
+
+    By default, the form's token is a random value which must match the
+    client's CSRF cookie.  When ``CSRF_SIGNING_KEYS`` is set, the token is
+    instead an HMAC signature (over the time it was issued and the random
+    value in the client's cookie), which any process that shares the keys
+    can verify without shared state, e.g.::
+
+        class SignupForm(pecan_wtforms.SecureForm):
+            SECRET_KEY = 'signup'
+            CSRF_SIGNING_KEYS = [conf.csrf.new_key, conf.csrf.old_key]
+
+    The first key signs new tokens; every key in the list is accepted, so
+    keys can be rotated by prepending a new one (and dropping the oldest
+    once its tokens have expired).
+
+    The CSRF cookie is set whenever a form is created, which makes every
+    page with a form uncacheable.  Setting ``CSRF_COOKIE_RENEW_WINDOW``
+    limits this to the (rare) responses where the cookie is missing or
+    about to expire, and forms created with ``'set_cookie': False`` in their
+    ``csrf_context`` (see the ``csrf_cookie`` argument to
+    ``pecan_wtforms.with_form``) never set it.  In the latter case, the
+    form's token is empty unless the client already has a cookie, which must
+    be issued by some other response (e.g., one that renders the form
+    normally).
     """
 
+    #: A list of secret keys used to sign stateless CSRF tokens, or ``None``
+    #: to compare the token with the CSRF cookie directly.
+    CSRF_SIGNING_KEYS = None
+
+    #: The number of seconds a signed CSRF token is valid for.
+    CSRF_TOKEN_MAX_AGE = 60 * 60 * 24
+
+    #: The number of seconds the CSRF cookie lasts for.
+    CSRF_COOKIE_MAX_AGE = 60 * 60 * 24 * 7 * 52  # one year
+
+    #: When set, the CSRF cookie records when it was issued, and is only
+    #: re-issued when it's due to expire within this many seconds (rather
+    #: than on every request), so most responses carry no ``Set-Cookie``.
+    CSRF_COOKIE_RENEW_WINDOW = None
+
+    #: Origins (other than the request's own) from which unsafe requests
+    #: are accepted, e.g., ``['https://example.com', 'https://*.example.com',
+    #: 'http://example.com:8080']``.  See
+    #: ``pecan_wtforms.origins.OriginMatcher``.
+    TRUSTED_ORIGINS = None
+
+    _csrf_nonce = None
+
     def same_origin(self, url1, url2):
         """
         Checks if two URLs are 'same-origin'
         """
-        p1, p2 = urlparse.urlparse(url1), urlparse.urlparse(url2)
-        return (p1.scheme, p1.hostname, p1.port) == \
-                (p2.scheme, p2.hostname, p2.port)
+        origin = parse_origin(url1)
+        return origin is not None and origin == parse_origin(url2)
+
+    def trusted_origin(self, url):
+        """
+        Checks if a URL belongs to one of the form's ``TRUSTED_ORIGINS``
+        """
+        origin = parse_origin(url)
+        return origin is not None and \
+            get_origin_matcher(self.__class__).matches(origin)
 
     def generate_csrf_token(self, _):
         """
         Return the current authentication token, creating a cookie if it
         doesn't already exist.
+
+        When ``CSRF_COOKIE_RENEW_WINDOW`` is ``None``, the cookie is set on
+        every call (renewing its expiry timer).  Otherwise, it's only set
+        when it's missing or due to expire within the window.  When the
+        ``csrf_context`` contains ``'set_cookie': False``, the cookie is
+        never set.
+
+        Forms sharing a ``'tokens'`` dictionary in their ``csrf_context``
+        (see ``pecan_wtforms.with_forms``) share one cookie value (so the
+        cookie is set at most once) and, given the same signing key, one
+        token.
         """
         key = self.SECRET_KEY
+        tokens = self.csrf_context.get('tokens')
+        if tokens is not None:
+            signing_key = self.CSRF_SIGNING_KEYS[0] \
+                if self.CSRF_SIGNING_KEYS else None
+            shared = tokens.get((key, signing_key))
+            if shared is None:
+                shared = tokens[(key, signing_key)] = (
+                    self._generate_csrf_token(key, tokens),
+                    self._csrf_nonce
+                )
+            token, self._csrf_nonce = shared
+            return token
+        return self._generate_csrf_token(key)
+
+    def _generate_csrf_token(self, key, tokens=None):
         request = self.csrf_context['request']
         response = self.csrf_context['response']
+        now = int(time.time())
+        set_cookie = self.csrf_context.get('set_cookie', True)
 
-        if key in request.cookies:
-            value = request.cookies[key]
+        if tokens is not None and key in tokens:
+            # Another form has already read (or set) the cookie
+            value = tokens[key]
+            set_cookie = False
         else:
-            value = _get_new_csrf_value()
+            value, issued = self.parse_csrf_cookie(request.cookies.get(key))
+            if value is None and set_cookie:
+                value = _get_new_csrf_value()
+            if tokens is not None:
+                tokens[key] = value
+
+        if value is None:
+            # No cookie, and we may not issue one
+            return ''
+
+        if set_cookie and self.csrf_cookie_expiring(issued, now):
+            if self.CSRF_COOKIE_RENEW_WINDOW is not None:
+                cookie = '%s.%d' % (value, now)
+            else:
+                cookie = value
+            self.set_cookie(
+                response,
+                key,
+                cookie,
+                max_age=self.CSRF_COOKIE_MAX_AGE,
+                secure=request.scheme == 'https'
+            )
 
-        # Always set the CSRF cookie to renew the expiry timer.
-        self.set_cookie(
-            response,
-            key,
-            value,
-            max_age=60 * 60 * 24 * 7 * 52,  # one year
-            secure=request.scheme == 'https'
-        )
+        if self.CSRF_SIGNING_KEYS:
+            self._csrf_nonce = value
+            return self.sign_csrf_token(
+                value,
+                now,
+                self.CSRF_SIGNING_KEYS[0]
+            )
         return value
 
+    def parse_csrf_cookie(self, cookie):
+        """
+        Split a CSRF cookie into its token and issue time (``None`` for
+        cookies set without one).
+        """
+        if not cookie:
+            return None, None
+        value, _, issued = cookie.partition('.')
+        try:
+            return value, int(issued)
+        except ValueError:
+            return value, None
+
+    def csrf_cookie_expiring(self, issued, now):
+        """
+        Return True if a CSRF cookie issued at ``issued`` should be
+        (re-)issued.
+        """
+        window = self.CSRF_COOKIE_RENEW_WINDOW
+        if window is None or issued is None:
+            return True
+        return now >= issued + self.CSRF_COOKIE_MAX_AGE - window
+
+    def sign_csrf_token(self, nonce, timestamp, key):
+        """
+        Return a signed token, ``<timestamp>.<signature>``, for a client's
+        CSRF cookie value (``nonce``).
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        message = '%s.%d' % (nonce, timestamp)
+        return '%d.%s' % (
+            timestamp,
+            hmac.new(key, message.encode('utf-8'), sha256).hexdigest()
+        )
+
+    def verify_csrf_token(self, field):
+        """
+        Verify a signed token against every key in ``CSRF_SIGNING_KEYS``.
+        """
+        if self._csrf_nonce is None:
+            raise ValidationError(field.gettext(REASON_BAD_TOKEN))
+
+        timestamp = field.data.split('.', 1)[0]
+        try:
+            timestamp = int(timestamp)
+        except ValueError:
+            raise ValidationError(field.gettext(REASON_BAD_TOKEN))
+
+        for key in self.CSRF_SIGNING_KEYS:
+            expected = self.sign_csrf_token(self._csrf_nonce, timestamp, key)
+            if constant_time_compare(expected, field.data):
+                break
+        else:
+            raise ValidationError(field.gettext(REASON_BAD_TOKEN))
+
+        if time.time() - timestamp > self.CSRF_TOKEN_MAX_AGE:
+            raise ValidationError(field.gettext(REASON_EXPIRED_TOKEN))
+
     def set_cookie(self, response, key, value, **kwargs):
         response.set_cookie(
             key,
@@ -171,10 +824,11 @@ class SecureForm(Form):
 
             #
             # If the hostname of the referer and the requested resource
-            # don't match...
+            # don't match (and the referer isn't otherwise trusted)...
             #
             origin = '%s://%s/' % (request.scheme, request.host)
-            if not self.same_origin(referer, origin):
+            if not self.same_origin(referer, origin) and \
+                    not self.trusted_origin(referer):
                 raise ValidationError(field.gettext(
                     REASON_BAD_REFERER % (referer, origin)
                 ))
@@ -185,6 +839,13 @@ class SecureForm(Form):
             if not field.data:
                 raise ValidationError(field.gettext(REASON_MISSING_TOKEN))
 
+            #
+            # If the CSRF token is signed, but the signature (or timestamp)
+            # isn't valid...
+            #
+            if self.CSRF_SIGNING_KEYS:
+                return self.verify_csrf_token(field)
+
             #
             # If the CSRF token in the session doesn't match the value
             # included in the request...
@@ -0,0 +1,227 @@
+"""
+Form data from sources other than ``request.params``.
+
+:class:`IndexedFormData` flattens a multidict (e.g., ``request.POST``) once
+into a dictionary of lists, indexed by prefix, and :class:`DictFormData`
+adapts a decoded JSON document (or any dictionary) the same way.  Both
+provide the multidict interface WTForms expects as ``formdata``.
+"""
+try:
+    import ujson as json
+except ImportError:  # pragma: nocover
+    try:
+        import simplejson as json
+    except ImportError:
+        import json
+
+from wtforms.fields import FieldList
+from wtforms.fields.core import UnboundField
+
+__all__ = ['IndexedFormData', 'DictFormData', 'IndexedFieldList',
+           'indexed_unbound', 'loads', 'dumps']
+
+#: Decodes JSON, using the fastest library available (``ujson``,
+#: ``simplejson`` or the standard library's ``json``)
+loads = json.loads
+
+#: Encodes JSON, using the same library as :func:`loads`
+dumps = json.dumps
+
+
+def _flatten(data, prefix, separator, items):
+    for key, value in data.items():
+        name = prefix + key
+        if isinstance(value, basestring):
+            # The common case (e.g., a CSV row)
+            items.setdefault(name, []).append(value)
+        elif isinstance(value, dict):
+            # e.g., a ``FormField``'s sub-form
+            _flatten(value, name + separator, separator, items)
+        elif isinstance(value, list):
+            # Indexed, e.g., for a ``FieldList`` (of ``FormField``s, or of
+            # simple fields) and, for a list of values, also as multiple
+            # values for one field (e.g., a ``SelectMultipleField``)
+            values = []
+            nested = False
+            for i, entry in enumerate(value):
+                if isinstance(entry, dict):
+                    nested = True
+                    _flatten(entry, '%s%s%d%s' % (
+                        name, separator, i, separator
+                    ), separator, items)
+                elif entry is not None and entry is not False:
+                    entry = _value(entry)
+                    values.append(entry)
+                    items.setdefault(
+                        '%s%s%d' % (name, separator, i), []
+                    ).append(entry)
+            if values and not nested:
+                items.setdefault(name, []).extend(values)
+        elif value is not None and value is not False:
+            items.setdefault(name, []).append(_value(value))
+
+
+def _value(value):
+    # Values are passed to fields as text, as they would be from an HTML
+    # form: e.g., ``DecimalField`` doesn't see a float, and ``true`` is sent
+    # as a checked checkbox would be (``false``, like an unchecked one, is
+    # left out by the callers, since ``BooleanField`` is True for any data).
+    if value is True:
+        return u'y'
+    if isinstance(value, float):
+        # ``unicode()`` rounds to 12 significant digits; ``repr()`` is the
+        # shortest string that round-trips
+        return unicode(repr(value))
+    if isinstance(value, (int, long)):
+        return unicode(value)
+    return value
+
+
+class IndexedFormData(object):
+    """
+    WTForms ``formdata`` built once from ``(name, value)`` pairs, e.g.::
+
+        IndexedFormData(request.POST.items())
+
+    Every lookup is a dictionary lookup (rather than a scan of WebOb's
+    ``MultiDict``, or of both of ``request.params``' dictionaries), and the
+    names under a prefix (:meth:`prefixed`) or the indices of a
+    ``FieldList`` (:meth:`indices`) are found without scanning every name.
+    The prefix index is built the first time it's needed.
+    """
+
+    def __init__(self, items=(), separator='-'):
+        self.separator = separator
+        self._values = {}
+        self._index = None
+        for name, value in items:
+            self._values.setdefault(name, []).append(value)
+
+    def getlist(self, name):
+        return list(self._values.get(name, ()))
+
+    getall = getlist
+
+    def get(self, name, default=None):
+        values = self._values.get(name)
+        return values[-1] if values else default
+
+    def prefixed(self, prefix):
+        """
+        Return the names which start with ``prefix`` and the separator
+        (e.g., ``address-city`` and ``address-zip``, for ``address``).
+        """
+        return list(self._get_index()[0].get(prefix, ()))
+
+    def indices(self, prefix):
+        """
+        Return the sorted, distinct indices of the names which start with
+        ``prefix``, the separator and a number (e.g., ``0`` and ``1``, for
+        ``items-0-sku`` and ``items-1``).
+        """
+        return list(self._get_index()[1].get(prefix, ()))
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            index = self._index = self._build_index()
+        return index
+
+    def _build_index(self):
+        separator = self.separator
+        width = len(separator)
+        names = {}
+        indices = {}
+        for name in self._values:
+            end = name.find(separator)
+            while end != -1:
+                prefix = name[:end]
+                names.setdefault(prefix, []).append(name)
+                start = end + width
+                end = name.find(separator, start)
+                segment = name[start:] if end == -1 else name[start:end]
+                if segment.isdigit():
+                    indices.setdefault(prefix, set()).add(int(segment))
+        return names, dict((k, sorted(v)) for k, v in indices.items())
+
+    def __getitem__(self, name):
+        values = self._values.get(name)
+        if not values:
+            raise KeyError(name)
+        return values[-1]
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class DictFormData(IndexedFormData):
+    """
+    Wraps a (decoded JSON) dictionary as WTForms ``formdata``.
+
+    Nested objects are flattened into prefixed field names (so
+    ``{"address": {"city": "Paris"}}`` provides ``address-city``, for a
+    ``FormField``), lists into indexed ones (``items-0-name`` and
+    ``tags-0``, for a ``FieldList``), and lists of values also into
+    multiple values for one field (``tags``, for a ``SelectMultipleField``).
+    ``null`` values (including those in lists) are treated as missing.
+    """
+
+    def __init__(self, data, separator='-'):
+        super(DictFormData, self).__init__(separator=separator)
+        _flatten(data, '', separator, self._values)
+
+
+class IndexedFieldList(FieldList):
+    """
+    A ``FieldList`` which finds its entries' indices with
+    :meth:`IndexedFormData.indices` (when its form data is indexed), rather
+    than by checking every name in the form data.
+
+    ``pecan_wtforms.Form`` binds plain ``FieldList`` fields this way, so
+    it's only needed for other ``wtforms.form.Form`` subclasses (or to
+    subclass).
+    """
+
+    def _extract_indices(self, prefix, formdata):
+        # Entries are always named ``<name>-<index>``
+        if getattr(formdata, 'separator', None) != '-':
+            return super(IndexedFieldList, self)._extract_indices(
+                prefix, formdata
+            )
+        return formdata.indices(prefix)
+
+
+#: Bound in place of a plain ``FieldList`` (see :func:`indexed_unbound`),
+#: and named like it, so its ``type`` is still ``'FieldList'``
+_PlainIndexedFieldList = type('FieldList', (IndexedFieldList,), {
+    '__module__': __name__
+})
+
+
+def indexed_unbound(unbound_field):
+    """
+    Return an ``UnboundField`` which binds an :class:`IndexedFieldList` in
+    place of a plain ``FieldList`` (``pecan_wtforms.Form`` binds every
+    ``FieldList`` this way), or ``unbound_field`` itself for any other
+    field.
+    """
+    if type(unbound_field) is not UnboundField or \
+            unbound_field.field_class is not FieldList:
+        return unbound_field
+
+    indexed = unbound_field.__dict__.get('_indexed')
+    if indexed is None:
+        indexed = UnboundField(
+            _PlainIndexedFieldList,
+            *unbound_field.args,
+            **unbound_field.kwargs
+        )
+        indexed.creation_counter = unbound_field.creation_counter
+        unbound_field._indexed = indexed
+    return indexed
@@ -0,0 +1,162 @@
+"""
+A render cache for forms whose HTML is the same for every visitor, apart
+from their CSRF token.
+
+The first time a form (or a set of its fields) is rendered, the HTML is
+stored with a placeholder where the CSRF token goes; later renders of the
+same form class, prefix, defaults, choices and error configuration only
+substitute the current request's token, e.g.::
+
+    from pecan_wtforms.fragments import render
+
+    @expose('signup.html')
+    @with_form(SignupForm)
+    def signup(self):
+        return dict(signup_html=render(request.pecan['form']))
+
+Forms which were given form data, or which have errors, are always
+rendered from scratch.
+"""
+import binascii
+import os
+from cgi import escape
+
+from wtforms.widgets import HTMLString
+
+from . import instrument
+from .cache import LRUCache
+from .form import has_field_data, iter_render
+from .lazy import resolve
+from .plan import get_plan
+
+__all__ = ['FragmentCache', 'render', 'render_fields']
+
+#: Stands in for the CSRF token in cached HTML
+CSRF_PLACEHOLDER = 'pecan-wtforms-csrf-%s' % binascii.hexlify(os.urandom(8))
+
+
+def render_fields(form, names=None):
+    """
+    The default renderer: each field's label and widget (or only the widget,
+    for hidden fields), one field per line (see ``Form.render``).
+    """
+    return u''.join(iter_render(form, names))
+
+
+def _hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    hash(value)
+    return value
+
+
+class FragmentCache(object):
+    """
+    A bounded cache of rendered form HTML, keyed by everything (besides the
+    CSRF token) that can change it:
+
+    * the form class (and its fields, which invalidates the cache when the
+      class's fields change),
+    * the form's prefix,
+    * each field's default data, ``choices``, label and widget,
+    * the form's error markup configuration (``error_cfg``),
+    * the fields rendered, and the renderer used.
+
+    :param maxsize: the maximum number of rendered fragments kept.
+    """
+
+    def __init__(self, maxsize=256):
+        self.cache = LRUCache(maxsize)
+
+    def render(self, form, fields=None, renderer=render_fields):
+        """
+        Render ``form`` (or only the field names in ``fields``) by calling
+        ``renderer(form, fields)``, from the cache where possible.
+        """
+        form = resolve(form)
+        key = self.key(form, fields, renderer)
+        if key is None:
+            return HTMLString(renderer(form, fields))
+
+        parts = self.cache.get(key)
+        if parts is None:
+            parts = self.render_parts(form, fields, renderer)
+            self.cache.set(key, parts)
+
+        if len(parts) == 1:
+            return HTMLString(parts[0])
+        token = escape(form.csrf_token.current_token or u'', True)
+        return HTMLString(token.join(parts))
+
+    def render_parts(self, form, fields, renderer):
+        """
+        Render the form with a placeholder CSRF token, and split the output
+        around it.
+        """
+        csrf_token = form._fields.get('csrf_token')
+        if csrf_token is None or csrf_token.current_token is None:
+            return (renderer(form, fields),)
+
+        token = csrf_token.current_token
+        csrf_token.current_token = CSRF_PLACEHOLDER
+        try:
+            html = renderer(form, fields)
+        finally:
+            csrf_token.current_token = token
+        return tuple(html.split(CSRF_PLACEHOLDER))
+
+    def key(self, form, fields, renderer):
+        """
+        Return the cache key for rendering ``form``, or ``None`` if it
+        mustn't be cached.
+        """
+        if has_field_data(form, getattr(form, '_formdata', None)):
+            return None
+
+        state = []
+        for field in form:
+            if field.errors:
+                return None
+            if field.short_name == 'csrf_token':
+                # Forms without a token render it differently
+                state.append(field.current_token is None)
+                continue
+            state.append((
+                field.short_name,
+                field.data,
+                getattr(field, 'choices', None),
+                field.label.text,
+                field.widget
+            ))
+
+        try:
+            return _hashable((
+                get_plan(form.__class__),
+                form._prefix,
+                state,
+                getattr(form, '_error_options', None),
+                fields,
+                renderer
+            ))
+        except TypeError:
+            # unhashable data or choices
+            return None
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+
+default_cache = FragmentCache()
+instrument.register_cache('fragments', default_cache)
+
+
+def render(form, fields=None, renderer=render_fields):
+    """
+    Render ``form`` using the default :class:`FragmentCache`.
+    """
+    return default_cache.render(form, fields, renderer)
@@ -0,0 +1,234 @@
+"""
+Timing instrumentation for the stages of handling a form.
+
+Timings are sent to a pluggable sink, which by default (a
+:class:`NullSink`) discards them; the instrumented code then only pays for
+a couple of function calls per stage.  To collect them::
+
+    from pecan_wtforms import instrument
+
+    instrument.set_sink(instrument.MemorySink())     # or StatsdSink()
+    ...
+    instrument.get_sink().stats()
+
+The stages are:
+
+* ``construction`` - constructing a form (including ``process``),
+* ``process`` - processing form data,
+* ``csrf`` - validating the CSRF token,
+* ``validation`` - validating each (other) field,
+* ``errors`` - setting up error markup widgets,
+* ``render`` - ``Form.render()`` and ``Form.iter_render()``,
+* ``redirect`` - ``redirect_to_handler()`` (and direct error handlers).
+
+Each timing is recorded per form class and route (the controller handling
+the request, e.g. ``RootController.save``), and per field for
+``validation`` and ``csrf``.  During a request, timings are also appended
+to ``request.environ['pecan_wtforms.timings']`` as ``(stage, form, field,
+seconds)`` tuples, for logging.
+
+The hit rates of the shared caches (formatted error markup, the default
+fragment cache and parsed ``Referer`` origins) are reported by
+:func:`cache_stats`, whatever the sink.
+"""
+import re
+import socket
+import threading
+import time
+
+from pecan.core import state
+
+__all__ = ['NullSink', 'MemorySink', 'StatsdSink', 'set_sink', 'get_sink',
+           'register_cache', 'cache_stats']
+
+#: The ``environ`` key listing the timings recorded during a request
+ENVIRON_KEY = 'pecan_wtforms.timings'
+
+STAGES = ('construction', 'process', 'csrf', 'validation', 'errors',
+          'render', 'redirect')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class NullSink(object):
+    """
+    Discards timings (and disables instrumentation entirely).
+    """
+
+    enabled = False
+
+    def record(self, stage, form, route, field, seconds):
+        pass
+
+
+class MemorySink(object):
+    """
+    Aggregates timings in memory, by stage, form class, route and field.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    def record(self, stage, form, route, field, seconds):
+        key = (stage, form, route, field)
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                self.timings[key] = [1, seconds, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                if seconds < timing[2]:
+                    timing[2] = seconds
+                if seconds > timing[3]:
+                    timing[3] = seconds
+
+    def stats(self):
+        """
+        Return a dictionary mapping ``(stage, form, route, field)`` to a
+        dictionary of ``count``, ``total``, ``mean``, ``min`` and ``max``
+        (in seconds).
+        """
+        with self._lock:
+            timings = [(k, list(v)) for k, v in self.timings.items()]
+        return dict(
+            (key, {
+                'count': count,
+                'total': total,
+                'mean': total / count,
+                'min': low,
+                'max': high
+            })
+            for key, (count, total, low, high) in timings
+        )
+
+    def clear(self):
+        with self._lock:
+            self.timings.clear()
+
+
+class StatsdSink(object):
+    """
+    Sends each timing to a statsd server as a UDP packet, e.g.,
+    ``pecan_wtforms.validation.SignupForm.RootController_save.email:0.120|ms``.
+    Packets which can't be sent are dropped.
+    """
+
+    enabled = True
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='pecan_wtforms'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def metric(self, stage, form, route, field):
+        parts = [self.prefix, stage, form, route or 'none']
+        if field is not None:
+            parts.append(field)
+        return '.'.join(_metric_part(p) for p in parts)
+
+    def record(self, stage, form, route, field, seconds):
+        packet = '%s:%.3f|ms' % (
+            self.metric(stage, form, route, field), seconds * 1000
+        )
+        try:
+            self.socket.sendto(packet.encode('utf-8'), self.address)
+        except socket.error:
+            pass
+
+
+def _metric_part(value):
+    return re.sub(r'[^\w-]', '_', value)
+
+
+_sink = NullSink()
+
+#: True when the current sink collects timings
+enabled = False
+
+
+def set_sink(sink):
+    """
+    Send timings to ``sink`` (or, when ``sink`` is ``None``, discard them).
+    """
+    global _sink, enabled
+    _sink = sink if sink is not None else NullSink()
+    enabled = _sink.enabled
+
+
+def get_sink():
+    return _sink
+
+
+_caches = {}
+
+
+def register_cache(name, cache):
+    """
+    Report ``cache`` (anything with a ``stats()`` method, like
+    ``pecan_wtforms.cache.LRUCache``) from :func:`cache_stats` as ``name``.
+    """
+    _caches[name] = cache
+
+
+def cache_stats():
+    """
+    Return a dictionary mapping the name of each registered cache (e.g.,
+    ``error_markup``) to its ``stats()``: ``size``, ``hits``, ``misses``
+    and ``hit_rate``.
+    """
+    return dict((name, cache.stats()) for name, cache in _caches.items())
+
+
+def start():
+    """
+    Return the start time of a stage, or ``None`` when instrumentation is
+    disabled.
+    """
+    if enabled:
+        return timer()
+
+
+def context():
+    """
+    Return the current request's route and ``environ`` (both ``None``
+    outside of a request).  Pass it to :func:`record` from other threads.
+    """
+    request = getattr(state, 'request', None)
+    if request is None:
+        return None, None
+    controller = getattr(state, 'controller', None)
+    route = None
+    if controller is not None:
+        route = getattr(controller, '__name__', None)
+        cls = getattr(controller, 'im_class', None)
+        if cls is not None:
+            route = '%s.%s' % (cls.__name__, route)
+    return route, request.environ
+
+
+def record(started, stage, form, field=None, ctx=None):
+    """
+    Record the time since ``started`` (see :func:`start`) for ``stage`` of
+    handling ``form`` (an instance or class).
+    """
+    if started is not None:
+        add(timer() - started, stage, form, field, ctx)
+
+
+def add(seconds, stage, form, field=None, ctx=None):
+    """
+    Record ``seconds`` spent on ``stage`` of handling ``form``.
+    """
+    if not isinstance(form, type):
+        form = type(form)
+    form = form.__name__
+    route, environ = ctx or context()
+    if environ is not None:
+        environ.setdefault(ENVIRON_KEY, []).append(
+            (stage, form, field, seconds)
+        )
+    _sink.record(stage, form, route, field, seconds)
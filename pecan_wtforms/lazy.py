@@ -0,0 +1,74 @@
+__all__ = ['LazyForm', 'is_built', 'resolve']
+
+
+class LazyForm(object):
+    """
+    A stand-in for a form instance that isn't constructed until it's first
+    used.
+
+    ``with_form(..., lazy=True)`` injects a ``LazyForm`` for safe (GET/HEAD)
+    requests so that controllers which never touch the form (because they
+    redirect, return early or render from a cache) don't pay for building it,
+    and ``SecureForm`` doesn't generate a CSRF token or set its cookie.
+    """
+
+    def __init__(self, formcls, factory):
+        object.__setattr__(self, '_lazy_formcls', formcls)
+        object.__setattr__(self, '_lazy_factory', factory)
+        object.__setattr__(self, '_lazy_form', None)
+
+    @property
+    def __class__(self):
+        # Allows ``isinstance(lazy_form, SomeForm)`` without building the form
+        return self._lazy_formcls
+
+    def _resolve(self):
+        form = self._lazy_form
+        if form is None:
+            form = self._lazy_factory()
+            object.__setattr__(self, '_lazy_form', form)
+        return form
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._resolve(), name)
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __contains__(self, name):
+        return name in self._resolve()
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+    def __delitem__(self, name):
+        del self._resolve()[name]
+
+    def __repr__(self):
+        if self._lazy_form is None:
+            return '<LazyForm(%s) (unbuilt)>' % self._lazy_formcls.__name__
+        return repr(self._lazy_form)
+
+
+def resolve(form):
+    """
+    Return the real form behind ``form``, constructing it if ``form`` is an
+    unbuilt :class:`LazyForm`.
+    """
+    if type(form) is LazyForm:
+        return form._resolve()
+    return form
+
+
+def is_built(form):
+    """
+    Return False if ``form`` is a :class:`LazyForm` which hasn't been
+    constructed yet.
+    """
+    return type(form) is not LazyForm or form._lazy_form is not None
@@ -0,0 +1,461 @@
+"""
+Incremental ``multipart/form-data`` parsing, so that large uploads are never
+held in memory.
+
+WebOb (and so Pecan, which reads ``request.params`` before calling a
+controller) parses the whole request body up front.
+:class:`StreamingFormDataMiddleware` parses multipart bodies *before* Pecan
+sees them, reading fixed-size chunks, spooling file parts to temporary files
+once they grow past a threshold and enforcing per-field size limits as data
+arrives.  ``with_form`` picks up the parsed data automatically::
+
+    app = StreamingFormDataMiddleware(app, spool_threshold=64 * 1024,
+                                      limits={'avatar': 2 * 1024 * 1024})
+"""
+import os
+import tempfile
+from cgi import parse_header
+from io import BytesIO
+
+from webob.multidict import MultiDict
+
+__all__ = ['StreamingFormData', 'StreamingFormDataMiddleware',
+           'UploadedFile', 'UploadTooLarge', 'MalformedBody', 'parse']
+
+#: The ``environ`` key at which the middleware stores parsed form data
+ENVIRON_KEY = 'pecan_wtforms.formdata'
+
+#: The ``environ`` key at which WebOb caches a request's parsed body
+WEBOB_POST_KEY = 'webob._parsed_post_vars'
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_THRESHOLD = 64 * 1024
+MAX_HEADER_SIZE = 16 * 1024
+
+#: The default maximum size of a (non-file) field's value, which is held in
+#: memory
+MAX_TEXT_SIZE = 1024 * 1024
+
+
+class MalformedBody(ValueError):
+    """
+    Raised when a request body isn't valid ``multipart/form-data``.
+    """
+
+
+class UploadTooLarge(ValueError):
+    """
+    Raised as soon as a part of a request body exceeds its size limit.
+    """
+
+    def __init__(self, name, limit):
+        super(UploadTooLarge, self).__init__(
+            'Field %r exceeds the upload limit of %d bytes.' % (name, limit)
+        )
+        self.name = name
+        self.limit = limit
+
+
+class UploadedFile(object):
+    """
+    A file uploaded as part of a multipart request.  Small files are kept in
+    memory; larger files are spooled to a temporary file on disk (in which
+    case ``path`` is its location).
+
+    The temporary file is removed when the upload is closed (which the
+    middleware does when the request is finished).
+    """
+
+    def __init__(self, name, filename, content_type,
+                 spool_threshold=SPOOL_THRESHOLD, spool_dir=None):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.path = None
+        self.file = BytesIO()
+        self.spool_threshold = spool_threshold
+        self.spool_dir = spool_dir
+
+    # ``cgi.FieldStorage`` compatibility
+    @property
+    def type(self):
+        return self.content_type
+
+    def write(self, data):
+        if self.path is None and \
+                self.size + len(data) > self.spool_threshold:
+            self._rollover()
+        self.file.write(data)
+        self.size += len(data)
+
+    def _rollover(self):
+        fd, self.path = tempfile.mkstemp(
+            prefix='pecan-wtforms-', dir=self.spool_dir
+        )
+        spooled = os.fdopen(fd, 'w+b')
+        spooled.write(self.file.getvalue())
+        self.file = spooled
+
+    def finish(self):
+        self.file.flush()
+        self.file.seek(0)
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def close(self):
+        self.file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __repr__(self):
+        return '<UploadedFile %r (%d bytes)>' % (self.filename, self.size)
+
+
+class TextPart(object):
+
+    def __init__(self, name, charset):
+        self.name = name
+        self.charset = charset
+        self.buffer = BytesIO()
+        self.size = 0
+
+    def write(self, data):
+        self.buffer.write(data)
+        self.size += len(data)
+
+    def finish(self):
+        pass
+
+    @property
+    def value(self):
+        return self.buffer.getvalue().decode(self.charset, 'replace')
+
+
+class StreamingFormData(object):
+    """
+    An ordered multidict of parsed form values (unicode strings) and
+    :class:`UploadedFile` instances, usable as WTForms ``formdata``.
+    """
+
+    def __init__(self, items=()):
+        self._items = []
+        self._values = {}
+        for name, value in items:
+            self.add(name, value)
+
+    def add(self, name, value):
+        self._items.append((name, value))
+        self._values.setdefault(name, []).append(value)
+
+    def getlist(self, name):
+        return list(self._values.get(name, ()))
+
+    getall = getlist
+
+    def get(self, name, default=None):
+        values = self._values.get(name)
+        return values[-1] if values else default
+
+    def items(self):
+        return list(self._items)
+
+    def files(self):
+        return [v for _, v in self._items if isinstance(v, UploadedFile)]
+
+    def close(self):
+        for upload in self.files():
+            upload.close()
+
+    def __getitem__(self, name):
+        values = self._values.get(name)
+        if not values:
+            raise KeyError(name)
+        return values[-1]
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class _Reader(object):
+
+    def __init__(self, fp, length, chunk_size):
+        self.fp = fp
+        self.remaining = length
+        self.chunk_size = chunk_size
+
+    def read(self):
+        size = self.chunk_size
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+            if size <= 0:
+                return b''
+        data = self.fp.read(size)
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return data
+
+
+def parse(fp, boundary, content_length=None, limits=None,
+          max_part_size=None, spool_threshold=SPOOL_THRESHOLD,
+          spool_dir=None, charset='utf-8', chunk_size=CHUNK_SIZE,
+          max_text_size=MAX_TEXT_SIZE):
+    """
+    Incrementally parse a ``multipart/form-data`` body from ``fp``, returning
+    a :class:`StreamingFormData`.
+
+    :param boundary: the multipart boundary (from the ``Content-Type``).
+    :param content_length: the number of bytes to read from ``fp``, or
+                           ``None`` to read until EOF.
+    :param limits: a dictionary mapping field names to the maximum size of
+                   their value, in bytes.
+    :param max_part_size: the maximum size for fields without a specific
+                          limit.
+    :param spool_threshold: uploads larger than this are spooled to disk.
+    :param max_text_size: the maximum size for non-file fields without any
+                          other limit (they aren't spooled to disk), or
+                          ``None`` for no limit.
+
+    Raises :class:`UploadTooLarge` as soon as a limit is exceeded, and
+    :class:`MalformedBody` for invalid bodies.
+    """
+    limits = limits or {}
+    reader = _Reader(fp, content_length, chunk_size)
+    delimiter = b'--' + boundary
+    separator = b'\r\n' + delimiter
+    formdata = StreamingFormData()
+
+    try:
+        buf = _read_until(reader, b'', delimiter, MAX_HEADER_SIZE)
+        buf = buf[buf.index(delimiter) + len(delimiter):]
+
+        while True:
+            buf = _fill(reader, buf, 2)
+            if buf[:2] == b'--':
+                break
+            if buf[:2] != b'\r\n':
+                raise MalformedBody('Invalid multipart boundary.')
+
+            buf = _read_until(reader, buf[2:], b'\r\n\r\n', MAX_HEADER_SIZE)
+            end = buf.index(b'\r\n\r\n')
+            part = _make_part(buf[:end], spool_threshold, spool_dir, charset)
+            buf = buf[end + 4:]
+
+            limit = limits.get(part.name, max_part_size)
+            if limit is None and isinstance(part, TextPart):
+                limit = max_text_size
+            formdata.add(part.name, part)
+            buf = _stream_body(reader, buf, separator, part, limit)
+            part.finish()
+    except Exception:
+        _close_parts(formdata)
+        raise
+
+    return StreamingFormData(
+        (name, part.value if isinstance(part, TextPart) else part)
+        for name, part in formdata.items()
+    )
+
+
+def _fill(reader, buf, size):
+    while len(buf) < size:
+        data = reader.read()
+        if not data:
+            raise MalformedBody('Unexpected end of multipart body.')
+        buf += data
+    return buf
+
+
+def _read_until(reader, buf, marker, max_size):
+    while marker not in buf:
+        if len(buf) > max_size:
+            raise MalformedBody('Multipart headers are too large.')
+        data = reader.read()
+        if not data:
+            raise MalformedBody('Unexpected end of multipart body.')
+        buf += data
+    return buf
+
+
+def _make_part(header_block, spool_threshold, spool_dir, charset):
+    headers = {}
+    for line in header_block.split(b'\r\n'):
+        if b':' in line:
+            key, value = line.split(b':', 1)
+            headers[key.strip().lower()] = value.strip()
+
+    disposition, params = parse_header(
+        headers.get(b'content-disposition', b'')
+    )
+    if disposition != 'form-data' or 'name' not in params:
+        raise MalformedBody('Invalid Content-Disposition for a form field.')
+
+    name = params['name'].decode(charset, 'replace')
+    filename = params.get('filename')
+    if filename:
+        return UploadedFile(
+            name,
+            filename.decode(charset, 'replace'),
+            headers.get(b'content-type', 'application/octet-stream'),
+            spool_threshold,
+            spool_dir
+        )
+    return TextPart(name, charset)
+
+
+def _stream_body(reader, buf, separator, part, limit):
+    # Keep enough of the buffer that a separator split across two chunks is
+    # still found.
+    keep = len(separator) - 1
+    while True:
+        index = buf.find(separator)
+        if index != -1:
+            _write(part, buf[:index], limit)
+            return buf[index + len(separator):]
+        if len(buf) > keep:
+            _write(part, buf[:-keep], limit)
+            buf = buf[-keep:]
+        data = reader.read()
+        if not data:
+            raise MalformedBody('Unexpected end of multipart body.')
+        buf += data
+
+
+def _write(part, data, limit):
+    if limit is not None and part.size + len(data) > limit:
+        raise UploadTooLarge(part.name, limit)
+    part.write(data)
+
+
+def _close_parts(formdata):
+    for _, part in formdata.items():
+        if isinstance(part, UploadedFile):
+            part.close()
+
+
+class StreamingFormDataMiddleware(object):
+    """
+    WSGI middleware which parses ``multipart/form-data`` request bodies
+    incrementally, before Pecan (and WebOb) read them.
+
+    The parsed :class:`StreamingFormData` is stored in the WSGI environ (and
+    used by ``with_form`` in place of ``request.params``), and the request
+    body is replaced with an empty one.  The parsed fields are also handed
+    to WebOb as the request's (already parsed) ``POST``, so ``request.POST``,
+    ``request.params`` and controller arguments are unchanged for every
+    other controller, with each upload as an :class:`UploadedFile`.
+    Uploaded files are closed (and any temporary files removed) when the
+    response has been sent.
+
+    Requests with a part larger than its limit are rejected with
+    ``413 Request Entity Too Large`` as soon as the limit is reached.
+
+    :param app: the WSGI application to wrap.
+    :param spool_threshold: uploads larger than this are spooled to disk.
+    :param limits: a dictionary mapping field names to their maximum size,
+                   in bytes.
+    :param max_part_size: the maximum size for fields without a specific
+                          limit.
+    :param spool_dir: the directory for temporary files (defaults to the
+                      system's temporary directory).
+    :param max_text_size: the maximum size for non-file fields without any
+                          other limit, or ``None`` for no limit.
+    """
+
+    def __init__(self, app, spool_threshold=SPOOL_THRESHOLD, limits=None,
+                 max_part_size=None, spool_dir=None, chunk_size=CHUNK_SIZE,
+                 max_text_size=MAX_TEXT_SIZE):
+        self.app = app
+        self.spool_threshold = spool_threshold
+        self.limits = limits or {}
+        self.max_part_size = max_part_size
+        self.max_text_size = max_text_size
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+
+    def __call__(self, environ, start_response):
+        content_type, params = parse_header(environ.get('CONTENT_TYPE', ''))
+        if content_type != 'multipart/form-data' or 'boundary' not in params:
+            return self.app(environ, start_response)
+
+        if environ.get('wsgi.input_terminated'):
+            # The server ends the input at the end of the body (e.g., for a
+            # chunked request), so it's safe to read to EOF
+            length = None
+        else:
+            # Never read past ``CONTENT_LENGTH`` (PEP 3333); without one,
+            # the body is empty (and so, malformed)
+            try:
+                length = max(int(environ.get('CONTENT_LENGTH') or 0), 0)
+            except ValueError:
+                length = 0
+
+        try:
+            formdata = parse(
+                environ['wsgi.input'],
+                params['boundary'],
+                content_length=length,
+                limits=self.limits,
+                max_part_size=self.max_part_size,
+                spool_threshold=self.spool_threshold,
+                spool_dir=self.spool_dir,
+                chunk_size=self.chunk_size,
+                max_text_size=self.max_text_size
+            )
+        except UploadTooLarge as e:
+            return self.error(start_response, '413 Request Entity Too Large',
+                              str(e))
+        except MalformedBody as e:
+            return self.error(start_response, '400 Bad Request', str(e))
+
+        environ[ENVIRON_KEY] = formdata
+        environ['wsgi.input'] = BytesIO()
+        environ['CONTENT_LENGTH'] = '0'
+        environ['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
+        # WebOb uses this for as long as the body isn't replaced
+        environ[WEBOB_POST_KEY] = (
+            MultiDict(formdata.items()),
+            environ['wsgi.input']
+        )
+
+        try:
+            result = self.app(environ, start_response)
+        except Exception:
+            formdata.close()
+            raise
+        return ClosingIterator(result, formdata.close)
+
+    def error(self, start_response, status, message):
+        start_response(status, [
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', str(len(message))),
+            ('Connection', 'close')
+        ])
+        return [message]
+
+
+class ClosingIterator(object):
+
+    def __init__(self, app_iter, close):
+        self.app_iter = app_iter
+        self._close = close
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self._close()
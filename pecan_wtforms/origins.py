@@ -0,0 +1,118 @@
+"""
+Matching ``Referer`` headers against a form's trusted origins.
+
+A ``SecureForm``'s ``TRUSTED_ORIGINS`` are compiled once per class into an
+:class:`OriginMatcher`, and parsed ``Referer`` origins are kept in a small,
+bounded cache, so that checking a request is (usually) a couple of hash
+lookups rather than URL parsing.
+"""
+from urlparse import urlsplit
+
+from . import instrument
+from .cache import BoundedCache
+
+__all__ = ['OriginMatcher', 'parse_origin', 'get_origin_matcher']
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+#: Parsed origins, keyed by the ``scheme://netloc`` they were parsed from
+origin_cache = BoundedCache(maxsize=1024)
+instrument.register_cache('origins', origin_cache)
+
+_missing = object()
+
+
+def _parse(url):
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = parts.hostname
+    if not scheme or not host:
+        return None
+    if port is None:
+        port = DEFAULT_PORTS.get(scheme)
+    return scheme, host, port
+
+
+def parse_origin(url):
+    """
+    Return the ``(scheme, hostname, port)`` origin of an absolute URL (with
+    default ports filled in), or ``None`` if it has none.
+    """
+    # Only the scheme and network location are parsed (and cached), so
+    # every URL on a site shares one cache entry.
+    start = url.find('://')
+    if start == -1:
+        return None
+    end = len(url)
+    for delimiter in '/?#':
+        index = url.find(delimiter, start + 3)
+        if index != -1 and index < end:
+            end = index
+    prefix = url[:end]
+
+    origin = origin_cache.get(prefix, _missing)
+    if origin is _missing:
+        origin = _parse(prefix)
+        origin_cache.set(prefix, origin)
+    return origin
+
+
+class OriginMatcher(object):
+    """
+    A compiled set of trusted origins, e.g.::
+
+        OriginMatcher([
+            'https://example.com',
+            'https://*.example.com',    # any subdomain of example.com
+            'http://example.com:8080'   # an alternate port
+        ])
+
+    Origins without an explicit port use the scheme's default port.
+    """
+
+    def __init__(self, origins=None):
+        self.origins = origins
+        self.exact = set()
+        self.wildcards = set()
+        for origin in origins or ():
+            parsed = _parse(origin)
+            if parsed is None:
+                raise ValueError('Invalid trusted origin: %r' % origin)
+            scheme, host, port = parsed
+            if host.startswith('*.'):
+                self.wildcards.add((scheme, host[1:], port))
+            else:
+                self.exact.add(parsed)
+
+    def matches(self, origin):
+        """
+        Return True if the ``(scheme, hostname, port)`` ``origin`` is
+        trusted.
+        """
+        if origin in self.exact:
+            return True
+        if self.wildcards:
+            scheme, host, port = origin
+            index = host.find('.')
+            while index != -1:
+                if (scheme, host[index:], port) in self.wildcards:
+                    return True
+                index = host.find('.', index + 1)
+        return False
+
+
+def get_origin_matcher(formcls):
+    """
+    Return the compiled :class:`OriginMatcher` for ``formcls``'s
+    ``TRUSTED_ORIGINS``, building it on first use (or after they've
+    changed).
+    """
+    matcher = formcls.__dict__.get('_origin_matcher')
+    if matcher is None or matcher.origins is not formcls.TRUSTED_ORIGINS:
+        matcher = OriginMatcher(formcls.TRUSTED_ORIGINS)
+        formcls._origin_matcher = matcher
+    return matcher
@@ -0,0 +1,192 @@
+import warnings
+
+from wtforms.fields.core import (Field, UnboundField, Label, Flags,
+                                 SelectFieldBase, SelectField, IntegerField,
+                                 DecimalField, FloatField, BooleanField,
+                                 DateTimeField, DateField)
+
+from .compact import CompactPrototype, compact_unbound
+from .formdata import indexed_unbound
+
+__all__ = ['FormPlan', 'get_plan']
+
+#
+# Field classes whose ``__init__`` only stores configuration (and never
+# creates per-instance mutable state beyond a ``Label``, ``Flags`` and
+# validator list).  Fields built entirely from these constructors can be
+# cloned from a prototype instead of being constructed from scratch.
+#
+CLONEABLE_CONSTRUCTORS = frozenset([
+    object, Field, SelectFieldBase, SelectField, IntegerField, DecimalField,
+    FloatField, BooleanField, DateTimeField, DateField
+])
+
+
+def is_cloneable(field_class):
+    for klass in field_class.__mro__:
+        if '_compact_slots' in vars(klass):
+            # see ``pecan_wtforms.compact``
+            continue
+        if '__init__' in vars(klass) and klass not in CLONEABLE_CONSTRUCTORS:
+            return False
+    return True
+
+
+class FieldPrototype(object):
+    """
+    A fully-constructed field, captured once per form class and prefix, which
+    can be copied onto new form instances without re-running the field's
+    constructor.
+    """
+
+    def __init__(self, unbound_field, name, prefix):
+        field = unbound_field.bind(form=None, name=name, prefix=prefix)
+        self.field_class = unbound_field.field_class
+        self.state = dict(field.__dict__)
+        self.flags = dict(field.flags.__dict__)
+        self.label = (field.label.field_id, field.label.text)
+
+    def bind(self, form):
+        field = object.__new__(self.field_class)
+        state = field.__dict__
+        state.update(self.state)
+
+        # Anything mutable is copied, so that changes made while handling one
+        # request can't leak into another.
+        state['validators'] = list(state['validators'])
+        state['label'] = Label(*self.label)
+        flags = state['flags'] = Flags()
+        flags.__dict__.update(self.flags)
+        return field
+
+
+class FormPlan(object):
+    """
+    The class-level work needed to construct and validate a form, compiled
+    once per form class and reused by every instance.
+
+    A plan records the ordered unbound fields, any inline
+    ``validate_<fieldname>`` validators, per-prefix field prototypes and the
+    result of the form's configuration checks.  Per-request construction only
+    has to allocate bound field state and process data.
+    """
+
+    #: The number of prefixes whose prototypes are kept; prefixes generated
+    #: per row (e.g. by ``FieldList(FormField(...))``) would otherwise grow
+    #: the cache without bound, so it's emptied once it's full.
+    MAX_PREFIXES = 32
+
+    def __init__(self, formcls):
+        if formcls._unbound_fields is None:
+            formcls._unbound_fields = collect_unbound_fields(formcls)
+
+        self.formcls = formcls
+        self.unbound_fields = formcls._unbound_fields
+        self.fields = tuple(self.unbound_fields)
+        self.order = dict((name, i) for i, (name, _) in enumerate(self.fields))
+        self.prototypes = {}
+
+        self.inline_validators = {}
+        for name, _ in self.fields:
+            inline = getattr(formcls, 'validate_%s' % name, None)
+            if inline is not None:
+                self.inline_validators[name] = [inline]
+
+        self.check(formcls)
+
+    def check(self, formcls):
+        # Warn the user if they don't choose a unique secret CSRF key
+        from .form import Form
+        if formcls.SECRET_KEY == Form.SECRET_KEY:
+            warnings.warn(
+                ('Using the default `SECRET_KEY` is a security risk.  To '
+                 'prevent CSRF attacks, set a unique attribute value for '
+                 '%s.SECRET_KEY') % formcls.__name__,
+                RuntimeWarning
+            )
+
+    def binders(self, prefix):
+        """
+        Return a sequence of ``(name, unbound_field, prototype)`` for
+        ``prefix``, where ``prototype`` is ``None`` for fields that must be
+        bound normally.
+        """
+        binders = self.prototypes.get(prefix)
+        if binders is None:
+            binders = []
+            compact = getattr(self.formcls, 'COMPACT_FIELDS', False)
+            for name, unbound_field in self.fields:
+                prototype = None
+                unbound_field = indexed_unbound(unbound_field)
+                if compact:
+                    unbound_field = compact_unbound(unbound_field)
+                if type(unbound_field) is UnboundField and \
+                        is_cloneable(unbound_field.field_class):
+                    prototype_class = CompactPrototype if compact \
+                        else FieldPrototype
+                    prototype = prototype_class(unbound_field, name, prefix)
+                binders.append((name, unbound_field, prototype))
+            binders = tuple(binders)
+            if len(self.prototypes) >= self.MAX_PREFIXES:
+                self.prototypes.clear()
+            self.prototypes[prefix] = binders
+        return binders
+
+    def bind(self, form, prefix=''):
+        """
+        Bind every field in the plan to ``form``.
+        """
+        if prefix and prefix[-1] not in '-_;:/.':
+            prefix += '-'
+
+        form._prefix = prefix
+        form._errors = None
+        form._fields = fields = {}
+
+        translations = form._get_translations()
+        for name, unbound_field, prototype in self.binders(prefix):
+            # Prototypes are built without translations, so only use them
+            # when the form doesn't provide its own.
+            if prototype is not None and translations is None:
+                fields[name] = prototype.bind(form)
+            else:
+                fields[name] = unbound_field.bind(
+                    form=form,
+                    name=name,
+                    prefix=prefix,
+                    translations=translations
+                )
+
+        # Set all the fields to attributes so that they obscure the class
+        # attributes with the same names.
+        form.__dict__.update(fields)
+
+    def is_current(self, formcls):
+        return self.unbound_fields is formcls._unbound_fields
+
+
+def collect_unbound_fields(formcls):
+    """
+    Collect a form class's unbound fields in definition order, the same way
+    ``wtforms.form.FormMeta`` does on first instantiation.
+    """
+    fields = []
+    for name in dir(formcls):
+        if not name.startswith('_'):
+            unbound_field = getattr(formcls, name)
+            if hasattr(unbound_field, '_formfield'):
+                fields.append((name, unbound_field))
+    fields.sort(key=lambda x: (x[1].creation_counter, x[0]))
+    return fields
+
+
+def get_plan(formcls):
+    """
+    Return the compiled :class:`FormPlan` for ``formcls``, building it on
+    first use (or after the class's fields have changed).
+    """
+    plan = formcls.__dict__.get('_plan')
+    if plan is None or not plan.is_current(formcls):
+        plan = FormPlan(formcls)
+        formcls._plan = plan
+    return plan
@@ -0,0 +1,165 @@
+"""
+Per-thread pooling of form instances.
+
+``with_form(..., pool=True)`` checks forms out of a :class:`FormPool`
+instead of constructing them, and :class:`FormPoolHook` returns them (after
+calling ``Form.reset()``) at the end of the request (or, for a response
+whose body is generated as it's sent, like ``Form.stream()``, once the
+response has been closed)::
+
+    app = make_app(
+        root,
+        hooks=[pecan_wtforms.pool.FormPoolHook()],
+        ...
+    )
+
+Pools are kept per thread (``threading.local``, which is per greenlet when
+``gevent`` has patched the ``threading`` module), so no locking is needed.
+Controllers must not keep references to pooled forms beyond the request.
+"""
+import threading
+
+from pecan.hooks import PecanHook
+from webob.exc import HTTPException
+
+from . import instrument
+from .form import Form
+from .lazy import is_built, resolve
+from .multipart import ClosingIterator
+from .plan import get_plan
+
+__all__ = ['FormPool', 'FormPoolHook', 'default_pool']
+
+#: The ``environ`` key listing the forms checked out during a request
+ENVIRON_KEY = 'pecan_wtforms.pooled'
+
+
+def poolable(formcls):
+    """
+    Forms are reused without calling ``__init__``, so only classes which
+    don't override it can be pooled.
+    """
+    return formcls.__init__.im_func is Form.__init__.im_func
+
+
+class FormPool(object):
+    """
+    Idle form instances, kept per thread, form class and prefix.
+
+    :param maxsize: the maximum number of idle forms kept for each form
+                    class and prefix (in each thread).
+    """
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self._local = threading.local()
+
+    def _idle(self, key):
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = {}
+        return idle.setdefault(key, [])
+
+    def acquire(self, formcls, formdata=None, obj=None, prefix='',
+                csrf_context={}, error_cfg={}, **kwargs):
+        """
+        Return a form, reused from the pool if possible, processed exactly
+        as ``formcls(formdata, obj, prefix, csrf_context, error_cfg,
+        **kwargs)`` would be.
+        """
+        if not poolable(formcls):
+            return formcls(formdata, obj, prefix, csrf_context, error_cfg,
+                           **kwargs)
+
+        # Keyed by plan, so forms bound before the class's fields changed
+        # are never reused
+        started = instrument.start()
+        key = (get_plan(formcls), prefix)
+        idle = self._idle(key)
+        if idle:
+            form = idle.pop()
+        else:
+            form = formcls.__new__(formcls)
+            key[0].bind(form, prefix)
+            form._pool_key = key
+            form._snapshot()
+
+        form._setup(formdata, obj, csrf_context, error_cfg, **kwargs)
+        form._pooled = True
+        form._pool = self
+        instrument.record(started, 'construction', form)
+        return form
+
+    def release(self, form):
+        """
+        Reset ``form`` and return it to the pool.  Forms which weren't
+        checked out of a pool (or were already released) are ignored.
+        """
+        if not is_built(form):
+            return
+        form = resolve(form)
+        if not form.__dict__.get('_pooled'):
+            return
+
+        form.reset()
+        idle = self._idle(form._pool_key)
+        if len(idle) < self.maxsize:
+            idle.append(form)
+
+    def clear(self):
+        """
+        Discard the current thread's idle forms.
+        """
+        self._local.idle = {}
+
+
+default_pool = FormPool()
+
+
+def track(environ, form):
+    environ.setdefault(ENVIRON_KEY, []).append(form)
+
+
+class FormPoolHook(PecanHook):
+    """
+    Returns the forms checked out by ``with_form(..., pool=True)`` (or
+    ``pool=<FormPool>``) to the pool they came from at the end of the
+    request, or once a streamed response has been closed.
+
+    :param pool: the pool for forms which don't record their own.
+    """
+
+    def __init__(self, pool=default_pool):
+        self.pool = pool
+
+    def after(self, state):
+        environ = state.request.environ
+        forms = environ.get(ENVIRON_KEY)
+        if not forms:
+            return
+
+        # A form handed to an (internally redirected) error handler is
+        # released by the handler's request.
+        held = environ.get('pecan.validation_form')
+        release = [form for form in forms if form is not held]
+
+        def close():
+            for form in release:
+                # (Unless a forwarded request's hook got to it first)
+                if form in forms:
+                    forms.remove(form)
+                    pool = resolve(form).__dict__.get('_pool') or self.pool
+                    pool.release(form)
+
+        response = state.response
+        app_iter = getattr(response, 'app_iter', None)
+        if app_iter is None or isinstance(app_iter, (list, tuple)) or \
+                isinstance(response, HTTPException):
+            # The body has already been rendered
+            close()
+            return
+
+        # Setting ``app_iter`` clears the Content-Length
+        length = response.content_length
+        response.app_iter = ClosingIterator(app_iter, close)
+        response.content_length = length
@@ -0,0 +1,328 @@
+"""
+A sampling profiler for finding slow validators and filters.
+
+Where ``pecan_wtforms.instrument`` times each stage (and field), the
+profiler times every validator and filter individually, for a random
+fraction of requests, and keeps the samples in a bounded ring buffer::
+
+    from pecan_wtforms import profiler
+
+    profiler.enable(sample_rate=0.01, path='/var/tmp/forms.profile')
+
+    app = make_app(
+        root,
+        hooks=[profiler.ProfilerHook()],
+        ...
+    )
+
+:class:`ProfilerHook` periodically saves the buffer to ``path``, and the
+``pecan-wtforms-profile`` command reports the top offenders::
+
+    $ pecan-wtforms-profile /var/tmp/forms.profile --top 10
+    $ pecan-wtforms-profile /var/tmp/forms.profile --json
+
+The decision to sample is made once per request (outside of a request, once
+per call to ``process()`` or ``validate()``, or once per batch of
+``Form.validate_many()``); requests which aren't sampled pay only for a
+dictionary lookup.  Only the top-level fields of a form are profiled, and
+deferred validators (see ``pecan_wtforms.deferred``) are only timed until
+they're submitted to the validation pool.
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+from pecan.core import state
+from pecan.hooks import PecanHook
+
+from .instrument import timer
+
+__all__ = ['Profiler', 'ProfilerHook', 'enable', 'disable', 'get_profiler']
+
+#: The ``environ`` key recording whether a request is sampled
+ENVIRON_KEY = 'pecan_wtforms.profiled'
+
+SORT_KEYS = ('p99', 'max', 'mean', 'total', 'count')
+
+Sample = collections.namedtuple(
+    'Sample', ['kind', 'form', 'field', 'name', 'seconds']
+)
+
+
+class Profiler(object):
+    """
+    Samples the wall time of validators and filters.
+
+    :param sample_rate: the fraction of requests (between 0 and 1) to
+                        profile.
+    :param size: the number of samples kept; older samples are discarded.
+    :param path: where :meth:`save` writes the samples.
+    """
+
+    def __init__(self, sample_rate=0.01, size=10000, path=None):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """
+        Return True to profile the current request.
+        """
+        return random.random() < self.sample_rate
+
+    def add(self, kind, form, field, name, seconds):
+        sample = Sample(kind, form, field, name, seconds)
+        with self._lock:
+            self.samples.append(sample)
+
+    def snapshot(self):
+        """
+        Return a list of the buffered samples, oldest first.
+        """
+        with self._lock:
+            return list(self.samples)
+
+    def clear(self):
+        with self._lock:
+            self.samples.clear()
+
+    def save(self, path=None):
+        """
+        Write the buffered samples to ``path`` (by default, the profiler's
+        ``path``) as JSON, replacing the file atomically.
+        """
+        path = path or self.path
+        if path is None:
+            raise ValueError('No path to save the profile to.')
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({
+                'sample_rate': self.sample_rate,
+                'samples': [list(s) for s in self.snapshot()]
+            }, f)
+        os.rename(tmp, path)
+
+    def timed(self, fn, kind, form, field):
+        return _Timed(self, fn, kind, type(form).__name__, field.short_name)
+
+    def wrap_filters(self, form):
+        """
+        Time the filters of each of ``form``'s fields, returning a function
+        which restores them.
+        """
+        return self._wrap(form, 'filters', 'filter')
+
+    def wrap_validators(self, form, extra):
+        """
+        Time the validators of each of ``form``'s fields, returning the
+        (timed) inline validators in ``extra`` and a function which restores
+        the fields' validators.
+        """
+        restore = self._wrap(form, 'validators', 'validator')
+        timed = {}
+        for name, validators in extra.items():
+            field = form._fields.get(name)
+            if field is not None:
+                timed[name] = [
+                    self.timed(v, 'validator', form, field)
+                    for v in validators
+                ]
+        return timed, restore
+
+    def _wrap(self, form, attribute, kind):
+        originals = []
+        for field in form._fields.values():
+            callables = getattr(field, attribute, None)
+            if callables:
+                originals.append((field, callables))
+                setattr(field, attribute, tuple(
+                    self.timed(fn, kind, form, field) for fn in callables
+                ))
+
+        def restore():
+            for field, callables in originals:
+                setattr(field, attribute, callables)
+        return restore
+
+
+class _Timed(object):
+
+    __slots__ = ('profiler', 'fn', 'kind', 'form', 'field', 'name')
+
+    def __init__(self, profiler, fn, kind, form, field):
+        self.profiler = profiler
+        self.fn = fn
+        self.kind = kind
+        self.form = form
+        self.field = field
+        self.name = describe(fn)
+
+    def __call__(self, *args):
+        started = timer()
+        try:
+            return self.fn(*args)
+        finally:
+            self.profiler.add(self.kind, self.form, self.field, self.name,
+                              timer() - started)
+
+
+def describe(fn):
+    """
+    Return a name for a validator or filter: a function's name, or a
+    validator instance's class name.
+    """
+    return getattr(fn, '__name__', None) or type(fn).__name__
+
+
+_profiler = None
+
+
+def enable(sample_rate=0.01, size=10000, path=None):
+    """
+    Start profiling a fraction of requests, returning the new
+    :class:`Profiler`.
+    """
+    global _profiler
+    _profiler = Profiler(sample_rate, size, path)
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+
+
+def get_profiler():
+    return _profiler
+
+
+def current():
+    """
+    Return the active :class:`Profiler` if the current request (or, outside
+    of a request, the current call) is sampled, and ``None`` otherwise.
+    """
+    profiler = _profiler
+    if profiler is None:
+        return None
+    request = getattr(state, 'request', None)
+    if request is None:
+        return profiler if profiler.sample() else None
+    environ = request.environ
+    sampled = environ.get(ENVIRON_KEY)
+    if sampled is None:
+        sampled = environ[ENVIRON_KEY] = profiler.sample()
+    return profiler if sampled else None
+
+
+class ProfilerHook(PecanHook):
+    """
+    Saves the active profiler's samples to its ``path`` at most once every
+    ``interval`` seconds, after a sampled request.
+    """
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self._saved = time.time()
+        self._lock = threading.Lock()
+
+    def after(self, state):
+        profiler = _profiler
+        if profiler is None or profiler.path is None:
+            return
+        if not state.request.environ.get(ENVIRON_KEY):
+            return
+        with self._lock:
+            now = time.time()
+            if now - self._saved < self.interval:
+                return
+            self._saved = now
+        profiler.save()
+
+
+def percentile(values, p):
+    """
+    Return the ``p``-th percentile of sorted ``values`` (nearest rank).
+    """
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def report(samples, top=20, sort='p99', kind=None):
+    """
+    Aggregate samples by validator (or filter), field and form class,
+    returning the ``top`` offenders (by ``sort``, one of ``SORT_KEYS``) as a
+    list of dictionaries.  Times are in milliseconds.
+    """
+    groups = {}
+    for s in samples:
+        s = Sample(*s)
+        if kind is None or s.kind == kind:
+            key = (s.kind, s.form, s.field, s.name)
+            groups.setdefault(key, []).append(s.seconds * 1000)
+
+    rows = []
+    for (kind_, form, field, name), times in groups.items():
+        times.sort()
+        total = sum(times)
+        rows.append({
+            'kind': kind_,
+            'form': form,
+            'field': field,
+            'name': name,
+            'count': len(times),
+            'total': total,
+            'mean': total / len(times),
+            'p99': percentile(times, 99),
+            'max': times[-1]
+        })
+    rows.sort(key=lambda row: row[sort], reverse=True)
+    return rows[:top]
+
+
+def format_table(rows):
+    header = ('%-9s %-24s %-20s %-24s %7s %10s %10s %10s %10s' % (
+        'kind', 'form', 'field', 'name', 'count', 'total ms', 'mean ms',
+        'p99 ms', 'max ms'
+    ))
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        lines.append(
+            '%(kind)-9s %(form)-24s %(field)-20s %(name)-24s %(count)7d '
+            '%(total)10.3f %(mean)10.3f %(p99)10.3f %(max)10.3f' % row
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=sys.argv[1:]):
+    """
+    Report the slowest validators and filters in a saved profile.
+    """
+    parser = argparse.ArgumentParser(
+        prog='pecan-wtforms-profile', description=main.__doc__.strip()
+    )
+    parser.add_argument('path', help='a profile saved by Profiler.save()')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--sort', choices=SORT_KEYS, default='p99')
+    parser.add_argument('--kind', choices=('validator', 'filter'))
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    with open(args.path) as f:
+        profile = json.load(f)
+    rows = report(profile['samples'], args.top, args.sort, args.kind)
+    if args.json:
+        print(json.dumps(rows, indent=2, sort_keys=True))
+    else:
+        print(format_table(rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""
+Bulk submissions: validating a stream of NDJSON or CSV records against a
+form class, reading the request body incrementally.
+"""
+import csv
+
+from pecan import abort, request, response
+
+from .formdata import DictFormData, dumps, loads
+from .validation import capture_state, iter_with_state
+
+__all__ = ['with_form_stream', 'stream_results', 'RecordTooLarge']
+
+CHUNK_SIZE = 64 * 1024
+MAX_RECORD_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonlines': 'ndjson',
+    'application/x-jsonlines': 'ndjson',
+    'text/csv': 'csv'
+}
+
+REASON_MALFORMED_RECORD = 'Malformed record.'
+
+#: Stands in for a record which couldn't be parsed
+MALFORMED = object()
+
+
+class RecordTooLarge(ValueError):
+    """
+    Raised (while iterating over records) when a line (or CSV row) of the
+    request body exceeds the maximum record size.
+    """
+
+    def __init__(self, limit):
+        super(RecordTooLarge, self).__init__(
+            'A record exceeds the limit of %d bytes.' % limit
+        )
+        self.limit = limit
+
+
+def iter_lines(fp, max_size=MAX_RECORD_SIZE, chunk_size=CHUNK_SIZE):
+    """
+    Yield the lines (including their newline) of a file, reading it
+    ``chunk_size`` bytes at a time.  At most one line is buffered.
+    """
+    buf = b''
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        start = 0
+        while True:
+            end = buf.find(b'\n', start)
+            if end == -1:
+                break
+            if end - start > max_size:
+                raise RecordTooLarge(max_size)
+            yield buf[start:end + 1]
+            start = end + 1
+        buf = buf[start:]
+        if len(buf) > max_size:
+            raise RecordTooLarge(max_size)
+    if buf:
+        yield buf
+
+
+def iter_ndjson(lines):
+    """
+    Yield a dictionary for each (non-blank) line of newline-delimited JSON.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except ValueError:
+            record = MALFORMED
+        if not isinstance(record, dict):
+            record = MALFORMED
+        yield record
+
+
+class _RecordLines(object):
+    """
+    Iterates over lines, raising :class:`RecordTooLarge` once the lines
+    read since :meth:`next_record` exceed ``max_size`` bytes (e.g., for a
+    quoted CSV field spanning many lines).
+    """
+
+    def __init__(self, lines, max_size):
+        self.lines = iter(lines)
+        self.max_size = max_size
+        self.size = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = next(self.lines)
+        self.size += len(line)
+        if self.max_size is not None and self.size > self.max_size:
+            raise RecordTooLarge(self.max_size)
+        return line
+
+    __next__ = next
+
+    def next_record(self):
+        self.size = 0
+
+
+def iter_csv(lines, charset='utf-8', max_size=MAX_RECORD_SIZE):
+    """
+    Yield a dictionary for each row of CSV, keyed by the header row.
+
+    Rows which can't be parsed (e.g., with a NUL byte or an unterminated
+    quote) are yielded as ``MALFORMED``, and parsing resumes on the next
+    line.  A row (which may span several lines) larger than ``max_size``
+    bytes raises :class:`RecordTooLarge`.
+    """
+    lines = _RecordLines(lines, max_size)
+    reader = csv.reader(lines, strict=True)
+    try:
+        header = next(reader, None)
+    except csv.Error:
+        yield MALFORMED
+        return
+    if header is None:
+        return
+    header = [name.decode(charset, 'replace') for name in header]
+    while True:
+        lines.next_record()
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            yield MALFORMED
+            continue
+        if not row:
+            continue
+        if len(row) > len(header):
+            yield MALFORMED
+            continue
+        yield dict(
+            (name, value.decode(charset, 'replace'))
+            for name, value in zip(header, row)
+        )
+
+
+def with_form_stream(formcls, key='records', format=None,
+                     max_record_size=MAX_RECORD_SIZE, chunk_size=CHUNK_SIZE,
+                     prefix=''):
+    """
+    Used to decorate a Pecan controller which accepts a bulk submission:
+    a request body of newline-delimited JSON objects or CSV rows (with a
+    header row), each of which is validated against ``formcls``.
+
+    The controller receives (as the keyword argument ``key``, and at
+    ``request.pecan[key]``) a generator of ``(data, errors)`` pairs, one per
+    record, where ``data`` is a dictionary of the form's (processed) data
+    and ``errors`` is ``None`` or a dictionary of errors (see
+    ``Form.iter_validate``)::
+
+        @expose()
+        @with_form_stream(ProductForm)
+        def bulk(self, records):
+            for data, errors in records:
+                if errors is None:
+                    Product.create(**data)
+            ...
+
+    The body is read and validated as the generator is consumed, so memory
+    use doesn't depend on the size of the upload.  A controller can also
+    return :func:`stream_results` to stream each record's result back to
+    the client.
+
+    The request as a whole is protected by the form class's CSRF check:
+    for a ``SecureForm``, the token is read from the ``X-CSRF-Token`` header
+    (or the ``csrf_token`` query string argument).
+
+    :param formcls: A subclass of ``pecan_wtforms.Form``
+    :param key: The keyword argument the records are passed as
+    :param format: ``'ndjson'`` or ``'csv'``; by default, it's determined
+                   by the request's ``Content-Type`` (and other content
+                   types are rejected with ``415 Unsupported Media Type``).
+    :param max_record_size: The maximum size of a single line (or, for
+                            CSV, a row spanning several lines), in bytes.
+                            Larger records stop the generator with a
+                            :class:`RecordTooLarge` exception.
+    """
+
+    def deco(f):
+
+        def wrapped(*args, **kwargs):
+            fmt = format or CONTENT_TYPES.get(request.content_type)
+            if fmt not in ('ndjson', 'csv'):
+                abort(415)
+
+            check_csrf(formcls)
+
+            records = iter_records(
+                formcls,
+                fmt,
+                request.body_file,
+                max_record_size,
+                chunk_size,
+                prefix,
+                request.charset or 'utf-8'
+            )
+            request.pecan[key] = records
+            kwargs[key] = records
+            return f(*args, **kwargs)
+
+        wrapped.__name__ = f.__name__
+        return wrapped
+
+    return deco
+
+
+def check_csrf(formcls):
+    """
+    Validate the CSRF token for the request as a whole, aborting with an
+    HTTP 403 if it's invalid.
+    """
+    token = request.headers.get('X-CSRF-Token') or \
+        request.GET.get('csrf_token')
+    # The token is only checked, so the CSRF cookie is never (re-)issued
+    form = formcls(
+        DictFormData({'csrf_token': token}) if token else None,
+        csrf_context={
+            'request': request,
+            'response': response,
+            'set_cookie': False
+        }
+    )
+    if 'csrf_token' in form:
+        validator = getattr(formcls, 'validate_csrf_token', None)
+        form.csrf_token.validate(form, [validator] if validator else ())
+
+
+def iter_records(formcls, fmt, fp, max_record_size, chunk_size, prefix,
+                 charset):
+    lines = iter_lines(fp, max_record_size, chunk_size)
+    if fmt == 'csv':
+        records = iter_csv(lines, charset, max_record_size)
+    else:
+        records = iter_ndjson(lines)
+
+    validate = formcls._bulk_validator(prefix)
+    for record in records:
+        if record is MALFORMED:
+            yield None, {'': [REASON_MALFORMED_RECORD]}
+        else:
+            yield validate(record)
+
+
+def stream_results(records):
+    """
+    Stream each record's result back to the client, as newline-delimited
+    JSON (``{"record": 1, "errors": null}``), validating records as the
+    response is sent.
+
+    The response is sent after Pecan has finished handling the request, so
+    each record is validated with the request's (saved) state, and
+    validators can still use ``pecan.request``.
+    """
+    results = iter_with_state(capture_state(), records)
+
+    def lines():
+        for i, (_, errors) in enumerate(results, 1):
+            yield dumps({'record': i, 'errors': errors}) + '\n'
+
+    response.content_type = 'application/x-ndjson'
+    response.app_iter = lines()
+    return response
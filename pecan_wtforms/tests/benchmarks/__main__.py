@@ -0,0 +1,5 @@
+import sys
+
+from .hotpaths import main
+
+sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Microbenchmark for bulk validation.
+
+Compares validating rows by instantiating a form per row with
+``Form.validate_many``, which re-processes a single form instance.  Run
+with::
+
+    $ python -m pecan_wtforms.tests.benchmarks.bulk
+"""
+import sys
+import time
+
+import pecan_wtforms
+from pecan_wtforms.formdata import DictFormData
+from pecan_wtforms.tests.benchmarks.construction import make_form
+
+
+def per_row(formcls, rows):
+    results = []
+    for row in rows:
+        form = formcls(DictFormData(row))
+        form.validate()
+        results.append(form.errors or None)
+    return results
+
+
+def run(n=20, rows=10000):
+    formcls = make_form(pecan_wtforms.Form, n)
+    data = [
+        dict(('field_%d' % i, 'value' if (r + i) % 7 else '')
+             for i in range(n))
+        for r in range(rows)
+    ]
+
+    results = {}
+    for label, validate in (('per-row', lambda d: per_row(formcls, d)),
+                            ('validate_many', formcls.validate_many)):
+        start = time.time()
+        validate(data)
+        results[label] = (time.time() - start) / rows
+    return results
+
+
+def main(argv=sys.argv[1:]):
+    rows = int(argv[0]) if argv else 10000
+    results = run(rows=rows)
+    for label in ('per-row', 'validate_many'):
+        print('%-14s %8.1f usec/row' % (label, results[label] * 1e6))
+    print('speedup        %8.2fx' % (
+        results['per-row'] / results['validate_many']
+    ))
+
+
+if __name__ == '__main__':
+    main()
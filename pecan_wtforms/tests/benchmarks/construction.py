@@ -0,0 +1,68 @@
+"""
+Microbenchmark for form construction cost.
+
+Compares ``pecan_wtforms.Form`` (which binds fields from a cached, per-class
+plan) against the same form constructed through the uncached WTForms
+constructor chain.  Run with::
+
+    $ python -m pecan_wtforms.tests.benchmarks.construction
+"""
+import sys
+import timeit
+import warnings
+
+from wtforms.form import Form as WTFForm
+from wtforms.ext.csrf.form import SecureForm as WTFSecureForm
+
+import pecan_wtforms
+
+
+def make_form(base, n=80):
+    attrs = {'SECRET_KEY': 'benchmark'}
+    for i in range(n):
+        attrs['field_%d' % i] = pecan_wtforms.fields.TextField(
+            'Field %d' % i,
+            [pecan_wtforms.validators.Required()],
+            filters=[pecan_wtforms.default('')]
+        )
+    return type('BenchmarkForm%d' % n, (base,), attrs)
+
+
+class UncachedForm(pecan_wtforms.Form):
+    """
+    Constructs and validates itself the way ``pecan_wtforms.Form`` did before
+    per-class plans were introduced.
+    """
+
+    def __init__(self, formdata=None, obj=None, prefix='', csrf_context={},
+                    error_cfg={}, **kwargs):
+        if self.SECRET_KEY == pecan_wtforms.Form.SECRET_KEY:
+            warnings.warn('default SECRET_KEY', RuntimeWarning)
+        self.csrf_context = csrf_context
+        WTFSecureForm.__init__(self, formdata, obj, prefix,
+                               csrf_context=csrf_context, **kwargs)
+
+    validate = WTFForm.validate
+
+
+def run(n=80, number=2000):
+    results = {}
+    for label, base in (('uncached', UncachedForm),
+                        ('planned', pecan_wtforms.Form)):
+        formcls = make_form(base, n)
+        formcls()  # warm up (builds the plan / unbound field list)
+        seconds = min(timeit.repeat(formcls, repeat=3, number=number))
+        results[label] = seconds / number
+    return results
+
+
+def main(argv=sys.argv[1:]):
+    n = int(argv[0]) if argv else 80
+    results = run(n)
+    for label in ('uncached', 'planned'):
+        print('%-10s %8.1f usec/form' % (label, results[label] * 1e6))
+    print('speedup    %8.2fx' % (results['uncached'] / results['planned']))
+
+
+if __name__ == '__main__':
+    main()
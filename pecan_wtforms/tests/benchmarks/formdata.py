@@ -0,0 +1,73 @@
+"""
+Microbenchmark for processing large, repeated form data.
+
+Compares processing a form (with a ``FieldList`` of ``n`` entries and ``n``
+plain fields) from ``request.params`` against processing it from
+``IndexedFormData`` (as ``with_form(..., source='both')`` does), including
+the cost of building the index.  Run with::
+
+    $ python -m pecan_wtforms.tests.benchmarks.formdata
+"""
+import sys
+import timeit
+
+from webob import Request
+
+import pecan_wtforms
+from pecan_wtforms.formdata import IndexedFormData, IndexedFieldList
+
+
+def make_form(n):
+    class ItemForm(pecan_wtforms.Form):
+        SECRET_KEY = 'benchmark'
+        sku = pecan_wtforms.fields.TextField()
+        quantity = pecan_wtforms.fields.IntegerField()
+
+    attrs = {
+        'SECRET_KEY': 'benchmark',
+        'items': IndexedFieldList(
+            pecan_wtforms.fields.FormField(ItemForm, separator='-')
+        )
+    }
+    for i in range(n):
+        attrs['field_%d' % i] = pecan_wtforms.fields.TextField()
+    return type('FormDataForm%d' % n, (pecan_wtforms.Form,), attrs)
+
+
+def make_request(n):
+    params = []
+    for i in range(n):
+        params.append(('field_%d' % i, 'value'))
+        params.append(('items-%d-sku' % i, 'SKU%d' % i))
+        params.append(('items-%d-quantity' % i, str(i)))
+    return Request.blank('/?page=1', POST=params)
+
+
+def run(n=200, number=20):
+    formcls = make_form(n)
+    request = make_request(n)
+    cases = (
+        ('params', lambda: formcls(request.params)),
+        ('indexed', lambda: formcls(
+            IndexedFormData(request.params.items())
+        ))
+    )
+    assert cases[0][1]().data == cases[1][1]().data
+
+    results = {}
+    for label, process in cases:
+        seconds = min(timeit.repeat(process, repeat=3, number=number))
+        results[label] = seconds / number
+    return results
+
+
+def main(argv=sys.argv[1:]):
+    n = int(argv[0]) if argv else 200
+    results = run(n)
+    for label in ('params', 'indexed'):
+        print('%-10s %8.1f usec/form' % (label, results[label] * 1e6))
+    print('speedup    %8.2fx' % (results['params'] / results['indexed']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+Microbenchmarks for the ``with_form`` / ``Form`` / ``SecureForm`` hot paths.
+
+Each benchmark drives a local Pecan application through WebTest (just like
+``pecan_wtforms/tests/test_decorator.py``) and reports operations per second
+and allocations per operation.  Results can be saved as a baseline and later
+runs compared against it; any benchmark that's slower (or allocates more)
+than the baseline by more than the tolerance is reported as a regression,
+and the run exits with a non-zero status::
+
+    $ python -m pecan_wtforms.tests.benchmarks --save
+    ... upgrade something ...
+    $ python -m pecan_wtforms.tests.benchmarks
+    get                   2951.2 ops/sec      1873 allocs/op
+    ...
+    REGRESSION: valid_post is 31.4% slower than the baseline
+
+Allocations are counted with ``tracemalloc``, where it's available (Python
+3.4+).  Python 2 has no way to count allocations (as opposed to objects
+that are still alive), so there, only operations per second are reported
+and compared.  Baselines are only compared against runs that used the same
+allocation metric.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: nocover
+    tracemalloc = None
+
+__all__ = ['BENCHMARKS', 'run', 'compare', 'main']
+
+DEFAULT_BASELINE = 'pecan-wtforms-benchmarks.json'
+DEFAULT_TOLERANCE = 0.2
+
+#: How allocations are counted (``None`` when they can't be)
+ALLOCATION_METRIC = 'tracemalloc' if tracemalloc else None
+ALLOCATION_UNIT = 'allocs/op'
+
+
+def make_forms():
+    import pecan_wtforms
+    from pecan_wtforms import fields, validators
+
+    class BenchmarkForm(pecan_wtforms.Form):
+        SECRET_KEY = 'benchmark'
+
+        first_name = fields.TextField('First Name', [validators.Required()])
+        last_name = fields.TextField('Last Name', [validators.Required()])
+        email = fields.TextField('Email', [validators.Email()])
+        age = fields.IntegerField('Age', [validators.NumberRange(0, 150)])
+        country = fields.SelectField('Country', choices=[
+            ('us', 'United States'), ('ca', 'Canada'), ('mx', 'Mexico')
+        ])
+        newsletter = fields.BooleanField('Newsletter')
+        bio = fields.TextAreaField('Bio', [validators.Length(max=500)])
+
+    class SecureBenchmarkForm(BenchmarkForm, pecan_wtforms.SecureForm):
+        pass
+
+    return BenchmarkForm, SecureBenchmarkForm
+
+
+class StripPasteVar(object):
+    """
+    CSRF is disabled for WebTest requests; remove the marker so that the
+    ``SecureForm`` benchmarks exercise token validation.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        environ.pop('paste.testing', None)
+        return self.app(environ, start_response)
+
+
+def make_app():
+    import pecan_wtforms
+    from pecan import Pecan, expose, request
+    from pecan.middleware.recursive import RecursiveMiddleware
+    from webtest import TestApp
+
+    BenchmarkForm, SecureBenchmarkForm = make_forms()
+    with_form = pecan_wtforms.with_form
+
+    def render(form):
+        return '\n'.join('%s %s' % (f.label, f) for f in form)
+
+    class RootController(object):
+
+        @expose()
+        @with_form(BenchmarkForm)
+        def index(self):
+            return 'Hello, World!'
+
+        @expose()
+        @with_form(BenchmarkForm)
+        def save(self, **kw):
+            return kw['first_name']
+
+        @expose()
+        @with_form(BenchmarkForm, error_cfg={'auto_insert_errors': True})
+        def errors(self, **kw):
+            return render(request.pecan['form'])
+
+        @expose()
+        @with_form(BenchmarkForm, error_cfg={
+            'auto_insert_errors': True,
+            'handler': '/errors'
+        })
+        def redirect(self, **kw):
+            return kw['first_name']
+
+        @expose()
+        @with_form(BenchmarkForm)
+        def render(self):
+            return render(request.pecan['form'])
+
+        @expose()
+        @with_form(SecureBenchmarkForm)
+        def secure(self, **kw):
+            return 'OK'
+
+    return TestApp(StripPasteVar(RecursiveMiddleware(Pecan(
+        RootController()
+    ))))
+
+
+VALID = {
+    'first_name': 'Ryan',
+    'last_name': 'Petrello',
+    'email': 'ryan@example.com',
+    'age': '30',
+    'country': 'us',
+    'newsletter': 'y',
+    'bio': 'Hello, World!'
+}
+
+INVALID = {
+    'email': 'not-an-email',
+    'age': '300',
+    'country': 'us'
+}
+
+
+def get(app):
+    return lambda: app.get('/')
+
+
+def valid_post(app):
+    return lambda: app.post('/save', params=VALID)
+
+
+def invalid_post(app):
+    return lambda: app.post('/errors', params=INVALID)
+
+
+def redirect_to_handler(app):
+    return lambda: app.post('/redirect', params=INVALID)
+
+
+def render(app):
+    return lambda: app.get('/render')
+
+
+def secure_token(app):
+    return lambda: app.get('/secure')
+
+
+def secure_validate(app):
+    app.reset()
+    response = app.get('/secure')
+    token = response.request.pecan['form'].csrf_token.current_token
+    params = dict(VALID, csrf_token=token)
+    headers = {'Referer': 'http://localhost:80/'}
+    return lambda: app.post('/secure', params=params, headers=headers)
+
+
+#: ``(name, setup)`` pairs, where ``setup(app)`` returns the operation to
+#: time
+BENCHMARKS = (
+    ('get', get),
+    ('valid_post', valid_post),
+    ('invalid_post', invalid_post),
+    ('redirect_to_handler', redirect_to_handler),
+    ('secure_token', secure_token),
+    ('secure_validate', secure_validate),
+    ('render', render),
+)
+
+
+def count_allocations(op, number):
+    """
+    Return the number of allocations per call of ``op`` (which requires
+    ``tracemalloc``).
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(number):
+        op()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(
+        stat.count_diff for stat in after.compare_to(before, 'lineno')
+        if stat.count_diff > 0
+    )
+    return float(allocated) / number
+
+
+def measure(op, number, repeat=3):
+    op()  # warm up (builds form plans, compiles routes, etc...)
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for _ in range(number):
+            op()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    result = {'ops_per_sec': number / best if best else float('inf')}
+    if ALLOCATION_METRIC is not None:
+        result['allocations'] = count_allocations(op, max(1, number // 10))
+    return result
+
+
+def run(names=None, number=200, repeat=3):
+    """
+    Run the benchmarks (or only those in ``names``), returning a dictionary
+    mapping benchmark names to their ``ops_per_sec`` and (where they can be
+    counted) ``allocations``.
+    """
+    app = make_app()
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+        results[name] = measure(setup(app), number, repeat)
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE,
+            allocation_metric=ALLOCATION_METRIC):
+    """
+    Compare ``results`` to a saved ``baseline``, returning a list of
+    messages describing every regression beyond ``tolerance`` (a fraction,
+    e.g., ``0.2`` for 20%).  Allocations are only compared when both were
+    counted with ``allocation_metric``.
+    """
+    regressions = []
+    same_metric = allocation_metric is not None and \
+        baseline.get('allocation_metric') == allocation_metric
+    saved = baseline.get('results', {})
+    for name, _ in BENCHMARKS:
+        if name not in results or name not in saved:
+            continue
+        current, previous = results[name], saved[name]
+
+        ops, base_ops = current['ops_per_sec'], previous['ops_per_sec']
+        if ops < base_ops * (1 - tolerance):
+            regressions.append(
+                '%s is %.1f%% slower than the baseline (%.1f vs %.1f ops/sec)'
+                % (name, 100 * (1 - ops / base_ops), ops, base_ops)
+            )
+
+        if not same_metric:
+            continue
+        allocs, base_allocs = current['allocations'], previous['allocations']
+        if allocs > max(base_allocs, 1) * (1 + tolerance):
+            regressions.append(
+                '%s allocates %.1f%% more than the baseline (%.0f vs %.0f '
+                '%s)' % (
+                    name, 100 * (allocs / max(base_allocs, 1) - 1),
+                    allocs, base_allocs, ALLOCATION_UNIT
+                )
+            )
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump({
+            'python': sys.version.split()[0],
+            'allocation_metric': ALLOCATION_METRIC,
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(
+        prog='python -m pecan_wtforms.tests.benchmarks',
+        description='Benchmark the pecan_wtforms request hot paths.'
+    )
+    parser.add_argument('names', nargs='*', metavar='BENCHMARK',
+                        help='only run these benchmarks')
+    parser.add_argument('-n', '--number', type=int, default=200,
+                        help='operations per timing run (default: 200)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='timing runs per benchmark (default: 3)')
+    parser.add_argument('-b', '--baseline', default=DEFAULT_BASELINE,
+                        help='the baseline file (default: %(default)s)')
+    parser.add_argument('-t', '--tolerance', type=float,
+                        default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown, as a fraction (default: '
+                             '%(default)s)')
+    parser.add_argument('--save', action='store_true',
+                        help='save the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.names, args.number, args.repeat)
+    for name, _ in BENCHMARKS:
+        if name not in results:
+            continue
+        line = '%-20s %10.1f ops/sec' % (name, results[name]['ops_per_sec'])
+        if 'allocations' in results[name]:
+            line += ' %9.0f %s' % (
+                results[name]['allocations'],
+                ALLOCATION_UNIT
+            )
+        print(line)
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print('Saved baseline to %s' % args.baseline)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print('No baseline at %s (run with --save to create one)' %
+              args.baseline)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print('REGRESSION: %s' % message)
+    return 1 if regressions else 0
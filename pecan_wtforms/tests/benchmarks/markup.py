@@ -0,0 +1,67 @@
+"""
+Microbenchmark for the shared error markup cache.
+
+Compares formatting error messages with ``default_formatter`` on every call
+to looking them up in ``pecan_wtforms.errors.markup_cache`` (once they've
+been cached).  Run with::
+
+    $ python -m pecan_wtforms.tests.benchmarks.markup
+
+It exits with a non-zero status if the cache isn't faster than formatting.
+"""
+import sys
+import timeit
+
+from pecan_wtforms.errors import MarkupCache, default_formatter
+
+MESSAGES = [
+    u'This field is required.',
+    u'Invalid email address.',
+    u'Number must be between 0 and 150.',
+    u'Field must be between 8 and 64 characters long.'
+]
+
+
+def run(number=100000, repeat=3):
+    """
+    Return the seconds per message for each method (``uncached`` and
+    ``cached``), along with the cache's ``hits`` and ``misses``.
+    """
+    cache = MarkupCache()
+    for message in MESSAGES:
+        cache.format(default_formatter, message)
+
+    def uncached():
+        for message in MESSAGES:
+            default_formatter(message)
+
+    def cached():
+        for message in MESSAGES:
+            cache.format(default_formatter, message)
+
+    results = {}
+    for label, fn in (('uncached', uncached), ('cached', cached)):
+        seconds = min(timeit.repeat(fn, repeat=repeat, number=number))
+        results[label] = seconds / (number * len(MESSAGES))
+
+    stats = cache.stats()
+    results['hits'] = stats['hits']
+    results['misses'] = stats['misses']
+    return results
+
+
+def main(argv=sys.argv[1:]):
+    number = int(argv[0]) if argv else 100000
+    results = run(number)
+    for label in ('uncached', 'cached'):
+        print('%-10s %8.3f usec/message' % (label, results[label] * 1e6))
+    print('speedup    %8.2fx' % (results['uncached'] / results['cached']))
+
+    if results['cached'] >= results['uncached']:
+        print('The cache is no faster than formatting every message')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Memory benchmark for very large forms.
+
+Compares the memory held by a 1,000-field form bound with ordinary
+(dict-backed) fields and with compact fields (``COMPACT_FIELDS = True``),
+both as it's first rendered and after failed validation.  Only memory
+belonging to the form instance is counted; anything it shares with other
+instances of its class (labels, flags, widgets, validators...) isn't.  Run
+with::
+
+    $ python -m pecan_wtforms.tests.benchmarks.memory
+"""
+import gc
+import sys
+import types
+
+import pecan_wtforms
+from pecan_wtforms.tests.benchmarks.construction import make_form
+
+# Shared by definition, and the way to everything else in the process
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType,
+                 types.BuiltinFunctionType)
+
+
+def reachable(obj):
+    """
+    Return the objects reachable from ``obj``, keyed by ``id()``.
+    """
+    seen = {}
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SHARED_TYPES):
+            continue
+        seen[id(o)] = o
+        stack.extend(gc.get_referents(o))
+    return seen
+
+
+def form_size(form, other):
+    """
+    Return the number of bytes reachable from ``form`` but not from
+    ``other`` (another instance of its class).
+    """
+    shared = reachable(other)
+    return sum(
+        sys.getsizeof(o) for key, o in reachable(form).items()
+        if key not in shared
+    )
+
+
+def run(n=1000):
+    results = {}
+    for label, compact in (('standard', False), ('compact', True)):
+        formcls = type(
+            'MemoryForm', (make_form(pecan_wtforms.Form, n),),
+            {'COMPACT_FIELDS': compact}
+        )
+        rendered = form_size(formcls(), formcls())
+
+        invalid = []
+        for _ in range(2):
+            form = formcls(error_cfg={'auto_insert_errors': True})
+            form.validate()
+            form.insert_error_markup()
+            invalid.append(form)
+        results[label] = {
+            'rendered': rendered,
+            'invalid': form_size(*invalid)
+        }
+    return results
+
+
+def main(argv=sys.argv[1:]):
+    n = int(argv[0]) if argv else 1000
+    results = run(n)
+    for state in ('rendered', 'invalid'):
+        standard = results['standard'][state]
+        compact = results['compact'][state]
+        print('%-9s standard %8.1f KiB  compact %8.1f KiB  (%.0f%% less)' % (
+            state, standard / 1024.0, compact / 1024.0,
+            100.0 * (standard - compact) / standard
+        ))
+
+
+if __name__ == '__main__':
+    main()
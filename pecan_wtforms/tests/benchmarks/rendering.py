@@ -0,0 +1,47 @@
+"""
+Microbenchmark for rendering large forms with errors.
+
+Compares rendering each field individually (joining their HTML, as a
+template would) with ``Form.render``, for a form whose every field has an
+error.  Run with::
+
+    $ python -m pecan_wtforms.tests.benchmarks.rendering
+"""
+import sys
+import timeit
+
+import pecan_wtforms
+from pecan_wtforms.tests.benchmarks.construction import make_form
+
+
+def per_field(form):
+    return '\n'.join(
+        str(f) if f.type == 'CSRFTokenField' else '%s %s' % (f.label, f)
+        for f in form
+    )
+
+
+def run(n=200, number=200):
+    formcls = make_form(pecan_wtforms.Form, n)
+    form = formcls(error_cfg={'auto_insert_errors': True})
+    form.validate()
+    assert per_field(form) == form.render()
+
+    results = {}
+    for label, render in (('per-field', lambda: per_field(form)),
+                          ('render', form.render)):
+        seconds = min(timeit.repeat(render, repeat=3, number=number))
+        results[label] = seconds / number
+    return results
+
+
+def main(argv=sys.argv[1:]):
+    n = int(argv[0]) if argv else 200
+    results = run(n)
+    for label in ('per-field', 'render'):
+        print('%-10s %8.1f usec/form' % (label, results[label] * 1e6))
+    print('speedup    %8.2fx' % (results['per-field'] / results['render']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+
+class TestHotPathBenchmarks(TestCase):
+
+    def test_run(self):
+        from pecan_wtforms.tests.benchmarks.hotpaths import (
+            BENCHMARKS, run, ALLOCATION_METRIC
+        )
+        results = run(number=1, repeat=1)
+        assert sorted(results) == sorted(name for name, _ in BENCHMARKS)
+        for result in results.values():
+            assert result['ops_per_sec'] > 0
+            if ALLOCATION_METRIC is None:
+                # Python 2 can't count them
+                assert 'allocations' not in result
+            else:  # pragma: nocover
+                assert result['allocations'] > 0
+
+    def test_compare(self):
+        from pecan_wtforms.tests.benchmarks.hotpaths import compare
+        baseline = {
+            'allocation_metric': 'tracemalloc',
+            'results': {
+                'get': {'ops_per_sec': 1000.0, 'allocations': 100.0},
+                'render': {'ops_per_sec': 1000.0, 'allocations': 100.0}
+            }
+        }
+        assert compare({
+            'get': {'ops_per_sec': 900.0, 'allocations': 110.0},
+            'render': {'ops_per_sec': 2000.0, 'allocations': 50.0}
+        }, baseline, allocation_metric='tracemalloc') == []
+
+        regressions = compare({
+            'get': {'ops_per_sec': 500.0, 'allocations': 100.0},
+            'render': {'ops_per_sec': 1000.0, 'allocations': 200.0}
+        }, baseline, allocation_metric='tracemalloc')
+        assert len(regressions) == 2
+        assert regressions[0].startswith('get is 50.0% slower')
+        assert regressions[1].startswith('render allocates 100.0% more')
+
+    def test_compare_ignores_other_allocation_metrics(self):
+        from pecan_wtforms.tests.benchmarks.hotpaths import compare
+        baseline = {
+            'allocation_metric': 'something-else',
+            'results': {
+                'get': {'ops_per_sec': 1000.0, 'allocations': 1.0}
+            }
+        }
+        assert compare({
+            'get': {'ops_per_sec': 1000.0, 'allocations': 500.0}
+        }, baseline, allocation_metric='tracemalloc') == []
+
+    def test_compare_without_allocations(self):
+        from pecan_wtforms.tests.benchmarks.hotpaths import compare
+        baseline = {
+            'allocation_metric': None,
+            'results': {'get': {'ops_per_sec': 1000.0}}
+        }
+        assert compare({
+            'get': {'ops_per_sec': 1000.0}
+        }, baseline, allocation_metric=None) == []
+        assert len(compare({
+            'get': {'ops_per_sec': 500.0}
+        }, baseline, allocation_metric=None)) == 1
+
+
+class TestMemoryBenchmark(TestCase):
+
+    def test_compact_fields_use_less_memory(self):
+        from pecan_wtforms.tests.benchmarks.memory import run
+        results = run(n=20)
+        for state in ('rendered', 'invalid'):
+            assert results['compact'][state] < results['standard'][state]
+
+
+class TestMarkupBenchmark(TestCase):
+
+    def test_cached_messages_are_not_reformatted(self):
+        from pecan_wtforms.tests.benchmarks.markup import MESSAGES, run
+        results = run(number=10, repeat=2)
+        assert results['misses'] == len(MESSAGES)
+        assert results['hits'] == len(MESSAGES) * 10 * 2
+        assert results['cached'] > 0
+        assert results['uncached'] > 0
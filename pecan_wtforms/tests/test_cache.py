@@ -0,0 +1,182 @@
+from unittest import TestCase
+
+
+class FakeClock(object):
+    """
+    Replaces ``pecan_wtforms.cache.clock`` (until ``restore()``) with a
+    clock that only moves when it's told to.
+    """
+
+    def __init__(self, now=1000):
+        from pecan_wtforms import cache
+        self.now = now
+        self.original = cache.clock
+        cache.clock = lambda: self.now
+
+    def restore(self):
+        from pecan_wtforms import cache
+        cache.clock = self.original
+
+
+class TestLRUCache(TestCase):
+
+    def setUp(self):
+        self.clock_ = FakeClock()
+
+    def tearDown(self):
+        self.clock_.restore()
+
+    def test_eviction(self):
+        from pecan_wtforms.cache import LRUCache
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1  # 'b' is now least recently used
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    def test_ttl(self):
+        from pecan_wtforms.cache import LRUCache
+        cache = LRUCache(ttl=5)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=None)
+        assert cache.get('a') == 1
+        self.clock_.now += 4
+        assert cache.get('a') == 1
+        self.clock_.now += 1
+        assert cache.get('a') is None
+        self.clock_.now += 10 ** 6
+        assert cache.get('b') == 2
+
+    def test_stats(self):
+        from pecan_wtforms.cache import LRUCache
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        assert cache.stats() == {
+            'size': 1, 'hits': 1, 'misses': 1, 'hit_rate': 0.5
+        }
+        cache.clear()
+        assert cache.stats()['hits'] == 0
+
+
+class TestBoundedCache(TestCase):
+
+    def test_emptied_when_full(self):
+        from pecan_wtforms.cache import BoundedCache
+        cache = BoundedCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('b', 3)
+        assert cache.get('a') == 1
+        cache.set('c', 4)
+        assert cache.get('a') is None
+        assert cache.get('c') == 4
+        assert len(cache) == 1
+        assert cache.stats() == {
+            'size': 1, 'hits': 2, 'misses': 1, 'hit_rate': 2 / 3.0
+        }
+
+
+class TestMemoize(TestCase):
+
+    def setUp(self):
+        self.clock_ = FakeClock()
+
+    def tearDown(self):
+        self.clock_.restore()
+
+    def make_form(self, **kw):
+        import pecan_wtforms
+        calls = self.calls_ = []
+
+        def available(form, field):
+            calls.append(field.data)
+            if field.data == 'taken':
+                raise pecan_wtforms.ValidationError('Taken.')
+
+        self.validator_ = pecan_wtforms.memoize(available, **kw)
+
+        class SignupForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'memoize'
+            username = pecan_wtforms.fields.TextField("Username", [
+                pecan_wtforms.validators.Required(), self.validator_
+            ])
+        return SignupForm
+
+    def test_results_are_cached(self):
+        SignupForm = self.make_form()
+        for i in range(3):
+            assert SignupForm(username='ryan').validate()
+        assert self.calls_ == ['ryan']
+        assert self.validator_.hits == 2
+        assert self.validator_.misses == 1
+
+    def test_failures_are_cached(self):
+        SignupForm = self.make_form()
+        for i in range(2):
+            f = SignupForm(username='taken')
+            assert not f.validate()
+            assert f.errors == {'username': ['Taken.']}
+        assert self.calls_ == ['taken']
+
+    def test_failures_not_cached(self):
+        SignupForm = self.make_form(negative_ttl=0)
+        for i in range(2):
+            assert not SignupForm(username='taken').validate()
+        assert self.calls_ == ['taken', 'taken']
+
+    def test_normalize(self):
+        SignupForm = self.make_form(normalize=lambda v: v.strip().lower())
+        assert SignupForm(username='Ryan').validate()
+        assert SignupForm(username=' ryan ').validate()
+        assert self.calls_ == ['Ryan']
+
+    def test_ttl(self):
+        SignupForm = self.make_form(ttl=30)
+        SignupForm(username='ryan').validate()
+        self.clock_.now += 29
+        SignupForm(username='ryan').validate()
+        assert self.calls_ == ['ryan']
+        self.clock_.now += 1
+        SignupForm(username='ryan').validate()
+        assert self.calls_ == ['ryan', 'ryan']
+
+    def test_negative_ttl(self):
+        SignupForm = self.make_form(ttl=30, negative_ttl=5)
+        SignupForm(username='taken').validate()
+        self.clock_.now += 4
+        SignupForm(username='taken').validate()
+        assert self.calls_ == ['taken']
+        self.clock_.now += 1
+        SignupForm(username='taken').validate()
+        assert self.calls_ == ['taken', 'taken']
+
+    def test_unhashable_values_are_not_cached(self):
+        import pecan_wtforms
+        calls = []
+
+        def check(form, field):
+            calls.append(field.data)
+
+        class TagForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'memoize'
+            tags = pecan_wtforms.fields.SelectMultipleField(
+                "Tags",
+                [pecan_wtforms.memoize(check)],
+                choices=[('a', 'a')]
+            )
+
+        TagForm(tags=['a']).validate()
+        TagForm(tags=['a']).validate()
+        assert calls == [['a'], ['a']]
+
+    def test_deferred_can_not_be_memoized(self):
+        import pecan_wtforms
+        validator = pecan_wtforms.deferred(lambda form, field: None)
+        self.assertRaises(TypeError, pecan_wtforms.memoize, validator)
+        pecan_wtforms.deferred(pecan_wtforms.memoize(lambda f, field: None))
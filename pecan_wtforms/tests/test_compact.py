@@ -0,0 +1,101 @@
+from unittest import TestCase
+
+
+class TestCompactFields(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+
+        class SimpleForm(pecan_wtforms.Form):
+            SECRET_KEY = 'compact'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            color = pecan_wtforms.fields.SelectField("Color", choices=[
+                ('r', 'Red'), ('g', 'Green')
+            ])
+            price = pecan_wtforms.fields.DecimalField("Price", places=2)
+            hidden = pecan_wtforms.fields.HiddenField()
+            tags = pecan_wtforms.fields.FieldList(
+                pecan_wtforms.fields.TextField("Tag"),
+                min_entries=2
+            )
+
+        class CompactForm(SimpleForm):
+            COMPACT_FIELDS = True
+
+        self.formcls_ = SimpleForm
+        self.compactcls_ = CompactForm
+
+    def test_compact_fields(self):
+        from wtforms.fields import TextField, FieldList
+        from pecan_wtforms.compact import CompactLabel, CompactFlags
+        form = self.compactcls_()
+        assert isinstance(form.name, TextField)
+        assert form.name.type == 'TextField'
+        assert isinstance(form.tags, FieldList)
+        for field in (form.name, form.tags[0]):
+            assert '_compact_slots' in vars(type(field))
+            assert isinstance(field.label, CompactLabel)
+            assert isinstance(field.flags, CompactFlags)
+            assert field.errors == ()
+            assert field.process_errors == ()
+        assert form.name.flags.required is True
+        assert form.name.flags.optional is False
+        assert form.price.places == 2
+
+    def test_shared_metadata(self):
+        first, second = self.compactcls_(), self.compactcls_()
+        assert first.name is not second.name
+        assert first.name.label is second.name.label
+        assert first.name.flags is second.name.flags
+        assert first.name.validators is second.name.validators
+
+    def test_immutable_metadata(self):
+        from wtforms.fields.core import Label
+        form = self.compactcls_()
+        with self.assertRaises(AttributeError):
+            form.name.label.text = 'Changed'
+        with self.assertRaises(AttributeError):
+            form.name.flags.required = False
+
+        form.name.label = Label(form.name.id, 'Changed')
+        assert 'Changed' in str(form.name.label)
+        assert 'Changed' not in str(self.compactcls_().name.label)
+
+    def test_renders_the_same(self):
+        assert self.compactcls_().render() == self.formcls_().render()
+
+    def test_validates_the_same(self):
+        from webob.multidict import MultiDict
+        formdata = MultiDict({'color': 'x', 'price': 'abc', 'tags-0': 'a'})
+        forms = []
+        for cls in (self.formcls_, self.compactcls_):
+            form = cls(formdata, error_cfg={'auto_insert_errors': True})
+            assert form.validate() is False
+            form.insert_error_markup()
+            forms.append(form)
+        standard, compact = forms
+        assert compact.errors == standard.errors
+        assert compact.data == standard.data
+        assert compact.render() == standard.render()
+
+        # Errors can still be added after validation
+        compact.color.errors.append('Unavailable.')
+        assert 'Unavailable.' in compact.color()
+
+    def test_pooled(self):
+        from webob.multidict import MultiDict
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool()
+        form = pool.acquire(self.compactcls_, MultiDict({'name': 'Ryan'}))
+        form.validate()
+        form.name.errors.append('Taken.')
+        pool.release(form)
+
+        reused = pool.acquire(self.compactcls_)
+        assert reused is form
+        assert reused.name.data is None
+        assert reused.name.errors == ()
+        assert reused.render() == self.compactcls_().render()
@@ -125,3 +125,349 @@ class TestCSRFUtilities(TestCase):
         assert constant_time_compare('', '')
         assert constant_time_compare('A', 'A')
         assert not constant_time_compare('A', 'a')
+        assert not constant_time_compare('A', 'AB')
+        assert constant_time_compare(u'A', 'A')
+
+    def test_new_csrf_values(self):
+        from pecan_wtforms.form import _get_new_csrf_value
+        values = set(_get_new_csrf_value() for _ in range(1000))
+        assert len(values) == 1000
+        for value in values:
+            assert len(value) == 32
+            int(value, 16)
+
+    def test_random_pool_refills(self):
+        from pecan_wtforms.form import RandomPool
+        pool = RandomPool(size=32)
+        chunks = [pool.read(16) for _ in range(5)]
+        assert all(len(c) == 16 for c in chunks)
+        assert len(set(chunks)) == 5
+        assert len(pool.read(64)) == 64
+
+
+class TestSignedCSRFTokens(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose
+        from webtest import TestApp
+
+        class StripPasteVar(object):
+
+            def __init__(self, app):
+                self.app = app
+
+            def __call__(self, environ, start_response):
+                environ.pop('paste.testing')
+                return self.app(environ, start_response)
+
+        def make_form(keys):
+            class SignedForm(pecan_wtforms.form.SecureForm):
+                SECRET_KEY = 'signed'
+                CSRF_SIGNING_KEYS = keys
+                first_name = pecan_wtforms.fields.TextField("First Name")
+            return SignedForm
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(make_form(['new-key', 'old-key']))
+            def index(self, **kw):
+                return 'Hello, %s!' % kw.get('first_name', '')
+
+            @expose()
+            @pecan_wtforms.with_form(make_form(['old-key']))
+            def old(self, **kw):
+                return 'OK'
+
+            @expose()
+            @pecan_wtforms.with_form(make_form(['other-key']))
+            def other(self, **kw):
+                return 'OK'
+
+        self.app = TestApp(StripPasteVar(Pecan(RootController())))
+
+    def get_token(self, path='/'):
+        response = self.app.get(path)
+        return response.request.pecan['form'].csrf_token.current_token
+
+    def post(self, path, token, **kw):
+        return self.app.post(path, params={
+            'first_name': 'Ryan',
+            'csrf_token': token
+        }, headers={'Referer': 'http://localhost:80'}, **kw)
+
+    def test_token_is_signed(self):
+        token = self.get_token()
+        nonce = self.app.cookies['signed']
+        timestamp, signature = token.split('.')
+        assert signature != nonce
+        assert len(signature) == 64
+
+    def test_valid_token(self):
+        response = self.post('/', self.get_token())
+        assert response.request.pecan['form'].errors == {}
+        assert response.body == 'Hello, Ryan!'
+
+    def test_key_rotation(self):
+        # Tokens signed with a retired key are still accepted...
+        response = self.post('/', self.get_token('/old'))
+        assert response.body == 'Hello, Ryan!'
+
+        # ...but not tokens signed with an unknown key
+        response = self.post('/', self.get_token('/other'),
+                             expect_errors=True)
+        assert response.status_int == 403
+        assert response.request.pecan['form'].errors == {
+            'csrf_token': ['CSRF token incorrect.']
+        }
+
+    def test_token_bound_to_cookie(self):
+        token = self.get_token()
+        self.app.reset()
+        self.app.get('/')  # a different client (with a new cookie)
+        response = self.post('/', token, expect_errors=True)
+        assert response.status_int == 403
+
+    def test_tampered_token(self):
+        token = self.get_token()
+        timestamp, signature = token.split('.')
+        for bad in ('%d.%s' % (int(timestamp) + 1, signature),
+                    'abc.%s' % signature, signature, 'ABC123'):
+            response = self.post('/', bad, expect_errors=True)
+            assert response.status_int == 403
+            assert response.request.pecan['form'].errors == {
+                'csrf_token': ['CSRF token incorrect.']
+            }
+
+    def test_expired_token(self):
+        import time
+        from pecan_wtforms.form import SecureForm
+        token = self.get_token()
+        nonce = self.app.cookies['signed']
+        stale = SecureForm.sign_csrf_token.im_func(
+            None, nonce, int(time.time()) - 60 * 60 * 25, 'new-key'
+        )
+        assert token != stale
+        response = self.post('/', stale, expect_errors=True)
+        assert response.status_int == 403
+        assert response.request.pecan['form'].errors == {
+            'csrf_token': ['CSRF token expired.']
+        }
+
+
+class TestCSRFCookieRenewal(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose
+        from webtest import TestApp
+
+        class StripPasteVar(object):
+
+            def __init__(self, app):
+                self.app = app
+
+            def __call__(self, environ, start_response):
+                environ.pop('paste.testing')
+                return self.app(environ, start_response)
+
+        class RenewingForm(pecan_wtforms.form.SecureForm):
+            SECRET_KEY = 'renewing'
+            CSRF_COOKIE_MAX_AGE = 60 * 60
+            CSRF_COOKIE_RENEW_WINDOW = 60
+            first_name = pecan_wtforms.fields.TextField("First Name")
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(RenewingForm)
+            def index(self, **kw):
+                return 'Hello, %s!' % kw.get('first_name', '')
+
+            @expose()
+            @pecan_wtforms.with_form(RenewingForm, csrf_cookie=False)
+            def cacheable(self, **kw):
+                return 'Hello, %s!' % kw.get('first_name', '')
+
+        self.app = TestApp(StripPasteVar(Pecan(RootController())))
+
+    def test_cookie_issued_once(self):
+        response = self.app.get('/')
+        cookie = self.app.cookies['renewing']
+        token = response.request.pecan['form'].csrf_token.current_token
+        value, issued = cookie.split('.')
+        assert value == token
+        assert 'Set-Cookie' in response.headers
+
+        response = self.app.get('/')
+        assert 'Set-Cookie' not in response.headers
+        assert response.request.pecan['form'].csrf_token.current_token == \
+            token
+
+        response = self.app.post('/', params={
+            'first_name': 'Ryan',
+            'csrf_token': token
+        }, headers={'Referer': 'http://localhost:80'})
+        assert response.body == 'Hello, Ryan!'
+        assert 'Set-Cookie' not in response.headers
+
+    def test_cookie_renewed_near_expiry(self):
+        import time
+        self.app.cookies['renewing'] = 'abc123.%d' % (time.time() - 3590)
+        response = self.app.get('/')
+        assert 'Set-Cookie' in response.headers
+        value, issued = self.app.cookies['renewing'].split('.')
+        assert value == 'abc123'
+        assert int(issued) >= time.time() - 5
+        assert response.request.pecan['form'].csrf_token.current_token == \
+            'abc123'
+
+    def test_legacy_cookie_renewed(self):
+        self.app.cookies['renewing'] = 'abc123'
+        response = self.app.get('/')
+        assert 'Set-Cookie' in response.headers
+        assert self.app.cookies['renewing'].startswith('abc123.')
+
+    def test_no_cookie_mode(self):
+        response = self.app.get('/cacheable')
+        assert 'Set-Cookie' not in response.headers
+        assert response.request.pecan['form'].csrf_token.current_token == ''
+
+        # A client which already has a cookie gets its token
+        self.app.get('/')
+        token = self.app.cookies['renewing'].split('.')[0]
+        response = self.app.get('/cacheable')
+        assert 'Set-Cookie' not in response.headers
+        assert response.request.pecan['form'].csrf_token.current_token == \
+            token
+
+    def test_no_cookie_mode_rejects_missing_cookie(self):
+        response = self.app.post('/cacheable', params={
+            'first_name': 'Ryan',
+            'csrf_token': 'abc123'
+        }, headers={'Referer': 'http://localhost:80'}, expect_errors=True)
+        assert response.status_int == 403
+
+
+class TestTrustedOrigins(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose
+        from webtest import TestApp
+
+        class StripPasteVar(object):
+
+            def __init__(self, app):
+                self.app = app
+
+            def __call__(self, environ, start_response):
+                environ.pop('paste.testing')
+                return self.app(environ, start_response)
+
+        class TrustingForm(pecan_wtforms.form.SecureForm):
+            SECRET_KEY = 'trusting'
+            TRUSTED_ORIGINS = [
+                'https://example.com',
+                'https://*.example.org',
+                'http://lb.example.com:8080'
+            ]
+            first_name = pecan_wtforms.fields.TextField("First Name")
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(TrustingForm)
+            def index(self, **kw):
+                return 'Hello, %s!' % kw.get('first_name', '')
+
+        self.app = TestApp(StripPasteVar(Pecan(RootController())))
+
+    def post(self, referer):
+        response = self.app.get('/')
+        token = response.request.pecan['form'].csrf_token.current_token
+        return self.app.post('/', params={
+            'first_name': 'Ryan',
+            'csrf_token': token
+        }, headers={'Referer': referer}, expect_errors=True)
+
+    def test_trusted_referers(self):
+        for referer in (
+            'http://localhost:80/some/page',
+            'http://localhost/',
+            'https://example.com/signup?next=/',
+            'https://EXAMPLE.com:443',
+            'https://www.example.org/',
+            'https://a.b.example.org/page',
+            'http://lb.example.com:8080/'
+        ):
+            response = self.post(referer)
+            assert response.body == 'Hello, Ryan!', referer
+
+    def test_untrusted_referers(self):
+        for referer in (
+            'http://example.com/',
+            'https://example.com:8443/',
+            'https://example.org/',
+            'https://www.example.org.evil.com/',
+            'https://evil.com/?https://example.com/',
+            'http://lb.example.com/',
+            'not a url'
+        ):
+            response = self.post(referer)
+            assert response.status_int == 403, referer
+            assert response.request.pecan['form'].errors == {
+                'csrf_token': [('Referer checking failed - %s does not match '
+                                'http://localhost:80/.') % referer]
+            }
+
+
+class TestOriginMatcher(TestCase):
+
+    def test_parse_origin(self):
+        from pecan_wtforms.origins import parse_origin
+        assert parse_origin('http://example.com') == \
+            ('http', 'example.com', 80)
+        assert parse_origin('HTTPS://User@Example.com:8443/path?q#f') == \
+            ('https', 'example.com', 8443)
+        assert parse_origin('https://example.com?x=/') == \
+            ('https', 'example.com', 443)
+        assert parse_origin('/relative/path') is None
+        assert parse_origin('http://example.com:bad/') is None
+
+    def test_parsed_origins_are_cached(self):
+        from pecan_wtforms.origins import parse_origin, origin_cache
+        origin_cache.clear()
+        parse_origin('http://example.com/a')
+        parse_origin('http://example.com/b?c')
+        assert len(origin_cache) == 1
+        assert origin_cache.hits == 1
+
+    def test_matcher(self):
+        from pecan_wtforms.origins import OriginMatcher
+        matcher = OriginMatcher([
+            'https://example.com',
+            'http://*.example.org'
+        ])
+        assert matcher.matches(('https', 'example.com', 443))
+        assert not matcher.matches(('http', 'example.com', 80))
+        assert matcher.matches(('http', 'a.example.org', 80))
+        assert not matcher.matches(('http', 'example.org', 80))
+        assert not matcher.matches(('http', 'a.example.org', 8080))
+
+    def test_invalid_origin(self):
+        from pecan_wtforms.origins import OriginMatcher
+        self.assertRaises(ValueError, OriginMatcher, ['example.com'])
+
+    def test_matcher_compiled_per_class(self):
+        import pecan_wtforms
+        from pecan_wtforms.origins import get_origin_matcher
+
+        class SomeForm(pecan_wtforms.SecureForm):
+            TRUSTED_ORIGINS = ['https://example.com']
+
+        matcher = get_origin_matcher(SomeForm)
+        assert get_origin_matcher(SomeForm) is matcher
+        SomeForm.TRUSTED_ORIGINS = ['https://example.org']
+        assert get_origin_matcher(SomeForm) is not matcher
+        assert get_origin_matcher(SomeForm).matches(
+            ('https', 'example.org', 443)
+        )
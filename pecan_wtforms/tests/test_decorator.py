@@ -276,6 +276,41 @@ class TestValidatorCoercion(TestCase):
         assert response.request.pecan['form'].errors == {}
 
 
+class TestPlainWTForm(TestCase):
+
+    def setUp(self):
+        import wtforms
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+
+        class PlainForm(wtforms.form.Form):
+            name = wtforms.fields.TextField(
+                "Name",
+                [wtforms.validators.Required()]
+            )
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(PlainForm, error_cfg={
+                'auto_insert_errors': True
+            })
+            def index(self, **kw):
+                return repr(request.pecan['form'].errors)
+
+        self.app = TestApp(Pecan(RootController()))
+
+    def test_get(self):
+        response = self.app.get('/')
+        assert response.body == '{}'
+
+    def test_post(self):
+        response = self.app.post('/', params={'name': ''})
+        assert response.body == "{'name': [u'This field is required.']}"
+        response = self.app.post('/', params={'name': 'Ryan'})
+        assert response.body == '{}'
+
+
 class TestCustomHandler(TestCase):
 
     def setUp(self):
@@ -608,6 +643,14 @@ class TestAutoErrorMarkup(TestCase):
             def save(self, **kw):
                 return 'SAVED!'  # pragma: nocover
 
+            @expose('name.html')
+            @pecan_wtforms.with_form(SimpleForm, error_cfg={
+                'auto_insert_errors': True
+            })
+            def taken(self, **kw):
+                request.pecan['form'].last_name.errors = ['Taken.']
+                return dict()
+
         template_path = os.path.join(
                 os.path.dirname(__file__),
                 'templates'
@@ -635,6 +678,10 @@ class TestAutoErrorMarkup(TestCase):
             'last_name': [u'This field is required.']
         }
 
+    def test_errors_added_by_controller(self):
+        response = self.app.get('/taken')
+        assert '<span class="error-message">Taken.</span>' in response.body
+
 
 class TestRESTControllerHandler(TestCase):
 
@@ -714,3 +761,505 @@ class TestRESTControllerHandler(TestCase):
         assert response.request.pecan['form'].errors == {
             'last_name': [u'This field is required.']
         }
+
+
+class TestLazyForm(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request, redirect
+        from webtest import TestApp
+
+        built = self.built_ = []
+
+        class SimpleForm(pecan_wtforms.form.SecureForm):
+            SECRET_KEY = 'lazy'
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            last_name = pecan_wtforms.fields.TextField(
+                "Last Name",
+                [pecan_wtforms.validators.Required()]
+            )
+
+            def __init__(self, *args, **kwargs):
+                built.append(self)
+                super(SimpleForm, self).__init__(*args, **kwargs)
+
+        self.formcls_ = SimpleForm
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, lazy=True)
+            def index(self):
+                assert isinstance(request.pecan['form'], SimpleForm)
+                return 'Hello, World!'
+
+            @expose('name.html')
+            @pecan_wtforms.with_form(SimpleForm, lazy=True)
+            def name(self):
+                return dict()
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, lazy=True)
+            def elsewhere(self):
+                redirect('/')
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, lazy=True)
+            def save(self, **kw):
+                return '%s %s' % (
+                    kw.get('first_name', ''),
+                    kw.get('last_name', '')
+                )
+
+        template_path = os.path.join(
+                os.path.dirname(__file__),
+                'templates'
+        )
+
+        self.app = TestApp(Pecan(
+            RootController(),
+            template_path=template_path
+        ))
+
+    def test_untouched_form_is_never_built(self):
+        response = self.app.get('/')
+        assert response.body == 'Hello, World!'
+        assert isinstance(response.request.pecan['form'], self.formcls_)
+        assert self.built_ == []
+        assert 'Set-Cookie' not in response.headers
+
+    def test_redirect_skips_construction(self):
+        response = self.app.get('/elsewhere')
+        assert response.status_int == 302
+        assert self.built_ == []
+        assert 'Set-Cookie' not in response.headers
+
+    def test_template_builds_form(self):
+        response = self.app.get('/name')
+
+        assert len(self.built_) == 1
+        assert '<label for="first_name">First Name</label>' in response.body
+        assert '<input id="first_name" name="first_name" type="text" ' \
+                'value="">' in response.body
+        assert 'Set-Cookie' in response.headers
+
+    def test_unsafe_methods_are_eager(self):
+        response = self.app.post('/save', params={
+            'first_name': 'Ryan',
+            'last_name': 'Petrello'
+        })
+        assert response.body == 'Ryan Petrello'
+        assert len(self.built_) == 1
+        assert response.request.pecan['form'] is self.built_[0]
+
+
+class TestDirectHandler(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose
+        from pecan.hooks import PecanHook
+        from webtest import TestApp
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            last_name = pecan_wtforms.fields.TextField(
+                "Last Name",
+                [pecan_wtforms.validators.Required()]
+            )
+        self.formcls_ = SimpleForm
+
+        routed = self.routed_ = []
+
+        class CountingHook(PecanHook):
+            def on_route(self, state):
+                routed.append(state.request.path)
+
+        class RootController(object):
+
+            @expose('name.html')
+            @pecan_wtforms.with_form(SimpleForm)
+            def index(self, **kw):
+                return dict()
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, error_cfg={
+                'handler': index,
+                'auto_insert_errors': True
+            })
+            def save(self, **kw):
+                return 'SAVED!'
+
+        template_path = os.path.join(
+                os.path.dirname(__file__),
+                'templates'
+        )
+
+        # No RecursiveMiddleware; an internal redirect would fail
+        self.app = TestApp(Pecan(
+            RootController(),
+            template_path=template_path,
+            hooks=[CountingHook()]
+        ))
+
+    def test_no_errors(self):
+        response = self.app.post('/save', params={
+            'first_name': 'Ryan',
+            'last_name': 'Petrello'
+        })
+        assert response.body == 'SAVED!'
+        assert response.request.pecan['form'].errors == {}
+
+    def test_direct_error_handler(self):
+        response = self.app.post('/save', params={
+            'first_name': 'Ryan',
+        })
+
+        assert self.routed_ == ['/save']
+        assert isinstance(response.namespace['form'], self.formcls_)
+        assert response.request.pecan['form'] is response.namespace['form']
+        assert response.request.pecan['form'].errors == {
+            'last_name': [u'This field is required.']
+        }
+        assert ('<input id="first_name" name="first_name" type="text" '
+                'value="Ryan">') in response.body
+        assert ''.join([
+            '<label for="last_name">Last Name</label>: ',
+            '<span class="error-message">This field is required.</span>\n',
+            ('<input class="error" id="last_name" name="last_name" type="text"'
+            ' value="">')
+        ]) in response.body
+
+
+class TestDirectGenericHandlerWithHooks(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose
+        from pecan.hooks import PecanHook, HookController
+        from webtest import TestApp
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            last_name = pecan_wtforms.fields.TextField("Last Name")
+        self.formcls_ = SimpleForm
+
+        before = self.before_ = []
+
+        class RecordingHook(PecanHook):
+            def before(self, state):
+                before.append(state.controller)
+
+        class RootController(HookController):
+            __hooks__ = [RecordingHook()]
+
+            @expose(generic=True, template='name.html')
+            @pecan_wtforms.with_form(SimpleForm)
+            def index(self, **kw):
+                return dict()
+
+            @index.when(method='POST')
+            @pecan_wtforms.with_form(SimpleForm, error_cfg={
+                'handler': index,
+                'hooks': True
+            })
+            def save(self, **kw):
+                return 'SAVED!'
+
+        template_path = os.path.join(
+                os.path.dirname(__file__),
+                'templates'
+        )
+
+        self.app = TestApp(Pecan(
+            RootController(),
+            template_path=template_path
+        ))
+
+    def test_handler_hooks(self):
+        response = self.app.post('/', params={})
+        assert len(self.before_) == 2
+        assert self.before_[0] is not self.before_[1]
+        assert '<label for="first_name">First Name</label>' in response.body
+        assert response.request.pecan['form'].errors == {
+            'first_name': [u'This field is required.']
+        }
+
+
+class TestJSONSource(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose
+        from webtest import TestApp
+
+        class AddressForm(pecan_wtforms.Form):
+            SECRET_KEY = 'json'
+            city = pecan_wtforms.fields.TextField(
+                "City",
+                [pecan_wtforms.validators.Required()]
+            )
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'json'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            age = pecan_wtforms.fields.IntegerField("Age")
+            price = pecan_wtforms.fields.DecimalField("Price")
+            active = pecan_wtforms.fields.BooleanField("Active")
+            tags = pecan_wtforms.fields.SelectMultipleField("Tags", choices=[
+                ('a', 'A'), ('b', 'B')
+            ])
+            address = pecan_wtforms.fields.FormField(AddressForm)
+
+        class RootController(object):
+            @expose('json')
+            @pecan_wtforms.with_form(SimpleForm, source='json', error_cfg={
+                'auto_insert_errors': True, 'handler': '/'
+            })
+            def index(self, **kw):
+                return {
+                    'name': kw['name'],
+                    'age': kw['age'],
+                    'price': str(kw['price']),
+                    'active': kw['active'],
+                    'tags': kw['tags'],
+                    'city': kw['address']['city']
+                }
+
+            @expose('json')
+            @pecan_wtforms.with_form(SimpleForm, source='json',
+                                     error_status=422)
+            def unprocessable(self, **kw):
+                return {}
+
+        self.app = TestApp(Pecan(RootController()))
+
+    def test_valid_json(self):
+        response = self.app.post_json('/', {
+            'name': 'Ryan',
+            'age': 30,
+            'price': 9.99,
+            'active': True,
+            'tags': ['a', 'b'],
+            'address': {'city': 'Atlanta'}
+        })
+        assert response.status_int == 200
+        assert response.json == {
+            'name': 'Ryan',
+            'age': 30,
+            'price': '9.99',
+            'active': True,
+            'tags': ['a', 'b'],
+            'city': 'Atlanta'
+        }
+
+    def test_false_boolean(self):
+        response = self.app.post_json('/', {
+            'name': 'Ryan',
+            'active': False,
+            'address': {'city': 'Atlanta'}
+        })
+        assert response.json['active'] is False
+
+    def test_invalid_json(self):
+        response = self.app.post_json('/', {
+            'age': 'old',
+            'active': False,
+            'address': {}
+        }, expect_errors=True)
+        assert response.status_int == 400
+        assert response.content_type == 'application/json'
+        assert response.json == {'errors': {
+            'name': ['This field is required.'],
+            'age': ['Not a valid integer value'],
+            'address': {'city': ['This field is required.']}
+        }}
+        form = response.request.pecan['form']
+        assert form.active.data is False
+        assert form._error_options is None
+        assert 'error-message' not in str(form.name)
+
+    def test_error_status(self):
+        response = self.app.post_json('/unprocessable', {},
+                                      expect_errors=True)
+        assert response.status_int == 422
+        assert response.json['errors']['name'] == ['This field is required.']
+
+    def test_malformed_json(self):
+        for body in ('{"name": ', '["Ryan"]'):
+            response = self.app.post('/', body, headers={
+                'Content-Type': 'application/json'
+            }, expect_errors=True)
+            assert response.status_int == 400
+            assert response.json == {'errors': {
+                '': ['Malformed JSON request body.']
+            }}
+
+    def test_unknown_source(self):
+        import pecan_wtforms
+        self.assertRaises(ValueError, pecan_wtforms.with_form,
+                          pecan_wtforms.Form, source='xml')
+
+
+class TestIndexedSources(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+        from pecan_wtforms.formdata import IndexedFormData, dumps
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'indexed'
+            name = pecan_wtforms.fields.TextField("Name")
+            page = pecan_wtforms.fields.TextField("Page")
+
+        def controller(source):
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, source=source)
+            def index(self, **kw):
+                formdata = pecan_wtforms.decorator.request_formdata()
+                assert isinstance(formdata, IndexedFormData)
+                assert pecan_wtforms.decorator.request_formdata() is formdata
+                return dumps(request.pecan['form'].data)
+            return index
+
+        class RootController(object):
+            post = controller('post')
+            get = controller('get')
+            both = controller('both')
+
+        self.app = TestApp(Pecan(RootController()))
+
+    def test_post(self):
+        from pecan_wtforms.formdata import loads
+        response = self.app.post('/post?page=2', params={'name': 'Ryan'})
+        assert loads(response.body) == {'name': 'Ryan', 'page': ''}
+
+    def test_get(self):
+        from pecan_wtforms.formdata import loads
+        response = self.app.post('/get?page=2', params={'name': 'Ryan'})
+        assert loads(response.body) == {'name': '', 'page': '2'}
+
+    def test_both(self):
+        from pecan_wtforms.formdata import loads
+        response = self.app.post('/both?page=2', params={'name': 'Ryan'})
+        assert loads(response.body) == {'name': 'Ryan', 'page': '2'}
+
+
+class TestWithForms(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from pecan.middleware.recursive import RecursiveMiddleware
+        from webtest import TestApp
+
+        class SearchForm(pecan_wtforms.SecureForm):
+            SECRET_KEY = 'multi'
+            q = pecan_wtforms.fields.TextField(
+                "Query",
+                [pecan_wtforms.validators.Required()]
+            )
+
+        class SignupForm(pecan_wtforms.SecureForm):
+            SECRET_KEY = 'multi'
+            email = pecan_wtforms.fields.TextField(
+                "Email",
+                [pecan_wtforms.validators.Required()],
+                default='you@example.com'
+            )
+
+        forms = {'search': SearchForm, 'signup': (SignupForm, 'newsletter')}
+        error_cfg = {'auto_insert_errors': True}
+
+        def describe():
+            return repr(dict(
+                (key, request.pecan[key].errors)
+                for key in request.pecan['submitted_forms']
+            ))
+
+        class RootController(object):
+
+            @expose()
+            @pecan_wtforms.with_forms(forms, error_cfg=error_cfg)
+            def index(self, **kw):
+                return describe()
+
+            @expose()
+            @pecan_wtforms.with_forms(forms, error_cfg=dict(
+                error_cfg, handler='/'
+            ))
+            def save(self, **kw):
+                return 'SAVED! ' + describe()
+
+        self.app = TestApp(RecursiveMiddleware(Pecan(RootController())))
+
+    def test_get(self):
+        response = self.app.get('/')
+        pecan = response.request.pecan
+        assert pecan['submitted_forms'] == []
+        assert pecan['search'].q.name == 'search-q'
+        assert pecan['signup'].email.name == 'newsletter-email'
+        assert pecan['signup'].email.data == 'you@example.com'
+
+        # One token, and one cookie
+        token = pecan['search'].csrf_token.current_token
+        assert token
+        assert pecan['signup'].csrf_token.current_token == token
+        assert len(response.headers.getall('Set-Cookie')) == 1
+
+    def test_get_with_query(self):
+        response = self.app.get('/?search-q=pecan')
+        pecan = response.request.pecan
+        assert pecan['submitted_forms'] == ['search']
+        assert pecan['search'].q.data == 'pecan'
+        assert pecan['search'].errors == {}
+
+    def test_only_submitted_forms_validated(self):
+        response = self.app.post('/save', params={
+            'search-q': 'pecan',
+            'email': 'not-prefixed'
+        })
+        assert response.body == "SAVED! {'search': {}}"
+        pecan = response.request.pecan
+        assert pecan['signup'].errors == {}
+        assert pecan['signup'].email.data == 'you@example.com'
+
+    def test_no_form_submitted(self):
+        response = self.app.post('/save', params={
+            'q': 'pecan',
+            'email': 'not-prefixed'
+        }, expect_errors=True)
+        assert response.status_int == 400
+        assert 'SAVED!' not in response.body
+
+        # Safe requests still render every form
+        response = self.app.get('/', params={'validate': '1'})
+        assert response.status_int == 200
+
+    def test_error_handler(self):
+        response = self.app.post('/save', params={
+            'search-q': 'pecan',
+            'newsletter-email': ''
+        })
+        assert not response.body.startswith('SAVED!')
+        pecan = response.request.pecan
+        assert pecan['submitted_forms'] == ['search', 'signup']
+        assert pecan['signup'].errors == {
+            'email': ['This field is required.']
+        }
+        assert 'This field is required.' in pecan['signup'].email()
+        assert pecan['search'].q.data == 'pecan'
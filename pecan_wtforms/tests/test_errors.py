@@ -68,3 +68,103 @@ class TestErrorWidget(TestCase):
         f = self.make_form(config={'class_': 'failure'})
         assert f.errors == {'name': ['This field is required.']}
         assert '<input class="failure"' in str(f.name)
+
+
+class TestSharedErrorWidgets(TestCase):
+
+    def test_widgets_are_shared(self):
+        from pecan_wtforms import TextInput
+        from pecan_wtforms.errors import error_widget, widget_options
+        widget = TextInput()
+        options = widget_options({'prepend_errors': False})
+        assert error_widget(widget, options) is error_widget(widget, options)
+        assert error_widget(widget, options) is not error_widget(
+            TextInput(), options
+        )
+        assert error_widget(widget, options) is not error_widget(
+            widget, widget_options({})
+        )
+
+    def test_widget_options(self):
+        from pecan_wtforms.errors import widget_options, default_formatter
+        assert widget_options({}) == (True, 'error', default_formatter)
+        assert widget_options({
+            'handler': '/',
+            'auto_insert_errors': True,
+            'class_': 'failure'
+        }) == (True, 'failure', default_formatter)
+
+    def test_iter_render(self):
+        import pecan_wtforms
+        from pecan_wtforms.errors import ErrorMarkupWidget
+
+        class SimpleForm(pecan_wtforms.Form):
+            SECRET_KEY = 'errors'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.validators.Required()]
+            )
+
+        f = SimpleForm()
+        f.validate()
+        for widget in (ErrorMarkupWidget(f.name.widget),
+                       ErrorMarkupWidget(f.name.widget, False),
+                       ErrorMarkupWidget(ErrorMarkupWidget(f.name.widget))):
+            chunks = list(widget.iter_render(f.name, class_='big'))
+            assert len(chunks) > 1
+            assert u''.join(chunks) == widget(f.name, class_='big')
+
+
+class TestErrorMarkupCache(TestCase):
+
+    def setUp(self):
+        from pecan_wtforms.errors import markup_cache
+        markup_cache.clear()
+
+    def test_default_formatter_is_cached(self):
+        from pecan_wtforms.errors import ErrorMarkupWidget, markup_cache
+        widget = ErrorMarkupWidget(None)
+        expected = ''.join([
+            '<span class="error-message">Error &lt;1&gt;</span>\n',
+            '<span class="error-message">Error 2</span>\n'
+        ])
+        assert widget.format_errors(['Error <1>', 'Error 2']) == expected
+        assert widget.format_errors(['Error <1>', 'Error 2']) == expected
+        assert markup_cache.stats() == {
+            'size': 2, 'hits': 2, 'misses': 2, 'hit_rate': 0.5
+        }
+
+    def test_custom_formatters_opt_in(self):
+        from pecan_wtforms.errors import ErrorMarkupWidget, markup_cache
+        calls = []
+
+        def formatter(msg):
+            calls.append(msg)
+            return 'OMG! %s' % msg
+
+        widget = ErrorMarkupWidget(None, formatter=formatter)
+        widget.format_errors(['Error'])
+        widget.format_errors(['Error'])
+        assert len(calls) == 2
+        assert len(markup_cache) == 0
+
+        formatter.cacheable = True
+        widget.format_errors(['Error'])
+        widget.format_errors(['Error'])
+        assert len(calls) == 3
+        assert len(markup_cache) == 1
+
+    def test_bounded(self):
+        from pecan_wtforms.errors import MarkupCache, default_formatter
+        cache = MarkupCache(maxsize=2)
+        for msg in ('A', 'B', 'C', 'C'):
+            assert cache.format(default_formatter, msg) == \
+                default_formatter(msg)
+        assert len(cache) == 1
+        assert cache.misses == 3
+        assert cache.hits == 1
+
+        # The cache was emptied to make room for 'C'
+        assert cache.get((default_formatter, 'A')) is None
+        assert cache.get((default_formatter, 'B')) is None
+        assert cache.get((default_formatter, 'C')) is not None
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+
+PNG = '\x89PNG\r\n\x1a\n' + 'x' * 5000
+
+
+class TestMappedFile(TestCase):
+
+    def setUp(self):
+        self.dir_ = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_)
+
+    def upload(self, content, spool_threshold=1024):
+        from pecan_wtforms.multipart import UploadedFile
+        upload = UploadedFile('avatar', 'avatar.png', 'image/png',
+                              spool_threshold=spool_threshold,
+                              spool_dir=self.dir_)
+        upload.write(content)
+        upload.finish()
+        return upload
+
+    def test_spooled_file(self):
+        from pecan_wtforms.files import MappedFile
+        mapped = MappedFile(self.upload(PNG))
+        assert mapped.path is not None
+        assert mapped.size == len(PNG)
+        assert mapped.head(4) == '\x89PNG'
+        assert mapped.startswith('GIF8', '\x89PNG')
+        assert not mapped.startswith('GIF8')
+        assert bytes(mapped.view(1, 3)) == 'PNG'
+        assert mapped.digest() == hashlib.sha256(PNG).hexdigest()
+        assert mapped.digest('md5') == hashlib.md5(PNG).hexdigest()
+        mapped.close()
+
+    def test_in_memory_file(self):
+        from pecan_wtforms.files import MappedFile
+        mapped = MappedFile(self.upload('GIF89a', spool_threshold=1024))
+        assert mapped.path is None
+        assert mapped.size == 6
+        assert mapped.head(4) == 'GIF8'
+        assert mapped.digest() == hashlib.sha256('GIF89a').hexdigest()
+
+    def test_file_like_objects(self):
+        from pecan_wtforms.files import MappedFile
+
+        class FieldStorage(object):
+            filename = 'a.txt'
+            type = 'text/plain'
+
+            def __init__(self, f):
+                self.file = f
+
+        f = tempfile.TemporaryFile()
+        f.write('Hello, World!')
+        f.seek(0)
+        for storage in (FieldStorage(f),
+                        FieldStorage(BytesIO('Hello, World!'))):
+            mapped = MappedFile(storage)
+            assert mapped.size == 13
+            assert mapped.head(5) == 'Hello'
+            assert mapped.content_type == 'text/plain'
+
+    def test_empty_file(self):
+        from pecan_wtforms.files import MappedFile
+
+        class FieldStorage(object):
+            filename = 'empty.txt'
+            type = 'text/plain'
+
+            def __init__(self, f):
+                self.file = f
+
+        for upload in (self.upload(''), FieldStorage(BytesIO()),
+                       FieldStorage(tempfile.TemporaryFile())):
+            mapped = MappedFile(upload)
+            assert mapped.size == 0
+            assert mapped.head(4) == ''
+            assert mapped.digest() == hashlib.sha256('').hexdigest()
+
+    def test_move_renames_spooled_file(self):
+        from pecan_wtforms.files import MappedFile
+        upload = self.upload(PNG)
+        spooled = upload.path
+        destination = os.path.join(self.dir_, 'final.png')
+
+        MappedFile(upload).move_to(destination)
+        assert not os.path.exists(spooled)
+        assert open(destination, 'rb').read() == PNG
+
+        # The temporary file is no longer the upload's to remove
+        upload.close()
+        assert os.path.exists(destination)
+
+    def test_move_copies_in_memory_file(self):
+        from pecan_wtforms.files import MappedFile
+        destination = os.path.join(self.dir_, 'final.gif')
+        MappedFile(self.upload('GIF89a')).move_to(destination)
+        assert open(destination, 'rb').read() == 'GIF89a'
+
+    def test_sendfile(self):
+        from pecan_wtforms.files import MappedFile
+        out = tempfile.TemporaryFile()
+        MappedFile(self.upload(PNG)).sendfile(out)
+        out.seek(0)
+        assert out.read() == PNG
+
+
+class TestMappedFileField(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+        from pecan_wtforms.files import (MappedFileField, FileSize,
+                                         FileSignature)
+
+        class AvatarForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'files'
+            avatar = MappedFileField("Avatar", [
+                FileSize(max_size=10000),
+                FileSignature('\x89PNG\r\n\x1a\n', '\xff\xd8\xff')
+            ])
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(AvatarForm)
+            def index(self, **kw):
+                form = request.pecan['form']
+                if form.errors:
+                    return repr(form.errors['avatar'])
+                if kw['avatar'] is None:
+                    return 'No avatar'
+                return '%s %s' % (kw['avatar'].filename, kw['avatar'].size)
+
+        self.app = TestApp(Pecan(RootController()))
+
+    def test_valid_upload(self):
+        response = self.app.post('/', upload_files=[
+            ('avatar', 'avatar.png', PNG)
+        ])
+        assert response.body == 'avatar.png %d' % len(PNG)
+
+    def test_signature(self):
+        response = self.app.post('/', upload_files=[
+            ('avatar', 'avatar.gif', 'GIF89a')
+        ])
+        assert 'Invalid file type.' in response.body
+
+    def test_size(self):
+        response = self.app.post('/', upload_files=[
+            ('avatar', 'avatar.png', PNG * 3)
+        ])
+        assert 'Invalid file size.' in response.body
+
+    def test_no_upload(self):
+        response = self.app.post('/', params={'avatar': ''})
+        assert response.body == 'No avatar'
@@ -126,3 +126,431 @@ class TestFormWithErrorMarkup(TestCase):
                 in str(f.first_name)
         assert '<span class="error-message">This field is required.</span>' \
                 in str(f.last_name)
+
+    def test_errorless_fields_are_not_wrapped(self):
+        import pecan_wtforms
+        from pecan_wtforms.errors import ErrorMarkupWidget
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            last_name = pecan_wtforms.fields.TextField(
+                "Last Name",
+                [pecan_wtforms.validators.Required()]
+            )
+
+        cfg = {'auto_insert_errors': True}
+        a = SimpleForm(first_name='Ryan', error_cfg=cfg)
+        b = SimpleForm(first_name='Ryan', error_cfg=cfg)
+        a.validate()
+        b.validate()
+        assert cfg == {'auto_insert_errors': True}
+        assert 'widget' not in a.first_name.__dict__
+        assert isinstance(a.last_name.widget, ErrorMarkupWidget)
+        assert a.last_name.widget is b.last_name.widget
+
+        # Errors added after validation are marked up on request
+        a.first_name.errors.append('Not allowed.')
+        a.insert_error_markup()
+        assert '<span class="error-message">Not allowed.</span>' \
+                in str(a.first_name)
+
+    def test_errors_added_by_hand(self):
+        import pecan_wtforms
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            first_name = pecan_wtforms.fields.TextField("First Name")
+
+        # Markup isn't set up at construction (without ``with_form``, errors
+        # added by hand need ``insert_error_markup()``)
+        f = SimpleForm(error_cfg={'auto_insert_errors': True})
+        f.first_name.errors = ['Not allowed.']
+        assert 'error-message' not in str(f.first_name)
+        f.insert_error_markup()
+        assert '<span class="error-message">Not allowed.</span>' \
+                in str(f.first_name)
+
+
+class TestFormPlan(TestCase):
+
+    def make_form(self):
+        import pecan_wtforms
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'plan'
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            age = pecan_wtforms.fields.IntegerField("Age")
+
+        return SimpleForm
+
+    def test_plan_is_cached(self):
+        from pecan_wtforms.plan import get_plan
+        SimpleForm = self.make_form()
+        assert get_plan(SimpleForm) is get_plan(SimpleForm)
+        assert [name for name, _ in get_plan(SimpleForm).fields] == [
+            'csrf_token', 'first_name', 'age'
+        ]
+
+    def test_subclass_has_own_plan(self):
+        import pecan_wtforms
+        from pecan_wtforms.plan import get_plan
+        SimpleForm = self.make_form()
+
+        class ExtendedForm(SimpleForm):
+            last_name = pecan_wtforms.fields.TextField("Last Name")
+
+        assert get_plan(ExtendedForm) is not get_plan(SimpleForm)
+        assert 'last_name' in ExtendedForm()
+        assert 'last_name' not in SimpleForm()
+
+    def test_plan_invalidated_by_new_field(self):
+        import pecan_wtforms
+        from pecan_wtforms.plan import get_plan
+        SimpleForm = self.make_form()
+        plan = get_plan(SimpleForm)
+
+        SimpleForm.last_name = pecan_wtforms.fields.TextField("Last Name")
+        f = SimpleForm(last_name='Petrello')
+        assert get_plan(SimpleForm) is not plan
+        assert f.last_name.data == 'Petrello'
+
+    def test_prototypes_bounded(self):
+        import pecan_wtforms
+        from webob.multidict import MultiDict
+        from pecan_wtforms.plan import FormPlan, get_plan
+        SimpleForm = self.make_form()
+
+        class RowsForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'plan'
+            rows = pecan_wtforms.fields.FieldList(
+                pecan_wtforms.fields.FormField(SimpleForm)
+            )
+
+        data = {}
+        for i in range(FormPlan.MAX_PREFIXES * 3):
+            data['rows-%d-first_name' % i] = 'Row %d' % i
+        form = RowsForm(MultiDict(data))
+        assert form.rows[-1].first_name.data == 'Row %d' % i
+        assert len(get_plan(SimpleForm).prototypes) <= FormPlan.MAX_PREFIXES
+
+    def test_bound_state_is_not_shared(self):
+        SimpleForm = self.make_form()
+        a, b = SimpleForm(first_name='Ryan'), SimpleForm()
+
+        a.first_name.label.text = 'Changed'
+        a.first_name.validators.append(lambda form, field: None)
+        a.first_name.flags.custom = True
+        assert b.first_name.label.text == 'First Name'
+        assert len(b.first_name.validators) == 1
+        assert not b.first_name.flags.custom
+
+        b.validate()
+        assert a.first_name.data == 'Ryan'
+        assert a.first_name.errors == ()
+        assert b.first_name.errors == ['This field is required.']
+        assert SimpleForm().first_name.errors == ()
+
+    def test_prototyped_fields_match_constructed_fields(self):
+        from wtforms.form import BaseForm
+        SimpleForm = self.make_form()
+        planned = SimpleForm(prefix='person', age=30)
+        constructed = BaseForm(SimpleForm._unbound_fields, prefix='person')
+        constructed.process(age=30)
+
+        for name in ('first_name', 'age'):
+            assert str(planned[name]) == str(constructed[name])
+            assert str(planned[name].label) == str(constructed[name].label)
+            assert planned[name].type == constructed[name].type
+
+    def test_inline_validators(self):
+        import pecan_wtforms
+        SimpleForm = self.make_form()
+
+        class InlineForm(SimpleForm):
+            def validate_first_name(self, field):
+                if field.data != 'Ryan':
+                    raise pecan_wtforms.ValidationError('Not Ryan.')
+
+        f = InlineForm(first_name='Bob')
+        assert not f.validate()
+        assert f.errors == {'first_name': ['Not Ryan.']}
+        f = InlineForm(first_name='Ryan')
+        assert f.validate()
+
+    def test_default_secret_key_warns_once(self):
+        import warnings
+        import pecan_wtforms
+
+        class InsecureForm(pecan_wtforms.form.Form):
+            name = pecan_wtforms.fields.TextField("Name")
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            InsecureForm()
+            InsecureForm()
+        assert len(w) == 1
+        assert issubclass(w[0].category, RuntimeWarning)
+
+
+class TestFormRendering(TestCase):
+
+    def make_form(self, error_cfg={}, **kw):
+        import pecan_wtforms
+
+        class SimpleForm(pecan_wtforms.Form):
+            SECRET_KEY = 'rendering'
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            age = pecan_wtforms.fields.IntegerField(
+                "Age",
+                [pecan_wtforms.validators.NumberRange(0, 150)]
+            )
+            secret = pecan_wtforms.fields.HiddenField("Secret")
+            country = pecan_wtforms.fields.SelectField("Country", choices=[
+                ('us', 'United States'), ('ca', 'Canada')
+            ])
+
+        return SimpleForm(error_cfg=error_cfg, **kw)
+
+    def per_field(self, form, names=None):
+        fields = form if names is None else [form[n] for n in names]
+        return '\n'.join(
+            str(f) if f.type in ('HiddenField', 'CSRFTokenField')
+            else '%s %s' % (f.label, f)
+            for f in fields
+        )
+
+    def test_render(self):
+        form = self.make_form(first_name='Ryan', age=30)
+        html = form.render()
+        assert html == self.per_field(form)
+        assert html.__html__() == html
+
+    def test_render_with_errors(self):
+        for config in ({}, {'prepend_errors': False},
+                       {'class_': 'failure'}):
+            config = dict(config, auto_insert_errors=True)
+            form = self.make_form(config, age=300)
+            assert not form.validate()
+            html = form.render()
+            assert 'This field is required.' in html
+            assert 'Number must be between 0 and 150.' in html
+            assert html == self.per_field(form)
+
+    def test_render_hidden_field_with_errors(self):
+        import pecan_wtforms
+
+        class TokenForm(pecan_wtforms.Form):
+            SECRET_KEY = 'rendering'
+            token = pecan_wtforms.fields.HiddenField(
+                "Token",
+                [pecan_wtforms.validators.Required()]
+            )
+
+        form = TokenForm(error_cfg={'auto_insert_errors': True})
+        assert not form.validate()
+        html = form.render()
+        assert 'This field is required.' in html
+        assert '<label' not in html
+        assert html == self.per_field(form)
+
+    def test_render_after_setup_errors(self):
+        form = self.make_form(first_name='Ryan')
+        form.setup_errors({})
+        html = form.render()
+        assert '<label for="secret">' not in html
+        assert '<label for="csrf_token">' not in html
+        assert html == self.per_field(form)
+
+    def test_render_fields(self):
+        form = self.make_form()
+        assert form.render(['age', 'secret']) == \
+            self.per_field(form, ['age', 'secret'])
+
+    def test_iter_render(self):
+        form = self.make_form({'auto_insert_errors': True})
+        form.validate()
+        chunks = list(form.iter_render())
+        assert u''.join(chunks) == form.render()
+        assert u'<span class="error-message">This field is required.' \
+               u'</span>\n' in chunks
+
+    def test_stream(self):
+        from pecan import Pecan, expose
+        from webtest import TestApp
+        make_form = self.make_form
+        expected = make_form(first_name=u'Ren\xe9e').render()
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return make_form(first_name=u'Ren\xe9e').stream()
+
+        response = TestApp(Pecan(RootController())).get('/')
+        assert response.content_type == 'text/html'
+        assert response.body.decode('utf-8') == expected
+
+    def test_stream_with_request_state(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+        from wtforms.widgets import HTMLString
+
+        def path_widget(field, **kwargs):
+            return HTMLString(request.path)
+
+        class PathForm(pecan_wtforms.Form):
+            SECRET_KEY = 'render'
+            path = pecan_wtforms.fields.TextField("Path", widget=path_widget)
+
+        class RootController(object):
+            @expose()
+            def signup(self):
+                return PathForm().stream(['path'])
+
+        response = TestApp(Pecan(RootController())).get('/signup')
+        assert response.body.endswith('/signup')
+
+
+class TestHasFieldData(TestCase):
+
+    def test_has_field_data(self):
+        import pecan_wtforms
+        from webob.multidict import MultiDict
+        from pecan_wtforms.form import has_field_data
+
+        class AddressForm(pecan_wtforms.Form):
+            SECRET_KEY = 'field-data'
+            city = pecan_wtforms.fields.TextField("City")
+
+        class SimpleForm(pecan_wtforms.Form):
+            SECRET_KEY = 'field-data'
+            name = pecan_wtforms.fields.TextField("Name")
+            address = pecan_wtforms.fields.FormField(AddressForm)
+            tags = pecan_wtforms.fields.FieldList(
+                pecan_wtforms.fields.TextField("Tag")
+            )
+
+        form = SimpleForm()
+        for data, expected in (
+            ({}, False),
+            ({'page': '2', 'csrf_token': 'x'}, False),
+            ({'name': ''}, True),
+            ({'address-city': 'Atlanta'}, True),
+            ({'tags-0': 'a'}, True),
+            ({'addressed': 'x'}, False)
+        ):
+            assert has_field_data(form, MultiDict(data)) is expected, data
+
+
+class TestBulkValidation(TestCase):
+
+    def make_form(self):
+        import pecan_wtforms
+
+        class RowForm(pecan_wtforms.SecureForm):
+            SECRET_KEY = 'bulk'
+            sku = pecan_wtforms.fields.TextField(
+                "SKU",
+                [pecan_wtforms.validators.Required()]
+            )
+            quantity = pecan_wtforms.fields.IntegerField(
+                "Quantity",
+                [pecan_wtforms.validators.NumberRange(1, 100)]
+            )
+
+            def validate_sku(self, field):
+                if field.data == 'BANNED':
+                    raise pecan_wtforms.ValidationError('Banned SKU.')
+
+        return RowForm
+
+    def test_validate_many(self):
+        from webob.multidict import MultiDict
+        RowForm = self.make_form()
+        results = RowForm.validate_many([
+            {'sku': 'A1', 'quantity': '5'},
+            {'quantity': 500},
+            MultiDict({'sku': 'B2', 'quantity': '1'}),
+            {'sku': 'BANNED', 'quantity': '1'},
+            {}
+        ])
+        assert results == [
+            None,
+            {
+                'sku': ['This field is required.'],
+                'quantity': ['Number must be between 1 and 100.']
+            },
+            None,
+            {'sku': ['Banned SKU.']},
+            {
+                'sku': ['This field is required.'],
+                'quantity': ['Number must be between 1 and 100.']
+            }
+        ]
+
+    def test_iter_validate(self):
+        RowForm = self.make_form()
+        rows = iter([
+            {'sku': 'A1', 'quantity': '5'},
+            {'sku': 'A2', 'quantity': 'many'}
+        ])
+        results = RowForm.iter_validate(rows)
+        data, errors = next(results)
+        assert data == {'sku': 'A1', 'quantity': 5}
+        assert errors is None
+        data, errors = next(results)
+        assert data == {'sku': 'A2', 'quantity': None}
+        assert errors == {'quantity': [
+            'Not a valid integer value',
+            'Number must be between 1 and 100.'
+        ]}
+        self.assertRaises(StopIteration, next, results)
+
+    def test_empty_row_after_full_row(self):
+        import pecan_wtforms
+
+        class RowForm(pecan_wtforms.Form):
+            SECRET_KEY = 'bulk'
+            sku = pecan_wtforms.fields.TextField(
+                "SKU",
+                [pecan_wtforms.validators.InputRequired()]
+            )
+            note = pecan_wtforms.fields.TextField(
+                "Note",
+                [pecan_wtforms.validators.Optional(),
+                 pecan_wtforms.validators.Length(max=3)]
+            )
+
+        assert RowForm.validate_many([
+            {'sku': 'A1', 'note': 'long'},
+            {}
+        ]) == [
+            {'note': ['Field cannot be longer than 3 characters.']},
+            {'sku': ['This field is required.']}
+        ]
+
+    def test_deferred_validators(self):
+        import pecan_wtforms
+
+        def check(form, field):
+            if field.data == 'taken':
+                raise pecan_wtforms.ValidationError('Taken.')
+
+        class RowForm(pecan_wtforms.Form):
+            SECRET_KEY = 'bulk'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.deferred(check)]
+            )
+
+        assert RowForm.validate_many([
+            {'name': 'free'}, {'name': 'taken'}
+        ]) == [None, {'name': ['Taken.']}]
@@ -0,0 +1,168 @@
+from unittest import TestCase
+
+
+class TestDictFormData(TestCase):
+
+    def test_flatten(self):
+        from pecan_wtforms.formdata import DictFormData
+        data = DictFormData({
+            'name': 'Ryan',
+            'age': 30,
+            'missing': None,
+            'active': True,
+            'deleted': False,
+            'tags': ['a', 'b'],
+            'address': {'city': 'Atlanta', 'zip': {'code': 30303}},
+            'items': [{'sku': 'X'}, {'sku': 'Y'}]
+        })
+        assert data.getlist('name') == ['Ryan']
+        assert data.getlist('age') == [u'30']
+        assert 'missing' not in data
+        assert data.getlist('active') == [u'y']
+        assert 'deleted' not in data
+        assert data.getlist('tags') == ['a', 'b']
+        assert data['address-city'] == 'Atlanta'
+        assert data['address-zip-code'] == u'30303'
+        assert data['items-0-sku'] == 'X'
+        assert data['items-1-sku'] == 'Y'
+        assert data.get('nothing', 'default') == 'default'
+        assert len(data) == 10
+
+    def test_lists_of_values(self):
+        from pecan_wtforms.formdata import DictFormData
+        data = DictFormData({
+            'tags': ['x', 'y'],
+            'scores': [None, 1, False, 2.5],
+            'empty': [],
+            'nulls': [None]
+        })
+        assert data.getlist('tags') == ['x', 'y']
+        assert data['tags-0'] == 'x'
+        assert data['tags-1'] == 'y'
+        assert data.getlist('scores') == [u'1', u'2.5']
+        assert data.indices('scores') == [1, 3]
+        assert 'empty' not in data
+        assert 'nulls' not in data
+        assert 'nulls-0' not in data
+
+    def test_field_lists(self):
+        import pecan_wtforms
+        from pecan_wtforms.formdata import DictFormData
+
+        class TagForm(pecan_wtforms.Form):
+            SECRET_KEY = 'formdata'
+            tags = pecan_wtforms.fields.FieldList(
+                pecan_wtforms.fields.TextField()
+            )
+            colors = pecan_wtforms.fields.SelectMultipleField(choices=[
+                ('r', 'Red'), ('g', 'Green'), ('b', 'Blue')
+            ])
+
+        form = TagForm(DictFormData({
+            'tags': ['x', 'y'],
+            'colors': ['r', 'b']
+        }))
+        assert form.tags.data == ['x', 'y']
+        assert form.colors.data == ['r', 'b']
+        assert form.validate()
+
+    def test_float_round_trip(self):
+        import pecan_wtforms
+        from pecan_wtforms.formdata import DictFormData
+
+        class PriceForm(pecan_wtforms.Form):
+            SECRET_KEY = 'formdata'
+            price = pecan_wtforms.fields.FloatField("Price")
+
+        for price in (0.1, 1234567.891011, 1e-07, 2 ** 0.5, 1e+22):
+            data = DictFormData({'price': price})
+            assert PriceForm(data).price.data == price
+
+    def test_prefix_index(self):
+        from pecan_wtforms.formdata import DictFormData
+        data = DictFormData({
+            'address': {'city': 'Atlanta', 'zip': {'code': 30303}},
+            'items': [{'sku': 'X'}, {'sku': 'Y'}],
+            'tags': ['a']
+        })
+        assert sorted(data.prefixed('address')) == [
+            'address-city', 'address-zip-code'
+        ]
+        assert data.prefixed('address-zip') == ['address-zip-code']
+        assert data.indices('items') == [0, 1]
+        assert data.indices('address') == []
+        assert data.prefixed('tags') == ['tags-0']
+        assert data.indices('tags') == [0]
+
+
+class TestIndexedFormData(TestCase):
+
+    def test_lookups(self):
+        from webob.multidict import MultiDict
+        from pecan_wtforms.formdata import IndexedFormData
+        data = IndexedFormData(MultiDict([
+            ('name', 'Ryan'), ('tags', 'a'), ('tags', 'b'),
+            ('items-10-sku', 'X'), ('items-2-sku', 'Y'), ('items-2', 'Z'),
+            ('items-x', 'ignored'), ('itemsx-3', 'ignored')
+        ]).items())
+        assert data['name'] == 'Ryan'
+        assert data['tags'] == 'b'
+        assert data.getlist('tags') == ['a', 'b']
+        assert data.getall('missing') == []
+        assert 'items-2' in data
+        assert len(data) == 7
+        assert data.indices('items') == [2, 10]
+        assert data.indices('items-2') == []
+        assert sorted(data.prefixed('items')) == [
+            'items-10-sku', 'items-2', 'items-2-sku', 'items-x'
+        ]
+        assert data.prefixed('items-2') == ['items-2-sku']
+        self.assertRaises(KeyError, data.__getitem__, 'missing')
+
+    def test_field_list(self):
+        import pecan_wtforms
+        from webob.multidict import MultiDict
+        from pecan_wtforms.formdata import IndexedFormData, IndexedFieldList
+
+        class ItemForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'indexed'
+            sku = pecan_wtforms.fields.TextField()
+
+        class OrderForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'indexed'
+            items = IndexedFieldList(
+                pecan_wtforms.fields.FormField(ItemForm, separator='-')
+            )
+
+        pairs = [('items-3-sku', 'B'), ('items-1-sku', 'A'), ('other', 'C')]
+        indexed = OrderForm(IndexedFormData(pairs))
+        assert indexed.items.data == [{'sku': 'A'}, {'sku': 'B'}]
+        assert [e.name for e in indexed.items] == ['items-1', 'items-3']
+
+        # Unindexed form data is still supported
+        assert OrderForm(MultiDict(pairs)).data == indexed.data
+
+    def test_plain_field_list(self):
+        import pecan_wtforms
+        from wtforms.fields import FieldList
+        from webob.multidict import MultiDict
+        from pecan_wtforms.formdata import IndexedFormData
+
+        class UnscannableFormData(IndexedFormData):
+            def __iter__(self):
+                raise AssertionError('every name was scanned')
+
+        for compact in (False, True):
+            class TagForm(pecan_wtforms.form.Form):
+                SECRET_KEY = 'indexed'
+                COMPACT_FIELDS = compact
+                tags = pecan_wtforms.fields.FieldList(
+                    pecan_wtforms.fields.TextField()
+                )
+
+            pairs = [('tags-1', 'b'), ('tags-0', 'a'), ('other', 'c')]
+            form = TagForm(UnscannableFormData(pairs))
+            assert form.tags.data == ['a', 'b']
+            assert form.tags.type == 'FieldList'
+            assert isinstance(form.tags, FieldList)
+            assert TagForm(MultiDict(pairs)).tags.data == ['a', 'b']
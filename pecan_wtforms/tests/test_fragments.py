@@ -0,0 +1,117 @@
+from unittest import TestCase
+
+
+class TestFragmentCache(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan_wtforms.fragments import FragmentCache
+
+        class SimpleForm(pecan_wtforms.Form):
+            SECRET_KEY = 'fragments'
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            country = pecan_wtforms.fields.SelectField("Country", choices=[
+                ('us', 'United States'), ('ca', 'Canada')
+            ])
+
+        class TokenForm(SimpleForm):
+            def generate_csrf_token(self, context):
+                return context.get('token', 'TOKEN')
+
+        self.formcls_ = SimpleForm
+        self.tokencls_ = TokenForm
+        self.cache = FragmentCache()
+
+    def test_render_matches_uncached(self):
+        from pecan_wtforms.fragments import render_fields
+        for formcls in (self.formcls_, self.tokencls_):
+            form = formcls()
+            assert self.cache.render(form) == render_fields(form)
+            assert self.cache.render(formcls()) == render_fields(form)
+
+    def test_token_substituted(self):
+        html = self.cache.render(self.tokencls_(csrf_context={'token': 'A'}))
+        assert 'value="A"' in html
+        html = self.cache.render(self.tokencls_(csrf_context={'token': 'B'}))
+        assert 'value="B"' in html
+        assert 'value="A"' not in html
+        assert self.cache.stats()['hits'] == 1
+        assert len(self.cache.cache) == 1
+
+    def test_token_escaped(self):
+        html = self.cache.render(self.tokencls_(csrf_context={'token': '"<'}))
+        assert 'value="&quot;&lt;"' in html
+
+    def test_fields_subset(self):
+        form = self.tokencls_()
+        html = self.cache.render(form, ('first_name',))
+        assert 'first_name' in html
+        assert 'country' not in html
+        assert 'country' in self.cache.render(form)
+        assert len(self.cache.cache) == 2
+
+    def test_keyed_by_prefix_defaults_and_choices(self):
+        self.cache.render(self.tokencls_())
+        self.cache.render(self.tokencls_(prefix='other'))
+        self.cache.render(self.tokencls_(first_name='Ryan'))
+
+        form = self.tokencls_()
+        form.country.choices = [('mx', 'Mexico')]
+        html = self.cache.render(form)
+        assert 'Mexico' in html
+        assert 'Canada' not in html
+        assert len(self.cache.cache) == 4
+        assert self.cache.stats()['hits'] == 0
+
+    def test_keyed_by_error_config(self):
+        self.cache.render(self.tokencls_())
+        self.cache.render(self.tokencls_(error_cfg={
+            'auto_insert_errors': True
+        }))
+        assert len(self.cache.cache) == 2
+
+    def test_invalidated_when_fields_change(self):
+        import pecan_wtforms
+        self.cache.render(self.tokencls_())
+        self.tokencls_.last_name = pecan_wtforms.fields.TextField("Last Name")
+        self.tokencls_._unbound_fields = None
+        html = self.cache.render(self.tokencls_())
+        assert 'last_name' in html
+        assert self.cache.stats()['hits'] == 0
+
+    def test_bypassed_with_formdata(self):
+        from webob.multidict import MultiDict
+        form = self.tokencls_(MultiDict({'first_name': 'Ryan'}))
+        assert 'value="Ryan"' in self.cache.render(form)
+        assert len(self.cache.cache) == 0
+
+    def test_unrelated_formdata_cached(self):
+        from webob.multidict import MultiDict
+        form = self.tokencls_(MultiDict({'page': '2', 'utm_source': 'x'}))
+        assert self.cache.render(form) == form.render()
+        assert len(self.cache.cache) == 1
+
+        prefixed = self.tokencls_(MultiDict({'first_name': 'Ryan'}),
+                                  prefix='other-')
+        self.cache.render(prefixed)
+        assert len(self.cache.cache) == 2
+        prefixed = self.tokencls_(MultiDict({'other-first_name': 'Ryan'}),
+                                  prefix='other-')
+        assert 'value="Ryan"' in self.cache.render(prefixed)
+        assert len(self.cache.cache) == 2
+
+    def test_bypassed_with_errors(self):
+        form = self.tokencls_(error_cfg={'auto_insert_errors': True})
+        form.validate()
+        html = self.cache.render(form)
+        assert 'This field is required.' in html
+        assert len(self.cache.cache) == 0
+
+    def test_unhashable_defaults_bypass(self):
+        form = self.tokencls_()
+        form.first_name.data = set(['unhashable'])
+        self.cache.render(form)
+        assert len(self.cache.cache) == 0
@@ -0,0 +1,154 @@
+from unittest import TestCase
+
+
+class TestSinks(TestCase):
+
+    def tearDown(self):
+        from pecan_wtforms import instrument
+        instrument.set_sink(None)
+
+    def test_disabled_by_default(self):
+        from pecan_wtforms import instrument
+        assert isinstance(instrument.get_sink(), instrument.NullSink)
+        assert instrument.start() is None
+        instrument.record(None, 'process', object)
+
+    def test_memory_sink(self):
+        from pecan_wtforms import instrument
+        sink = instrument.MemorySink()
+        instrument.set_sink(sink)
+        assert instrument.start() is not None
+
+        instrument.add(0.5, 'validation', TestSinks, 'name')
+        instrument.add(1.5, 'validation', TestSinks, 'name')
+        instrument.add(1.0, 'process', self)
+        stats = sink.stats()
+        assert stats[('validation', 'TestSinks', None, 'name')] == {
+            'count': 2, 'total': 2.0, 'mean': 1.0, 'min': 0.5, 'max': 1.5
+        }
+        assert stats[('process', 'TestSinks', None, None)]['count'] == 1
+
+        sink.clear()
+        assert sink.stats() == {}
+
+    def test_statsd_sink(self):
+        import socket
+        from pecan_wtforms import instrument
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            instrument.set_sink(instrument.StatsdSink(
+                port=server.getsockname()[1]
+            ))
+            instrument.add(0.25, 'validation', TestSinks, 'first name',
+                           ctx=('RootController.save', None))
+            packet = server.recv(1024)
+        finally:
+            server.close()
+        assert packet == (
+            b'pecan_wtforms.validation.TestSinks.RootController_save.'
+            b'first_name:250.000|ms'
+        )
+
+
+class TestCacheStats(TestCase):
+
+    def test_cache_stats(self):
+        from pecan_wtforms import instrument
+        from pecan_wtforms.errors import ErrorMarkupWidget, markup_cache
+        import pecan_wtforms.fragments  # noqa
+        markup_cache.clear()
+        widget = ErrorMarkupWidget(None)
+        widget.format_errors(['Required.', 'Required.'])
+
+        stats = instrument.cache_stats()
+        assert stats['error_markup'] == {
+            'size': 1, 'hits': 1, 'misses': 1, 'hit_rate': 0.5
+        }
+        assert 'origins' in stats
+        assert 'fragments' in stats
+
+
+class TestFormInstrumentation(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from pecan.middleware.recursive import RecursiveMiddleware
+        from webtest import TestApp
+        from pecan_wtforms import instrument
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'instrument'
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+        self.formcls_ = SimpleForm
+
+        class RootController(object):
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm)
+            def index(self, **kw):
+                return request.pecan['form'].render()
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm)
+            def stream(self, **kw):
+                return request.pecan['form'].stream()
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, error_cfg={
+                'auto_insert_errors': True, 'handler': '/'
+            })
+            def save(self, **kw):
+                return 'SAVED!'
+
+        self.app = TestApp(RecursiveMiddleware(Pecan(RootController())))
+        self.sink = instrument.MemorySink()
+        instrument.set_sink(self.sink)
+
+    def tearDown(self):
+        from pecan_wtforms import instrument
+        instrument.set_sink(None)
+
+    def test_stages(self):
+        response = self.app.post('/save', params={})
+        timings = response.request.environ['pecan_wtforms.timings']
+        stages = set((stage, form) for stage, form, _, _ in timings)
+        for stage in ('construction', 'process', 'csrf', 'validation',
+                      'errors', 'redirect', 'render'):
+            assert (stage, 'SimpleForm') in stages, stage
+        for _, _, _, seconds in timings:
+            assert seconds >= 0
+
+        stats = self.sink.stats()
+        assert ('validation', 'SimpleForm', 'RootController.save',
+                'first_name') in stats
+        assert ('csrf', 'SimpleForm', 'RootController.save',
+                'csrf_token') in stats
+        assert ('render', 'SimpleForm', 'RootController.index',
+                None) in stats
+
+    def test_iter_render(self):
+        form = self.formcls_()
+        assert u''.join(form.iter_render()) == form.render()
+        stats = self.sink.stats()
+        assert stats[('render', 'SimpleForm', None, None)]['count'] == 2
+
+    def test_streamed_render(self):
+        response = self.app.get('/stream')
+        assert 'first_name' in response.body
+        timings = response.request.environ['pecan_wtforms.timings']
+        assert 'render' in [stage for stage, _, _, _ in timings]
+        assert ('render', 'SimpleForm', 'RootController.stream',
+                None) in self.sink.stats()
+
+    def test_parallel_validation(self):
+        form = self.formcls_()
+        assert form.validate(parallel=True) is False
+        stats = self.sink.stats()
+        assert ('validation', 'SimpleForm', None, 'first_name') in stats
+        assert ('csrf', 'SimpleForm', None, 'csrf_token') in stats
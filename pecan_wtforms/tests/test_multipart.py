@@ -0,0 +1,240 @@
+import os
+from io import BytesIO
+from unittest import TestCase
+
+BOUNDARY = 'XyZzY'
+
+
+def encode(fields=(), files=()):
+    lines = []
+    for name, value in fields:
+        lines.extend([
+            '--' + BOUNDARY,
+            'Content-Disposition: form-data; name="%s"' % name,
+            '',
+            value
+        ])
+    for name, filename, content in files:
+        lines.extend([
+            '--' + BOUNDARY,
+            ('Content-Disposition: form-data; name="%s"; filename="%s"' %
+                (name, filename)),
+            'Content-Type: application/octet-stream',
+            '',
+            content
+        ])
+    lines.extend(['--' + BOUNDARY + '--', ''])
+    return '\r\n'.join(lines)
+
+
+class TestParser(TestCase):
+
+    def parse(self, body, **kw):
+        from pecan_wtforms.multipart import parse
+        return parse(BytesIO(body), BOUNDARY, len(body), **kw)
+
+    def test_fields(self):
+        formdata = self.parse(encode([
+            ('first_name', 'Ryan'),
+            ('tag', 'a'),
+            ('tag', 'b'),
+            ('empty', '')
+        ]))
+        assert formdata.getlist('first_name') == [u'Ryan']
+        assert formdata.getlist('tag') == [u'a', u'b']
+        assert formdata.getlist('empty') == [u'']
+        assert formdata.getlist('missing') == []
+        assert 'tag' in formdata
+        assert len(formdata) == 3
+
+    def test_small_chunks(self):
+        content = 'A\r\n-' * 100 + '--XyZz'
+        for chunk_size in (1, 3, 7, 64):
+            formdata = self.parse(encode(
+                [('first_name', 'Ryan')],
+                [('upload', 'data.bin', content)]
+            ), chunk_size=chunk_size)
+            assert formdata['first_name'] == u'Ryan'
+            upload = formdata['upload']
+            assert upload.filename == u'data.bin'
+            assert upload.read() == content
+            upload.close()
+
+    def test_files_in_memory(self):
+        formdata = self.parse(encode(files=[('upload', 'a.txt', 'Hello')]))
+        upload = formdata['upload']
+        assert upload.path is None
+        assert upload.size == 5
+        assert upload.type == 'application/octet-stream'
+        assert upload.read() == 'Hello'
+
+    def test_files_spooled_to_disk(self):
+        content = 'x' * 1000
+        formdata = self.parse(
+            encode(files=[('upload', 'a.txt', content)]),
+            spool_threshold=100,
+            chunk_size=64
+        )
+        upload = formdata['upload']
+        assert upload.path is not None
+        assert os.path.getsize(upload.path) == 1000
+        assert upload.read() == content
+
+        formdata.close()
+        assert not os.path.exists(upload.path)
+
+    def test_limits(self):
+        from pecan_wtforms.multipart import UploadTooLarge
+
+        class Body(BytesIO):
+            read_bytes = 0
+
+            def read(self, size=-1):
+                data = BytesIO.read(self, size)
+                self.read_bytes += len(data)
+                return data
+
+        from pecan_wtforms.multipart import parse
+        body = encode(files=[('upload', 'a.txt', 'x' * 100000)])
+        fp = Body(body)
+        try:
+            parse(fp, BOUNDARY, len(body), limits={'upload': 1000},
+                  chunk_size=512)
+        except UploadTooLarge as e:
+            assert e.name == u'upload'
+            assert e.limit == 1000
+        else:
+            raise AssertionError(  # pragma: nocover
+                'UploadTooLarge not raised'
+            )
+
+        # Parsing stopped as soon as the limit was reached
+        assert fp.read_bytes < 4096
+
+    def test_max_part_size(self):
+        from pecan_wtforms.multipart import UploadTooLarge
+        body = encode([('name', 'x' * 100)])
+        self.assertRaises(UploadTooLarge, self.parse, body, max_part_size=10)
+        self.parse(body, max_part_size=10, limits={'name': 100})
+
+    def test_max_text_size(self):
+        from pecan_wtforms.multipart import UploadTooLarge
+        body = encode([('name', 'x' * 100)], [('upload', 'a.txt', 'x' * 100)])
+        self.assertRaises(UploadTooLarge, self.parse, body, max_text_size=10)
+        self.parse(body, max_text_size=10, limits={'name': 100})
+        self.parse(body, max_text_size=10, max_part_size=100)
+        self.parse(body, max_text_size=None)
+
+    def test_malformed(self):
+        from pecan_wtforms.multipart import MalformedBody
+        self.assertRaises(MalformedBody, self.parse, 'garbage')
+        body = encode([('name', 'Ryan')])
+        self.assertRaises(MalformedBody, self.parse, body[:-20])
+
+
+class TestStreamingMiddleware(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+        from pecan_wtforms.multipart import StreamingFormDataMiddleware
+
+        uploads = self.uploads_ = []
+
+        class UploadForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'multipart'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            upload = pecan_wtforms.fields.FileField("Upload")
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(UploadForm)
+            def index(self, **kw):
+                upload = kw['upload']
+                if not hasattr(upload, 'filename'):
+                    return '%s %s' % (kw['name'], upload)
+                assert request.POST['upload'] is upload
+                uploads.append(upload)
+                return '%s %s %d %s' % (
+                    kw['name'], upload.filename, upload.size,
+                    upload.path is not None
+                )
+
+            @expose()
+            def plain(self, name, upload):
+                assert request.POST['name'] == name
+                return '%s %s %s' % (name, upload.filename, upload.read())
+
+        self.app = TestApp(StreamingFormDataMiddleware(
+            Pecan(RootController()),
+            spool_threshold=1024,
+            limits={'upload': 4096}
+        ))
+
+    def test_upload(self):
+        response = self.app.post('/', params={'name': 'Ryan'}, upload_files=[
+            ('upload', 'a.txt', 'x' * 2000)
+        ])
+        assert response.body == 'Ryan a.txt 2000 True'
+        assert not os.path.exists(self.uploads_[0].path)
+
+    def test_query_string(self):
+        response = self.app.post('/?name=Ryan', upload_files=[
+            ('upload', 'a.txt', 'x' * 10)
+        ])
+        assert response.body == 'Ryan a.txt 10 False'
+        assert response.request.pecan['form'].name.data == u'Ryan'
+
+    def test_without_form(self):
+        response = self.app.post('/plain', params={'name': 'Ryan'},
+                                 upload_files=[('upload', 'a.txt', 'abc')])
+        assert response.body == 'Ryan a.txt abc'
+
+    def test_upload_too_large(self):
+        response = self.app.post('/', params={'name': 'Ryan'}, upload_files=[
+            ('upload', 'a.txt', 'x' * 5000)
+        ], expect_errors=True)
+        assert response.status_int == 413
+        assert self.uploads_ == []
+
+    def call(self, environ):
+        from pecan_wtforms.multipart import StreamingFormDataMiddleware
+
+        class BlockingInput(object):
+            def read(self, *args):
+                raise AssertionError('read past CONTENT_LENGTH')
+
+        def app(environ, start_response):  # pragma: nocover
+            raise AssertionError('malformed body accepted')
+
+        statuses = []
+        environ = dict({
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'multipart/form-data; boundary=%s' % BOUNDARY,
+            'wsgi.input': BlockingInput()
+        }, **environ)
+        StreamingFormDataMiddleware(app)(
+            environ, lambda status, headers: statuses.append(status)
+        )
+        return statuses[0]
+
+    def test_missing_content_length(self):
+        assert self.call({}) == '400 Bad Request'
+
+    def test_zero_content_length(self):
+        assert self.call({'CONTENT_LENGTH': '0'}) == '400 Bad Request'
+
+    def test_terminated_input(self):
+        body = encode([('name', 'Ryan')], [('upload', 'a.txt', 'abc')])
+        response = self.app.post('/', body, headers={
+            'Content-Type': 'multipart/form-data; boundary=%s' % BOUNDARY
+        }, extra_environ={'wsgi.input_terminated': True})
+        assert response.body == 'Ryan a.txt 3 False'
+
+    def test_non_multipart_requests(self):
+        response = self.app.post('/', params={'name': 'Ryan', 'upload': 'x'})
+        assert response.body == 'Ryan x'
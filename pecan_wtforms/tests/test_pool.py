@@ -0,0 +1,321 @@
+import os
+from unittest import TestCase
+
+
+class TestFormPool(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'pool'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            color = pecan_wtforms.fields.SelectField("Color", choices=[
+                ('r', 'Red'), ('g', 'Green')
+            ])
+        self.formcls_ = SimpleForm
+
+    def test_reuse(self):
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool()
+        form = pool.acquire(self.formcls_)
+        pool.release(form)
+        assert pool.acquire(self.formcls_) is form
+        assert pool.acquire(self.formcls_) is not form
+
+    def test_keyed_by_prefix(self):
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool()
+        form = pool.acquire(self.formcls_, prefix='a-')
+        assert form.name.name == 'a-name'
+        pool.release(form)
+        assert pool.acquire(self.formcls_) is not form
+        assert pool.acquire(self.formcls_, prefix='a-') is form
+
+    def test_maxsize(self):
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool(maxsize=1)
+        first = pool.acquire(self.formcls_)
+        second = pool.acquire(self.formcls_)
+        pool.release(first)
+        pool.release(second)
+        assert pool.acquire(self.formcls_) is first
+        assert pool.acquire(self.formcls_) is not second
+
+    def test_release_once(self):
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool()
+        form = pool.acquire(self.formcls_)
+        pool.release(form)
+        pool.release(form)
+        assert pool.acquire(self.formcls_) is form
+        assert pool.acquire(self.formcls_) is not form
+
+    def test_unpooled_forms_ignored(self):
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool()
+        form = self.formcls_()
+        pool.release(form)
+        assert pool.acquire(self.formcls_) is not form
+
+    def test_per_thread(self):
+        import threading
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool()
+        form = pool.acquire(self.formcls_)
+        pool.release(form)
+
+        acquired = []
+        thread = threading.Thread(
+            target=lambda: acquired.append(pool.acquire(self.formcls_))
+        )
+        thread.start()
+        thread.join()
+        assert acquired[0] is not form
+        assert pool.acquire(self.formcls_) is form
+
+    def test_custom_init_not_pooled(self):
+        from pecan_wtforms.pool import FormPool
+
+        class CustomForm(self.formcls_):
+            def __init__(self, *args, **kwargs):
+                super(CustomForm, self).__init__(*args, **kwargs)
+                self.custom = True
+
+        pool = FormPool()
+        form = pool.acquire(CustomForm)
+        assert form.custom is True
+        pool.release(form)
+        assert pool.acquire(CustomForm) is not form
+
+    def test_no_state_leaks(self):
+        from webob.multidict import MultiDict
+        from pecan_wtforms.pool import FormPool
+        pool = FormPool()
+
+        form = pool.acquire(self.formcls_, MultiDict({'color': 'x'}),
+                            error_cfg={'auto_insert_errors': True})
+        assert form.validate() is False
+        form.insert_error_markup()
+        form.color.choices = form.color.choices + [('x', 'Other')]
+        form.name.label.text = 'Changed'
+        form._validation_original_data = MultiDict({'name': 'Ryan'})
+        form.extra = True
+        pool.release(form)
+
+        fresh = self.formcls_()
+        reused = pool.acquire(self.formcls_)
+        assert reused is form
+        assert not hasattr(reused, 'extra')
+        assert not hasattr(reused, '_validation_original_data')
+        assert reused.errors == {}
+        assert reused.data == fresh.data
+        assert reused.color.choices == fresh.color.choices
+        assert reused.name.label.text == 'Name'
+        assert reused.name() == fresh.name()
+        assert reused.render() == fresh.render()
+
+
+class TestPooledSecureForm(TestCase):
+
+    def test_csrf_state_reset(self):
+        import pecan_wtforms
+        from webob import Request, Response
+        from pecan_wtforms.pool import FormPool
+
+        class SimpleForm(pecan_wtforms.SecureForm):
+            SECRET_KEY = 'pool'
+            CSRF_SIGNING_KEYS = ['pool-key']
+            name = pecan_wtforms.fields.TextField("Name")
+
+        pool = FormPool()
+        first = Request.blank('/', headers={'Cookie': 'pool=first'})
+        form = pool.acquire(SimpleForm, csrf_context={
+            'request': first, 'response': Response()
+        })
+        assert form._csrf_nonce == 'first'
+        token = form.csrf_token.current_token
+        pool.release(form)
+        assert 'csrf_context' not in form.__dict__
+        assert '_csrf_nonce' not in form.__dict__
+        assert form.csrf_token.current_token is None
+
+        second = Request.blank('/', headers={'Cookie': 'pool=second'})
+        reused = pool.acquire(SimpleForm, csrf_context={
+            'request': second, 'response': Response()
+        })
+        assert reused is form
+        assert reused.csrf_context['request'] is second
+        assert reused._csrf_nonce == 'second'
+        assert reused.csrf_token.current_token != token
+
+
+class TestUnpooledReset(TestCase):
+
+    def test_reset_and_reuse(self):
+        import pecan_wtforms
+        from webob.multidict import MultiDict
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'pool'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.validators.Required()]
+            )
+
+        form = SimpleForm(error_cfg={'auto_insert_errors': True})
+        assert form.validate() is False
+        form.reset()
+        form.process(MultiDict({'name': 'Ryan'}))
+        assert form.validate() is True
+        form.reset()
+        form.process(MultiDict())
+        assert form.validate() is False
+        assert 'error-message' in form.name()
+
+    def test_reset_and_reuse_secure_form(self):
+        import pecan_wtforms
+        from webob import Request, Response
+        from webob.multidict import MultiDict
+
+        class SimpleForm(pecan_wtforms.SecureForm):
+            SECRET_KEY = 'pool'
+            name = pecan_wtforms.fields.TextField("Name")
+
+        request = Request.blank('/', method='POST', headers={
+            'Cookie': 'pool=abc123',
+            'Referer': 'http://localhost/'
+        })
+        form = SimpleForm(csrf_context={
+            'request': request, 'response': Response()
+        })
+        form.reset()
+        form.process(MultiDict({'name': 'Ryan', 'csrf_token': 'abc123'}))
+        assert form.validate() is True
+        assert form.data['name'] == 'Ryan'
+
+
+class TestWithFormPool(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from pecan.middleware.recursive import RecursiveMiddleware
+        from webtest import TestApp
+        from pecan_wtforms.pool import FormPool, FormPoolHook
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'pool'
+            first_name = pecan_wtforms.fields.TextField(
+                "First Name",
+                [pecan_wtforms.validators.Required()]
+            )
+            last_name = pecan_wtforms.fields.TextField(
+                "Last Name",
+                [pecan_wtforms.validators.Required()]
+            )
+        self.formcls_ = SimpleForm
+        self.pool = pool = FormPool()
+        self.seen = seen = []
+
+        class RootController(object):
+
+            @expose('name.html')
+            @pecan_wtforms.with_form(SimpleForm, pool=pool)
+            def index(self, **kw):
+                seen.append(request.pecan['form'])
+                return dict()
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, pool=pool, error_cfg={
+                'auto_insert_errors': True, 'handler': '/'
+            })
+            def save(self, **kw):
+                seen.append(request.pecan['form'])
+                return 'SAVED!'
+
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, pool=pool)
+            def stream(self, **kw):
+                seen.append(request.pecan['form'])
+                return request.pecan['form'].stream()
+
+        template_path = os.path.join(
+                os.path.dirname(__file__),
+                'templates'
+        )
+
+        self.app = TestApp(RecursiveMiddleware(Pecan(
+            RootController(),
+            template_path=template_path,
+            hooks=[FormPoolHook(pool)]
+        )))
+
+    def test_released_after_render(self):
+        self.app.post('/save', params={
+            'first_name': 'Ryan',
+            'last_name': 'Petrello'
+        })
+        response = self.app.get('/')
+        assert self.seen[0] is self.seen[1]
+
+        # Nothing from the first request is rendered in the second
+        assert 'Ryan' not in response.body
+        assert 'Petrello' not in response.body
+
+    def test_released_after_stream(self):
+        response = self.app.get('/stream', params={'first_name': 'Ryan'})
+        assert 'value="Ryan"' in response.body
+
+        # Released once the response was closed
+        form = self.seen[0]
+        assert self.pool.acquire(self.formcls_) is form
+        self.pool.release(form)
+
+        response = self.app.get('/stream')
+        assert self.seen[1] is form
+        assert 'Ryan' not in response.body
+
+    def test_released_to_own_pool(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose
+        from webtest import TestApp
+        from pecan_wtforms.pool import FormPool, FormPoolHook, default_pool
+
+        pool = FormPool()
+        formcls = self.formcls_
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(formcls, pool=pool)
+            def index(self, **kw):
+                return 'OK'
+
+        default_pool.clear()
+        app = TestApp(Pecan(RootController(), hooks=[FormPoolHook()]))
+        response = app.get('/')
+        form = response.request.pecan['form']
+        assert pool.acquire(formcls) is form
+        assert default_pool.acquire(formcls) is not form
+
+    def test_no_state_leaks_from_error_handler(self):
+        response = self.app.post('/save', params={
+            'first_name': 'Ryan',
+        })
+        assert 'Ryan' in response.body
+        assert 'This field is required.' in response.body
+
+        # The form is held by the error handler, then released once
+        form = self.seen[0]
+        assert self.pool.acquire(self.formcls_) is form
+        assert self.pool.acquire(self.formcls_) is not form
+        self.pool.release(form)
+
+        response = self.app.get('/')
+        assert self.seen[1] is form
+        assert 'Ryan' not in response.body
+        assert 'This field is required.' not in response.body
+        assert form.errors == {}
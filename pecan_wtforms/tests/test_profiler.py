@@ -0,0 +1,186 @@
+from unittest import TestCase
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+
+        def strip(value):
+            return value.strip() if value else value
+
+        class SimpleForm(pecan_wtforms.Form):
+            SECRET_KEY = 'profiler'
+            name = pecan_wtforms.fields.TextField(
+                "Name",
+                [pecan_wtforms.validators.Required()],
+                filters=[strip]
+            )
+            email = pecan_wtforms.fields.TextField(
+                "Email",
+                [pecan_wtforms.validators.Length(max=5)]
+            )
+
+            def validate_email(self, field):
+                pass
+
+        self.formcls_ = SimpleForm
+
+    def tearDown(self):
+        from pecan_wtforms import profiler
+        profiler.disable()
+
+    def test_disabled_by_default(self):
+        from pecan_wtforms import profiler
+        assert profiler.get_profiler() is None
+        assert profiler.current() is None
+
+    def test_samples(self):
+        from webob.multidict import MultiDict
+        from pecan_wtforms import profiler
+        sampler = profiler.enable(sample_rate=1)
+        form = self.formcls_(MultiDict({'name': ' Ryan ', 'email': 'x'}))
+        assert form.name.data == 'Ryan'
+        assert form.validate() is True
+
+        samples = set(
+            (s.kind, s.form, s.field, s.name) for s in sampler.snapshot()
+        )
+        assert samples == set([
+            ('filter', 'SimpleForm', 'name', 'strip'),
+            ('validator', 'SimpleForm', 'name', 'Required'),
+            ('validator', 'SimpleForm', 'email', 'Length'),
+            ('validator', 'SimpleForm', 'email', 'validate_email'),
+            ('validator', 'SimpleForm', 'csrf_token', 'validate_csrf_token')
+        ])
+        for sample in sampler.snapshot():
+            assert sample.seconds >= 0
+
+        # The fields' own filters and validators are restored
+        assert not isinstance(form.name.filters[0], profiler._Timed)
+        assert not isinstance(form.name.validators[0], profiler._Timed)
+
+    def test_bulk_validation(self):
+        from pecan_wtforms import profiler
+        sampler = profiler.enable(sample_rate=1)
+        assert self.formcls_.validate_many([
+            {'name': 'Ryan', 'email': 'x'},
+            {'email': 'too long'}
+        ]) == [None, {
+            'name': ['This field is required.'],
+            'email': ['Field cannot be longer than 5 characters.']
+        }]
+        samples = [
+            (s.kind, s.field, s.name) for s in sampler.snapshot()
+        ]
+        assert samples.count(('validator', 'email', 'Length')) == 2
+        assert samples.count(('validator', 'email', 'validate_email')) == 2
+        assert ('validator', 'name', 'Required') in samples
+        assert ('filter', 'name', 'strip') in samples
+
+    def test_errors_are_unaffected(self):
+        from webob.multidict import MultiDict
+        from pecan_wtforms import profiler
+        profiler.enable(sample_rate=1)
+        form = self.formcls_(MultiDict({'email': 'too long'}))
+        assert form.validate(parallel=True) is False
+        assert sorted(form.errors) == ['email', 'name']
+
+    def test_sample_rate(self):
+        from pecan_wtforms import profiler
+        sampler = profiler.enable(sample_rate=0)
+        self.formcls_().validate()
+        assert sampler.snapshot() == []
+
+    def test_ring_buffer(self):
+        from pecan_wtforms import profiler
+        sampler = profiler.enable(sample_rate=1, size=3)
+        for _ in range(5):
+            self.formcls_().validate()
+        assert len(sampler.snapshot()) == 3
+
+    def test_sampled_per_request(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+        from pecan_wtforms import profiler
+
+        formcls = self.formcls_
+
+        class RootController(object):
+
+            @expose()
+            @pecan_wtforms.with_form(formcls)
+            def index(self, **kw):
+                request.pecan['form'].validate()
+                return 'OK'
+
+        sampler = profiler.enable(sample_rate=1)
+        app = TestApp(Pecan(RootController()))
+        response = app.get('/?name=Ryan')
+        assert response.request.environ[profiler.ENVIRON_KEY] is True
+        assert sampler.snapshot()
+
+        sampler.sample_rate = 0
+        sampler.clear()
+        response = app.get('/?name=Ryan')
+        assert response.request.environ[profiler.ENVIRON_KEY] is False
+        assert sampler.snapshot() == []
+
+
+class TestReport(TestCase):
+
+    def samples(self):
+        return [
+            ['validator', 'SignupForm', 'email', 'unique_email', 0.250],
+            ['validator', 'SignupForm', 'email', 'unique_email', 0.050],
+            ['validator', 'SignupForm', 'name', 'Required', 0.001],
+            ['filter', 'SignupForm', 'name', 'strip', 0.002]
+        ]
+
+    def test_report(self):
+        from pecan_wtforms.profiler import report
+        rows = report(self.samples())
+        assert [row['name'] for row in rows] == [
+            'unique_email', 'strip', 'Required'
+        ]
+        assert rows[0]['count'] == 2
+        assert rows[0]['p99'] == 250.0
+        assert rows[0]['mean'] == 150.0
+
+        rows = report(self.samples(), top=1, kind='filter')
+        assert [row['name'] for row in rows] == ['strip']
+
+    def test_save_without_path(self):
+        from pecan_wtforms.profiler import Profiler
+        self.assertRaises(ValueError, Profiler().save)
+
+    def test_main(self):
+        import json
+        import os
+        import sys
+        import tempfile
+        from StringIO import StringIO
+        from pecan_wtforms.profiler import Profiler, main
+
+        sampler = Profiler()
+        for sample in self.samples():
+            sampler.add(*sample)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        stdout = sys.stdout
+        try:
+            sampler.save(path)
+            sys.stdout = StringIO()
+            main([path, '--json', '--top', '2'])
+            output = sys.stdout.getvalue()
+            sys.stdout = StringIO()
+            main([path])
+            table = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+            os.remove(path)
+
+        rows = json.loads(output)
+        assert [row['name'] for row in rows] == ['unique_email', 'strip']
+        assert 'unique_email' in table.splitlines()[2]
@@ -0,0 +1,208 @@
+from io import BytesIO
+from unittest import TestCase
+
+
+class TestStreamParsing(TestCase):
+
+    def test_iter_lines(self):
+        from pecan_wtforms.stream import iter_lines
+        fp = BytesIO(b'one\ntwo\n\nthree')
+        assert list(iter_lines(fp, chunk_size=2)) == [
+            b'one\n', b'two\n', b'\n', b'three'
+        ]
+
+    def test_record_too_large(self):
+        from pecan_wtforms.stream import iter_lines, RecordTooLarge
+        lines = iter_lines(BytesIO(b'ok\n' + b'x' * 100 + b'\nok\n'),
+                           max_size=10, chunk_size=4)
+        assert next(lines) == b'ok\n'
+        self.assertRaises(RecordTooLarge, next, lines)
+
+    def test_iter_ndjson(self):
+        from pecan_wtforms.stream import iter_ndjson, MALFORMED
+        assert list(iter_ndjson([
+            b'{"a": 1}\n', b'\n', b'{"a": \n', b'[1, 2]\n', b'{"b": "c"}'
+        ])) == [{'a': 1}, MALFORMED, MALFORMED, {'b': 'c'}]
+
+    def test_iter_csv(self):
+        from pecan_wtforms.stream import iter_csv, MALFORMED
+        assert list(iter_csv([
+            b'sku,name\n',
+            b'A1,"Multi\n', b'line"\n',
+            b'B2\n',
+            b'\n',
+            b'C3,caf\xc3\xa9\n',
+            b'D4,x,extra\n'
+        ])) == [
+            {u'sku': u'A1', u'name': u'Multi\nline'},
+            {u'sku': u'B2'},
+            {u'sku': u'C3', u'name': u'caf\xe9'},
+            MALFORMED
+        ]
+        assert list(iter_csv([])) == []
+
+    def test_csv_nul_byte(self):
+        from pecan_wtforms.stream import iter_csv, MALFORMED
+        assert list(iter_csv([
+            b'sku,name\n', b'A1,x\x00y\n', b'B2,ok\n'
+        ])) == [MALFORMED, {u'sku': u'B2', u'name': u'ok'}]
+
+    def test_csv_unterminated_quote(self):
+        from pecan_wtforms.stream import iter_csv, MALFORMED
+        assert list(iter_csv([
+            b'sku,name\n', b'A1,ok\n', b'B2,"unterminated\n'
+        ])) == [{u'sku': u'A1', u'name': u'ok'}, MALFORMED]
+
+    def test_csv_multi_line_record_too_large(self):
+        from pecan_wtforms.stream import iter_csv, RecordTooLarge
+        lines = [b'sku,name\n', b'A1,"ok\n', b'record"\n', b'B2,"'] + \
+            [b'xxxx\n'] * 100
+        records = iter_csv(lines, max_size=20)
+        assert next(records) == {u'sku': u'A1', u'name': u'ok\nrecord'}
+        self.assertRaises(RecordTooLarge, next, records)
+
+
+class TestWithFormStream(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+        from pecan_wtforms.stream import stream_results
+
+        class ProductForm(pecan_wtforms.Form):
+            SECRET_KEY = 'stream'
+            sku = pecan_wtforms.fields.TextField(
+                "SKU",
+                [pecan_wtforms.validators.Required()]
+            )
+            quantity = pecan_wtforms.fields.IntegerField(
+                "Quantity",
+                [pecan_wtforms.validators.NumberRange(1, 100)]
+            )
+
+        class SecureProductForm(ProductForm, pecan_wtforms.SecureForm):
+            pass
+
+        class TenantForm(ProductForm):
+
+            def validate_sku(self, field):
+                # Validated while the response is sent
+                prefix = request.headers['X-Tenant']
+                if not field.data.startswith(prefix):
+                    raise pecan_wtforms.ValidationError('Wrong tenant.')
+
+        class RootController(object):
+            @expose('json')
+            @pecan_wtforms.with_form_stream(ProductForm)
+            def index(self, records):
+                assert request.pecan['records'] is records
+                return {'results': [
+                    [data, errors] for data, errors in records
+                ]}
+
+            @expose()
+            @pecan_wtforms.with_form_stream(ProductForm, format='csv')
+            def stream(self, records):
+                return stream_results(records)
+
+            @expose()
+            @pecan_wtforms.with_form_stream(TenantForm, format='csv')
+            def tenant(self, records):
+                return stream_results(records)
+
+            @expose()
+            @pecan_wtforms.with_form_stream(SecureProductForm)
+            def secure(self, records):
+                return str(len(list(records)))
+
+        self.app = TestApp(Pecan(RootController()))
+
+    def test_ndjson(self):
+        response = self.app.post('/', b'\n'.join([
+            b'{"sku": "A1", "quantity": 5}',
+            b'{"sku": "", "quantity": 500}',
+            b'not json'
+        ]), headers={'Content-Type': 'application/x-ndjson'})
+        assert response.json == {'results': [
+            [{'sku': 'A1', 'quantity': 5}, None],
+            [{'sku': '', 'quantity': 500}, {
+                'sku': ['This field is required.'],
+                'quantity': ['Number must be between 1 and 100.']
+            }],
+            [None, {'': ['Malformed record.']}]
+        ]}
+
+    def test_csv(self):
+        response = self.app.post('/', b'sku,quantity\nA1,5\nB2,0\n',
+                                 headers={'Content-Type': 'text/csv'})
+        assert [errors for _, errors in response.json['results']] == [
+            None,
+            {'quantity': ['Number must be between 1 and 100.']}
+        ]
+
+    def test_malformed_csv(self):
+        response = self.app.post('/', b'sku,quantity\nA1,5\x00\nB2,5\n',
+                                 headers={'Content-Type': 'text/csv'})
+        assert [errors for _, errors in response.json['results']] == [
+            {'': ['Malformed record.']},
+            None
+        ]
+
+    def test_stream_results(self):
+        import json
+        response = self.app.post('/stream', b'sku,quantity\nA1,5\n,5\n',
+                                 headers={'Content-Type': 'text/plain'})
+        assert response.content_type == 'application/x-ndjson'
+        assert [json.loads(l) for l in response.body.splitlines()] == [
+            {'record': 1, 'errors': None},
+            {'record': 2, 'errors': {'sku': ['This field is required.']}}
+        ]
+
+    def test_stream_results_request_state(self):
+        import json
+        from pecan.core import state
+        response = self.app.post('/tenant', b'sku,quantity\nA1,5\nB2,5\n',
+                                 headers={'Content-Type': 'text/plain',
+                                          'X-Tenant': 'A'})
+        assert [json.loads(l) for l in response.body.splitlines()] == [
+            {'record': 1, 'errors': None},
+            {'record': 2, 'errors': {'sku': ['Wrong tenant.']}}
+        ]
+        assert not hasattr(state, 'request')
+
+    def test_unsupported_content_type(self):
+        response = self.app.post('/', b'sku=A1', expect_errors=True)
+        assert response.status_int == 415
+
+    def test_csrf(self):
+        from webtest import TestApp
+        app = self.app.app
+
+        def strip_paste_var(environ, start_response):
+            environ.pop('paste.testing')
+            return app(environ, start_response)
+
+        self.app = TestApp(strip_paste_var)
+        body = b'{"sku": "A1", "quantity": 5}\n'
+        headers = {
+            'Content-Type': 'application/x-ndjson',
+            'Referer': 'http://localhost:80/'
+        }
+
+        response = self.app.post('/secure', body, headers=headers,
+                                 expect_errors=True)
+        assert response.status_int == 403
+        assert 'stream' not in self.app.cookies
+
+        self.app.cookies['stream'] = 'abc123'
+        response = self.app.post('/secure', body, headers=dict(
+            headers, **{'X-CSRF-Token': 'wrong'}
+        ), expect_errors=True)
+        assert response.status_int == 403
+
+        response = self.app.post('/secure', body, headers=dict(
+            headers, **{'X-CSRF-Token': 'abc123'}
+        ))
+        assert response.body == '1'
+        assert 'Set-Cookie' not in response.headers
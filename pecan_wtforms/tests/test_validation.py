@@ -0,0 +1,360 @@
+import threading
+import time
+from unittest import TestCase
+
+
+def slow(seconds, message=None):
+    import pecan_wtforms
+
+    def validator(form, field):
+        time.sleep(seconds)
+        if message:
+            raise pecan_wtforms.ValidationError(message)
+    return validator
+
+
+class Overlap(object):
+    """
+    Makes validators which only return once ``n`` of them are running at
+    the same time (failing after ``timeout`` seconds otherwise), recording
+    the thread each ran on.
+    """
+
+    def __init__(self, n, timeout=5):
+        self.n = n
+        self.timeout = timeout
+        self.threads = []
+        self._lock = threading.Lock()
+        self._everyone = threading.Event()
+
+    def validator(self, message=None):
+        import pecan_wtforms
+
+        def validator(form, field):
+            with self._lock:
+                self.threads.append(threading.current_thread())
+                if len(self.threads) == self.n:
+                    self._everyone.set()
+            if not self._everyone.wait(self.timeout):
+                raise pecan_wtforms.ValidationError('Ran alone.')
+            if message:
+                raise pecan_wtforms.ValidationError(message)
+        return validator
+
+
+class TestDeferredValidation(TestCase):
+
+    def make_form(self, validator=None, timeout=None):
+        import pecan_wtforms
+        if validator is None:
+            def validator(message=None):
+                return slow(0, message)
+
+        class RemoteForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'deferred'
+            VALIDATION_TIMEOUT = timeout
+            username = pecan_wtforms.fields.TextField("Username", [
+                pecan_wtforms.validators.Required(),
+                pecan_wtforms.deferred(validator('Taken.'))
+            ])
+            email = pecan_wtforms.fields.TextField("Email", [
+                pecan_wtforms.deferred(validator('Unknown.'))
+            ])
+            zip_code = pecan_wtforms.fields.TextField("Zip", [
+                pecan_wtforms.deferred(validator())
+            ])
+            city = pecan_wtforms.fields.TextField("City", [
+                pecan_wtforms.deferred(validator())
+            ])
+        return RemoteForm
+
+    def test_validators_run_concurrently(self):
+        overlap = Overlap(4)
+        RemoteForm = self.make_form(overlap.validator)
+        f = RemoteForm(username='ryan', email='ryan@example.com')
+
+        assert f.validate() is False
+        assert len(set(overlap.threads)) == 4
+        assert threading.current_thread() not in overlap.threads
+        assert f.errors == {
+            'username': ['Taken.'],
+            'email': ['Unknown.']
+        }
+
+    def test_sync_validators_short_circuit(self):
+        RemoteForm = self.make_form()
+        f = RemoteForm(email='ryan@example.com')
+        assert f.validate() is False
+        assert f.errors['username'] == ['This field is required.']
+
+    def test_successful_validation(self):
+        import pecan_wtforms
+
+        class RemoteForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'deferred'
+            username = pecan_wtforms.fields.TextField("Username", [
+                pecan_wtforms.deferred(slow(0.01))
+            ])
+
+        f = RemoteForm(username='ryan')
+        assert f.validate() is True
+        assert f.errors == {}
+
+    def test_timeout(self):
+        release = threading.Event()
+        finished = []
+
+        def blocked(message=None):
+            def validator(form, field):
+                release.wait(5)
+                finished.append(field.name)
+            return validator
+
+        RemoteForm = self.make_form(blocked, timeout=0.1)
+        f = RemoteForm(username='ryan')
+        try:
+            assert f.validate() is False
+            assert finished == []
+        finally:
+            release.set()
+        assert f.errors == {
+            'username': ['Validation timed out.'],
+            'email': ['Validation timed out.'],
+            'zip_code': ['Validation timed out.'],
+            'city': ['Validation timed out.']
+        }
+
+    def test_stop_validation(self):
+        import pecan_wtforms
+
+        def stop(form, field):
+            raise pecan_wtforms.validators.StopValidation('Stopped.')
+
+        class RemoteForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'deferred'
+            username = pecan_wtforms.fields.TextField("Username", [
+                pecan_wtforms.deferred(stop)
+            ])
+
+        f = RemoteForm(username='ryan')
+        assert f.validate() is False
+        assert f.errors == {'username': ['Stopped.']}
+
+    def test_field_flags(self):
+        import pecan_wtforms
+        validator = pecan_wtforms.deferred(
+            pecan_wtforms.validators.Required()
+        )
+        assert validator.field_flags == ('required',)
+
+    def test_plain_wtforms_form(self):
+        import wtforms
+        import pecan_wtforms
+
+        class PlainForm(wtforms.Form):
+            username = pecan_wtforms.fields.TextField("Username", [
+                pecan_wtforms.deferred(slow(0, 'Taken.'))
+            ])
+
+        f = PlainForm(username='ryan')
+        assert f.validate() is False
+        assert f.errors == {'username': ['Taken.']}
+
+
+class TestDeferredValidationWithRequest(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+
+        def same_path(form, field):
+            if field.data != request.path:
+                raise pecan_wtforms.ValidationError('Wrong path.')
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'deferred'
+            path = pecan_wtforms.fields.TextField("Path", [
+                pecan_wtforms.deferred(same_path)
+            ])
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm)
+            def index(self, **kw):
+                return repr(request.pecan['form'].errors)
+
+        self.app = TestApp(Pecan(RootController()))
+
+    def test_request_is_available(self):
+        response = self.app.post('/', params={'path': '/'})
+        assert response.body == '{}'
+
+        response = self.app.post('/', params={'path': '/other'})
+        assert response.body == "{'path': ['Wrong path.']}"
+
+
+class TestParallelValidation(TestCase):
+
+    def make_form(self, calls, overlap=None):
+        import pecan_wtforms
+
+        def lookup(form, field):
+            calls.append(field.name)
+            if overlap is not None:
+                overlap.validator()(form, field)
+            if field.data == 'bad':
+                raise pecan_wtforms.ValidationError('Bad %s.' % field.name)
+
+        class LookupForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'parallel'
+            PARALLEL_VALIDATION = True
+            a = pecan_wtforms.fields.TextField("A", [lookup])
+            b = pecan_wtforms.fields.TextField("B", [lookup])
+            c = pecan_wtforms.fields.TextField("C", [lookup])
+            d = pecan_wtforms.fields.TextField("D", [
+                pecan_wtforms.validators.Required(), lookup
+            ])
+        return LookupForm
+
+    def test_fields_validated_in_parallel(self):
+        calls = []
+        overlap = Overlap(4)
+        LookupForm = self.make_form(calls, overlap)
+        f = LookupForm(a='bad', b='ok', c='bad', d='ok')
+
+        assert f.validate() is False
+        assert len(set(overlap.threads)) == 4
+        assert sorted(calls) == ['a', 'b', 'c', 'd']
+        assert f.errors == {'a': ['Bad a.'], 'c': ['Bad c.']}
+
+    def test_matches_sequential_validation(self):
+        LookupForm = self.make_form([])
+        parallel = LookupForm(a='bad', b='ok', c='bad')
+        sequential = LookupForm(a='bad', b='ok', c='bad')
+        assert parallel.validate() is sequential.validate(parallel=False)
+        assert parallel.errors == sequential.errors
+        assert parallel.errors['d'] == ['This field is required.']
+
+    def test_csrf_failure_short_circuits(self):
+        from webob.exc import HTTPForbidden
+        import pecan_wtforms
+        calls = []
+
+        class CSRFForm(self.make_form(calls)):
+            def validate_csrf_token(self, field):
+                raise pecan_wtforms.ValidationError('Nope.')
+
+        f = CSRFForm(a='ok', b='ok', c='ok', d='ok')
+        self.assertRaises(HTTPForbidden, f.validate)
+        assert calls == []
+
+
+class TestNestedValidation(TestCase):
+
+    def setUp(self):
+        from pecan_wtforms import validation
+        self.pool_size = validation.POOL_SIZE
+
+    def tearDown(self):
+        from pecan_wtforms import validation
+        validation.set_pool_size(self.pool_size)
+
+    def test_nested_work_runs_inline_on_pool_threads(self):
+        import threading
+        import pecan_wtforms
+        from pecan_wtforms import validation
+
+        class AddressForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'nested'
+            city = pecan_wtforms.fields.TextField("City", [
+                pecan_wtforms.deferred(slow(0.05, 'Unknown city.'))
+            ])
+
+        class ParentForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'nested'
+            PARALLEL_VALIDATION = True
+            name = pecan_wtforms.fields.TextField("Name", [
+                pecan_wtforms.deferred(slow(0.05))
+            ])
+            address = pecan_wtforms.fields.FormField(AddressForm)
+
+        # With a single pool thread, waiting on the pool from that thread
+        # would never finish.
+        validation.set_pool_size(1)
+        form = ParentForm()
+        results = []
+        worker = threading.Thread(
+            target=lambda: results.append(form.validate())
+        )
+        worker.daemon = True
+        worker.start()
+        worker.join(5)
+        assert results == [False]
+        assert form.errors == {'address': {'city': ['Unknown city.']}}
+
+
+class TestValidationPool(TestCase):
+
+    def test_recreated_after_fork(self):
+        import os
+        import signal
+        from pecan_wtforms import validation
+        if not hasattr(os, 'fork'):  # pragma: nocover
+            return
+
+        pool = validation.get_pool()
+        assert validation.map_concurrently(abs, [-1]) == [1]
+
+        pid = os.fork()
+        if pid == 0:  # pragma: nocover
+            status = 1
+            try:
+                # An inherited pool would never run the work
+                signal.alarm(5)
+                if validation.get_pool() is not pool and \
+                        validation.map_concurrently(abs, [-1, -2]) == [1, 2]:
+                    status = 0
+            finally:
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        assert status == 0
+        assert validation.get_pool() is pool
+
+
+class TestParallelValidationDecorator(TestCase):
+
+    def setUp(self):
+        import pecan_wtforms
+        from pecan import Pecan, expose, request
+        from webtest import TestApp
+
+        def same_path(form, field):
+            if field.data != request.path:
+                raise pecan_wtforms.ValidationError('Wrong path.')
+
+        class SimpleForm(pecan_wtforms.form.Form):
+            SECRET_KEY = 'parallel'
+            path = pecan_wtforms.fields.TextField("Path", [same_path])
+            name = pecan_wtforms.fields.TextField("Name", [
+                pecan_wtforms.validators.Required()
+            ])
+
+        class RootController(object):
+            @expose()
+            @pecan_wtforms.with_form(SimpleForm, parallel_validation=True)
+            def index(self, **kw):
+                return repr(sorted(request.pecan['form'].errors.items()))
+
+        self.app = TestApp(Pecan(RootController()))
+
+    def test_parallel_validation(self):
+        response = self.app.post('/', params={'path': '/', 'name': 'Ryan'})
+        assert response.body == '[]'
+
+        response = self.app.post('/', params={'path': '/other'})
+        assert response.body == repr([
+            ('name', [u'This field is required.']),
+            ('path', ['Wrong path.'])
+        ])
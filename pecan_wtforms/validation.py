@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from pecan.core import state
+from wtforms.validators import StopValidation
+
+__all__ = ['deferred', 'get_pool', 'set_pool_size']
+
+REASON_TIMEOUT = "Validation timed out."
+
+#: The number of worker threads in the shared validation pool
+POOL_SIZE = 8
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Set on the shared pool's threads
+_worker = threading.local()
+
+# Pecan's thread-local request state, made available to validators while
+# they run on a pool thread.
+STATE_ATTRIBUTES = ('app', 'request', 'response', 'hooks', 'controller')
+
+
+def get_pool():
+    """
+    Return the thread pool shared by all forms for running validators,
+    creating it on first use.
+
+    The pool is re-created after a ``fork()``: a pool inherited from a
+    pre-fork master process has no threads, so its work would never run.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ThreadPool(POOL_SIZE)
+                _pool_pid = pid
+    return _pool
+
+
+def set_pool_size(size):
+    """
+    Change the number of threads in the shared validation pool.  Validators
+    already running on the current pool are allowed to finish.
+    """
+    global _pool, POOL_SIZE
+    with _pool_lock:
+        POOL_SIZE = size
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def capture_state():
+    """
+    Return a snapshot of the current thread's Pecan request state, for
+    :func:`call_with_state`.
+    """
+    return tuple(
+        (name, getattr(state, name)) for name in STATE_ATTRIBUTES
+        if hasattr(state, name)
+    )
+
+
+def call_with_state(snapshot, fn, args):
+    """
+    Call ``fn(*args)`` with the Pecan request state in ``snapshot`` (see
+    :func:`capture_state`), restoring the thread's own state afterwards.
+    """
+    previous = capture_state()
+    for name, value in snapshot:
+        setattr(state, name, value)
+    try:
+        return fn(*args)
+    finally:
+        for name, _ in snapshot:
+            if hasattr(state, name):
+                delattr(state, name)
+        for name, value in previous:
+            setattr(state, name, value)
+
+
+def iter_with_state(snapshot, iterable):
+    """
+    Iterate over ``iterable``, advancing it with the Pecan request state in
+    ``snapshot`` (see :func:`call_with_state`); e.g. for a response body
+    that's generated after Pecan has finished handling the request.
+    """
+    iterator = iter(iterable)
+    while True:
+        try:
+            item = call_with_state(snapshot, next, (iterator,))
+        except StopIteration:
+            return
+        yield item
+
+
+def _run_on_pool(snapshot, fn, args):
+    _worker.active = True
+    return call_with_state(snapshot, fn, args)
+
+
+class CompletedResult(object):
+    """
+    The result of a call made immediately, with the interface of a
+    ``multiprocessing.pool.AsyncResult``.
+    """
+
+    def __init__(self, fn, args):
+        self._value = self._error = None
+        try:
+            self._value = fn(*args)
+        except Exception as e:
+            self._error = e
+
+    def ready(self):
+        return True
+
+    def successful(self):
+        return self._error is None
+
+    def wait(self, timeout=None):
+        pass
+
+    def get(self, timeout=None):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def submit(fn, *args):
+    """
+    Run ``fn(*args)`` on the shared pool with the caller's Pecan request
+    state, returning a ``multiprocessing.pool.AsyncResult``.
+
+    When called from one of the pool's own threads (e.g., validating a
+    ``FormField``'s form, or a deferred validator, during parallel
+    validation), ``fn`` is called immediately instead: a pool thread which
+    waits on the (bounded) pool can deadlock once every thread is busy.
+    """
+    if getattr(_worker, 'active', False):
+        return CompletedResult(fn, args)
+    return get_pool().apply_async(
+        _run_on_pool, (capture_state(), fn, args)
+    )
+
+
+def map_concurrently(fn, items):
+    """
+    Call ``fn(item)`` for every item on the shared pool, returning the results
+    in order.  The first exception raised (in item order) is re-raised.
+    """
+    results = [submit(fn, item) for item in items]
+    return [result.get() for result in results]
+
+
+class deferred(object):
+    """
+    Wraps a (blocking) validator so that, when used with
+    ``pecan_wtforms.Form``, it runs on a shared thread pool instead of
+    blocking the request.  All of a form's deferred validators run
+    concurrently, and ``Form.validate`` waits for them together (for at most
+    ``Form.VALIDATION_TIMEOUT`` seconds), so a form with several remote checks
+    takes about as long as the slowest one, e.g.::
+
+        def username_available(form, field):
+            if remote_lookup(field.data):
+                raise ValidationError('That username is taken.')
+
+        class SignupForm(pecan_wtforms.SecureForm):
+            username = TextField('Username', [
+                Required(), deferred(username_available)
+            ])
+
+    Synchronous validators earlier in a field's chain still run first (so a
+    failing ``Required`` prevents the remote check), but a deferred validator
+    can't stop validators which follow it.  Validators run on pool threads,
+    but have access to the Pecan request that's being validated.
+    """
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.field_flags = getattr(validator, 'field_flags', ())
+
+    def __call__(self, form, field):
+        pending = getattr(form, '_pending_validation', None)
+        if pending is None:
+            # Not validating through ``pecan_wtforms.Form``
+            return self.validator(form, field)
+        pending.append((field, submit(self.validator, form, field)))
+
+
+def wait(pending, timeout=None):
+    """
+    Wait for ``pending`` deferred validation results (a sequence of
+    ``(field, result)``), recording any errors on their fields.
+
+    :param timeout: the total number of seconds to wait for all results.
+                    Validators which don't finish in time fail with a
+                    "Validation timed out." error.  They can't be
+                    interrupted, though, so each keeps its pool thread busy
+                    until it returns; validators that may hang should time
+                    out themselves (e.g., with a socket timeout), or the
+                    pool will run out of threads.
+
+    Returns True if every deferred validator passed.
+    """
+    success = True
+    deadline = None if timeout is None else time.time() + timeout
+    for field, result in pending:
+        remaining = None
+        if deadline is not None:
+            remaining = max(deadline - time.time(), 0)
+        try:
+            result.get(remaining)
+        except TimeoutError:
+            field.errors.append(field.gettext(REASON_TIMEOUT))
+        except StopValidation as e:
+            if not (e.args and e.args[0]):
+                continue
+            field.errors.append(e.args[0])
+        except ValueError as e:
+            field.errors.append(e.args[0])
+        else:
+            continue
+        success = False
+    return success
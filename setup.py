@@ -35,5 +35,8 @@ setup(
     entry_points="""
     [pecan.extension]
     wtforms = pecan_wtforms
+
+    [console_scripts]
+    pecan-wtforms-profile = pecan_wtforms.profiler:main
     """
 )